@@ -1,20 +1,107 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
+import copy
+import hashlib
 import os
 import random
-import requests
+from backend.blockchain.block import Block
 from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.block_template import BlockTemplate
+from backend.blockchain.mining_service import MiningService
+from backend.blockchain.chain_sync import ChainSync
+from backend.blockchain.serialized_block_cache import SerializedBlockCache
+from backend.blockchain.state_engine import StateEngine
 from backend.wallet.wallet import Wallet
 from backend.wallet.transaction import Transaction
 from backend.wallet.transaction_pool import TransactionPool
 from backend.pubsub import PubSub
+from backend.transport.tcp_transport import TcpTransport, parse_peers
+from backend.config import (
+    KNOWN_ADDRESSES_LIMIT,
+    SYNC_BODIES_BATCH,
+    SYNC_HEADERS_BATCH
+)
+from backend.util.asgi import run_asgi
+from backend.util.binary_encoding import BINARY_MIMETYPE, encode_blocks_header
 
 app = Flask(__name__)
 CORS(app, resources={ r"/*": {"origins": "http://localhost:3000"} })
-blockchain = Blockchain()
+# Keep the chain on disk across restarts when BLOCK_STORE_DIR is set
+if os.environ.get("BLOCK_STORE_DIR"):
+    blockchain = Blockchain(BlockStore(os.environ.get("BLOCK_STORE_DIR")))
+else:
+    blockchain = Blockchain()
 wallet = Wallet(blockchain) # So balance always available
 transaction_pool = TransactionPool()
-pubsub = PubSub(blockchain, transaction_pool)
+# Drop mined transactions from the pool, pool them again on a reorg
+blockchain.add_listener(transaction_pool.apply_blocks)
+block_template = BlockTemplate(blockchain, transaction_pool)
+# The chain and the pool are changed on the state engine writer thread
+# only, request threads read its snapshots
+state_engine = StateEngine(blockchain, transaction_pool)
+# TRANSPORT=tcp: listen on P2P_PORT and connect directly to the nodes in
+# P2P_PEERS (host:port,host:port), PubNub otherwise
+transport = None
+if os.environ.get("TRANSPORT") == "tcp":
+    transport = TcpTransport(
+        "0.0.0.0",
+        int(os.environ.get("P2P_PORT", 7000)),
+        parse_peers(os.environ.get("P2P_PEERS", ""))
+    )
+pubsub = PubSub(blockchain, transaction_pool, transport, state_engine)
+mining_service = MiningService(
+    blockchain,
+    block_template,
+    wallet,
+    on_block=pubsub.broadcast_block,
+    state_engine=state_engine
+)
+serialized_blocks = SerializedBlockCache()
+
+def blocks_response(snapshot, heights):
+    """
+    Respond with the snapshot blocks at heights as json, or in the compact
+    binary format when the client prefers it (Accept:
+    application/x-blockchain).
+    The response is streamed from the serialized block cache. Its ETag
+    changes with the chain tip, so unchanged chains get a 304.
+    """
+    best_match = request.accept_mimetypes.best_match(
+        ["application/json", BINARY_MIMETYPE]
+    )
+    binary = best_match == BINARY_MIMETYPE
+    chain = snapshot.chain
+
+    etag = hashlib.sha256(
+        f"{snapshot.tip.hash}|{snapshot.length}|{request.full_path}|{binary}".encode("utf-8")
+    ).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def generate_binary():
+        yield encode_blocks_header(len(heights))
+        for height in heights:
+            yield serialized_blocks.binary_bytes(chain[height])
+
+    def generate_json():
+        yield b"["
+        for i, height in enumerate(heights):
+            if i:
+                yield b","
+            yield serialized_blocks.json_bytes(chain[height])
+        yield b"]"
+
+    if binary:
+        response = Response(generate_binary(), mimetype=BINARY_MIMETYPE)
+    else:
+        response = Response(generate_json(), mimetype="application/json")
+    response.set_etag(etag)
+
+    return response
+
 
 @app.route("/")
 def route_default():
@@ -24,8 +111,9 @@ def route_default():
 
 @app.route("/blockchain")
 def route_blockchain():
+    snapshot = state_engine.snapshot()
 
-    return jsonify(blockchain.to_json())
+    return blocks_response(snapshot, range(snapshot.length))
 
 
 @app.route("/blockchain/range")
@@ -33,60 +121,130 @@ def route_blockchain_range():
     # Ex http://localhost:5000/blockchain/range?start=1&end=5
     start = int(request.args.get("start"))
     end = int(request.args.get("end"))
+    snapshot = state_engine.snapshot()
+
+    # Newest block first, heights are sliced without building the chain
+    return blocks_response(snapshot, range(snapshot.length)[::-1][start:end])
+
+
+@app.route("/blockchain/headers")
+def route_blockchain_headers():
+    # Ex http://localhost:5000/blockchain/headers?start=0&count=2000
+    start = max(int(request.args.get("start", 0)), 0)
+    count = min(int(request.args.get("count", SYNC_HEADERS_BATCH)), SYNC_HEADERS_BATCH)
+    snapshot = state_engine.snapshot()
+    end = min(start + count, snapshot.length)
+
+    return jsonify([
+        snapshot.chain[height].header_json() for height in range(start, end)
+    ])
+
+
+@app.route("/blockchain/blocks")
+def route_blockchain_blocks():
+    # Blocks by height, oldest first
+    # Ex http://localhost:5000/blockchain/blocks?start=0&end=100
+    start = max(int(request.args.get("start", 0)), 0)
+    snapshot = state_engine.snapshot()
+    end = min(
+        int(request.args.get("end", start + SYNC_BODIES_BATCH)),
+        start + SYNC_BODIES_BATCH,
+        snapshot.length
+    )
 
-    return jsonify(blockchain.to_json()[::-1][start:end])
+    return blocks_response(snapshot, range(start, end))
 
 
 @app.route("/blockchain/length")
 def route_blockchain_length():
 
-    return jsonify(len(blockchain.chain))
+    return jsonify(state_engine.snapshot().length)
 
 
 @app.route("/blockchain/mine")
 def route_blockchain_mine():
-    # Get transaction data from pool
-    transaction_data = transaction_pool.transaction_data()
-    # Append mining reward
-    transaction_data.append(Transaction.reward_transaction(wallet).to_json())
-    # Mine block
-    blockchain.add_block(transaction_data)
-
-    block = blockchain.chain[-1]
+    def block_template_data():
+        # Get transaction data from the block template, valid pool
+        # transactions up to the block size limits
+        transaction_data = block_template.transaction_data()
+        # Append mining reward
+        transaction_data.append(Transaction.reward_transaction(wallet).to_json())
+
+        return blockchain.chain[-1], transaction_data
+
+    def append_block(last_block, block):
+        # Appended only on the tip it was mined on
+        if blockchain.chain[-1].hash != last_block.hash:
+            return False
+        blockchain.apply_block(block)
+        return True
+
+    # Mined off the state engine writer, which keeps handling changes,
+    # and again on the new tip when the tip changed meanwhile
+    while True:
+        last_block, transaction_data = state_engine.call(block_template_data)
+        block = Block.mine_block(last_block, transaction_data)
+        if state_engine.call(append_block, last_block, block):
+            break
+
     pubsub.broadcast_block(block)
-    transaction_pool.clear_blockchain_transactions(blockchain)
 
     return jsonify(block.to_json())
 
 
+@app.route("/mining/start", methods=["POST"])
+def route_mining_start():
+    # Mine in the background until stopped, see /mining/status
+    mining_service.start()
+
+    return jsonify(mining_service.status())
+
+
+@app.route("/mining/stop", methods=["POST"])
+def route_mining_stop():
+    mining_service.stop()
+
+    return jsonify(mining_service.status())
+
+
+@app.route("/mining/status")
+def route_mining_status():
+
+    return jsonify(mining_service.status())
+
+
 @app.route("/wallet/transact", methods=["POST"])
 def route_wallet_transact():
     # Data posted as json, getting this data
     transaction_data = request.get_json()
 
-    transaction = transaction_pool.existing_transaction(wallet.address)
+    def transact():
+        transaction = transaction_pool.existing_transaction(wallet.address)
 
-    # Existing transaction? find if address already posted a transaction
-    if transaction:
-            transaction.update(
-            wallet,
-            transaction_data["recipient"],
-            transaction_data["amount"]
-        )
-    else:
-        transaction = Transaction(
-            wallet,
-            transaction_data["recipient"],
-            transaction_data["amount"]
-        )
-
-    # Broadcasting transaction
-    pubsub.broadcast_transaction(transaction)
-    # NOTE Set transaction in own transaction pool since not broadcasting to self
-    # In pubsub.py we are unsubscribing temporarly while publishing"
-    transaction_pool.set_transaction(transaction)
-    
-    return jsonify(transaction.to_json())
+        # Existing transaction? find if address already posted a transaction
+        if transaction:
+                transaction.update(
+                wallet,
+                transaction_data["recipient"],
+                transaction_data["amount"]
+            )
+        else:
+            transaction = Transaction(
+                wallet,
+                transaction_data["recipient"],
+                transaction_data["amount"]
+            )
+
+        # NOTE Set transaction in own transaction pool since not broadcasting to self
+        # PubSub drops the messages published by this node
+        transaction_pool.set_transaction(transaction)
+        # Broadcasting transaction, copied by publish
+        pubsub.broadcast_transaction(transaction)
+
+        # Copied, a later update changes the transaction in place
+        return copy.deepcopy(transaction.to_json())
+
+    return jsonify(state_engine.call(transact))
 
 
 @app.route("/wallet/info")
@@ -99,20 +257,53 @@ def route_wallet_info():
 
 @app.route("/known-addresses")
 def route_known_addresses():
-    known_addresses = set()
-
-    for block in blockchain.chain:
-        for transaction in block.data:
-            # in output dict, the keys are the addresses
-            known_addresses.update(transaction["output"].keys())
-
-    return jsonify(list(known_addresses))
+    # Ex http://localhost:5000/known-addresses?prefix=ab&limit=50
+    # Next page: &after=<last address of the page>
+    # Without limit all known addresses are returned
+    limit = request.args.get("limit")
+    if limit is not None:
+        if not limit.isdigit():
+            return jsonify({"error": "limit must be a non-negative integer"}), 400
+        limit = min(int(limit), KNOWN_ADDRESSES_LIMIT)
+
+    return jsonify(state_engine.snapshot().known_addresses(
+        prefix=request.args.get("prefix", ""),
+        after=request.args.get("after"),
+        limit=limit
+    ))
+
+
+@app.route("/transaction/<transaction_id>/proof")
+def route_transaction_proof(transaction_id):
+    block = state_engine.snapshot().find_transaction(transaction_id)
+
+    if not block or not block.merkle_root:
+        return jsonify({
+            "error": f"No merkle proof for transaction {transaction_id}"
+        }), 404
+
+    index, proof = block.transaction_proof(transaction_id)
+
+    # Verify with backend.util.merkle_tree.verify_merkle_proof
+    return jsonify({
+        "transaction_id": transaction_id,
+        "block_hash": block.hash,
+        "merkle_root": block.merkle_root,
+        "index": index,
+        "proof": proof
+    })
 
 
 @app.route("/transactions")
 def route_transactions():
     
-    return jsonify(transaction_pool.transaction_data())
+    return jsonify(state_engine.snapshot().transactions)
+
+
+@app.route("/transactions/stats")
+def route_transactions_stats():
+
+    return jsonify(state_engine.snapshot().pool_stats)
 
 
 
@@ -123,31 +314,49 @@ PORT = ROOT_PORT
 if os.environ.get("PEER") == "True":
     PORT = random.randint(5001, 6000)
 
-    result = requests.get(f"http://localhost:{ROOT_PORT}/blockchain")
-    #print(f"result.json(): {result.json()}")
-
-    result_blockchain = Blockchain.from_json(result.json())
-
-    # Replace chain after validation
-    try: 
-        blockchain.replace_chain(result_blockchain.chain)
-        print("\n -- Successfully synced local chain")
+    # Headers first, then the bodies in parallel ranges, resuming from
+    # the local height (kept across restarts with BLOCK_STORE_DIR)
+    try:
+        synced = ChainSync(
+            blockchain,
+            f"http://localhost:{ROOT_PORT}",
+            state_engine=state_engine
+        ).sync()
+        print(f"\n -- Successfully synced local chain, {synced} new blocks")
     except Exception as e:
         print(f"\ -- Error tying to sync: {e}")
 
 
 if os.environ.get("SEED_DATA") == "True":
-    for i in range(10):
-        blockchain.add_block([
-            Transaction(Wallet(), Wallet().address, random.randint(1,30)).to_json(),
-            Transaction(Wallet(), Wallet().address, random.randint(1,30)).to_json()
-        ])
-
-    for i in range(3):
-        transaction_pool.set_transaction(
-            Transaction(Wallet(), Wallet().address, random.randint(5, 10))
-            )
+    def seed_data():
+        for i in range(10):
+            blockchain.add_block([
+                Transaction(Wallet(), Wallet().address, random.randint(1,30)).to_json(),
+                Transaction(Wallet(), Wallet().address, random.randint(1,30)).to_json()
+            ])
+
+        for i in range(3):
+            transaction_pool.set_transaction(
+                Transaction(Wallet(), Wallet().address, random.randint(5, 10))
+                )
+
+    # The writer and the transport threads are already running
+    state_engine.call(seed_data)
         
     print("Running app with SEED_DATA set to True")
 
-app.run(port=PORT)
\ No newline at end of file
+# SERVER=asgi: serve from an asyncio event loop with uvicorn (pip install
+# uvicorn), the Flask development server otherwise
+if os.environ.get("SERVER") == "asgi":
+    # Routes answering from the state engine snapshot only
+    run_asgi(app, state_engine, PORT, cached_routes=[
+        "/blockchain",
+        "/blockchain/range",
+        "/blockchain/headers",
+        "/blockchain/blocks",
+        "/blockchain/length",
+        "/transactions",
+        "/transactions/stats"
+    ])
+else:
+    app.run(port=PORT)
\ No newline at end of file
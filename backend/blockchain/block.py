@@ -1,7 +1,20 @@
 import time
-from backend.util.crypto_hash import crypto_hash
-from backend.util.hex_to_binary import hex_to_binary
-from backend.config import MINE_RATE
+from backend.util.proof_of_work import (
+    difficulty_to_target,
+    digest_meets_target,
+    hash_meets_difficulty
+)
+from backend.util.merkle_tree import merkle_proof, merkle_root
+from backend.util.binary_encoding import decode_block, encode_block
+from backend.blockchain.block_header import (
+    BLOCK_VERSION,
+    LEGACY_BLOCK_VERSION,
+    MERKLE_BLOCK_VERSION,
+    block_hash,
+    digest_with_midstate,
+    header_midstate
+)
+from backend.config import MINE_RATE, DIFFICULTY_STEP
 
 GENESIS_DATA = {
     "timestamp": 1,
@@ -11,19 +24,38 @@ GENESIS_DATA = {
     "difficulty": 3,
     "nonce": "genesis_nonce"
 }
+# Difficulties are whole multiples of DIFFICULTY_STEP, rounded to this
+# many decimals so fractional steps do not pick up float error
+DIFFICULTY_DECIMALS = 9
 
 class Block():
     """
     Block: a unit of storage.
     Store transactions in a blockchain, supporting a cryptocurrency.
     """
-    def __init__(self, timestamp, last_hash, hash, data, difficulty, nonce):
+    def __init__(
+        self,
+        timestamp,
+        last_hash,
+        hash,
+        data,
+        difficulty,
+        nonce,
+        version=LEGACY_BLOCK_VERSION,
+        merkle_root=None
+    ):
         self.timestamp = timestamp
         self.last_hash = last_hash
         self.hash = hash
         self.data= data
         self.difficulty = difficulty
         self.nonce = nonce
+        # Header format used for the hash, blocks without a version
+        # (from older nodes) are hashed with the legacy format
+        self.version = version
+        # Merkle root of the transactions (from version 3), the header
+        # commits to it so single transactions can be proven
+        self.merkle_root = merkle_root
 
     def __repr__(self):
         return (
@@ -33,7 +65,9 @@ class Block():
             f'hash: {self.hash}, '
             f'data: {self.data}, '
             f'difficulty: {self.difficulty}, '
-            f'nonce: {self.nonce})'
+            f'nonce: {self.nonce}, '
+            f'version: {self.version}, '
+            f'merkle_root: {self.merkle_root})'
         )
 
     def __eq__(self, other):
@@ -45,6 +79,32 @@ class Block():
         """
         return self.__dict__
 
+    def header_json(self):
+        """
+        Serialize the block header: every attribute except the data.
+        """
+        return {
+            field: value for field, value in self.__dict__.items()
+            if field != "data"
+        }
+
+    def to_bytes(self):
+        """
+        Serialize the block into the compact binary format.
+        """
+        return encode_block(self.to_json())
+
+    def transaction_proof(self, transaction_id):
+        """
+        Return the index and merkle inclusion proof of a transaction
+        in the block data.
+        """
+        for index, transaction in enumerate(self.data):
+            if transaction["id"] == transaction_id:
+                return index, merkle_proof(self.data, index)
+
+        raise Exception(f"Transaction {transaction_id} is not in the block")
+
 
     # Static methods below (could be functions outside class)
     @staticmethod
@@ -57,16 +117,29 @@ class Block():
         last_hash = last_block.hash
         difficulty = Block.adjust_difficulty(last_block, timestamp)
         nonce = 0
-        hash = crypto_hash(timestamp, last_hash, data, difficulty, nonce)
-        # In while loop, look at binary representation of the hash
-        # so difficulty is num zeros in binary string
-        while hex_to_binary(hash)[0:difficulty] != "0" * difficulty:
+        root = Block.calculate_merkle_root(data)
+        # Serialize last_hash and merkle root once, only the timestamp,
+        # difficulty and nonce are hashed per attempt
+        midstate = header_midstate(BLOCK_VERSION, last_hash, root)
+        digest = digest_with_midstate(midstate, timestamp, difficulty, nonce)
+        # Compare the digest as a 256-bit number against the target,
+        # difficulty is the number of leading zero bits
+        while not digest_meets_target(digest, difficulty_to_target(difficulty)):
             nonce += 1
             timestamp = time.time_ns()
             difficulty = Block.adjust_difficulty(last_block, timestamp)
-            hash = crypto_hash(timestamp, last_hash, data, difficulty, nonce)
+            digest = digest_with_midstate(midstate, timestamp, difficulty, nonce)
             
-        return Block(timestamp, last_hash, hash, data, difficulty, nonce)
+        return Block(
+            timestamp,
+            last_hash,
+            digest.hex(),
+            data,
+            difficulty,
+            nonce,
+            BLOCK_VERSION,
+            root
+        )
 
     @staticmethod
     def genesis():
@@ -89,49 +162,106 @@ class Block():
         """
         return Block(**block_json)
 
+    @staticmethod
+    def from_bytes(block_bytes):
+        """
+        De-serialize the binary format back in to a block instance.
+        """
+        return Block.from_json(decode_block(block_bytes))
+
+    @staticmethod
+    def calculate_merkle_root(data):
+        """
+        Return the merkle root of the block data, a list of transactions.
+        Data that is not a list is committed to as a single leaf.
+        """
+        if not isinstance(data, list):
+            data = [data]
+
+        return merkle_root(data)
+
     @staticmethod
     def adjust_difficulty(last_block, new_timestamp):
         """
         Calc and adjust difficulty based on MINE_RATE
         Increase difficulty if block is mine to quickly
         Decrease difficulty if mining takes too long
+        Difficulty changes by DIFFICULTY_STEP leading zero bits, down to
+        a single step
         """
+        steps = round(last_block.difficulty / DIFFICULTY_STEP)
         if (new_timestamp - last_block.timestamp) < MINE_RATE:
-            return last_block.difficulty + 1
-
-        if (last_block.difficulty -1) > 0:
-            return last_block.difficulty -1
+            steps += 1
+        elif steps > 1:
+            steps -= 1
+        else:
+            steps = 1
 
-        return 1
+        return round(steps * DIFFICULTY_STEP, DIFFICULTY_DECIMALS)
 
     @staticmethod
     def is_valid_block(last_block, block):
         """
         Validate block by enforcing the following rules:
-          - block must have the proper last_hash reference
-          - block must meet the proof of work requirement
-          - difficulty must only adjust by 1
+          - the header rules of is_valid_header
           - block hash must be a valid combination of block fields
+          - merkle root must match the block data (from version 3)
+        """
+        Block.is_valid_header(last_block.header_json(), block.header_json())
+
+        if block.version < MERKLE_BLOCK_VERSION:
+            reconstructed_hash = block_hash(
+                block.version,
+                block.timestamp,
+                block.last_hash,
+                block.data,
+                block.difficulty,
+                block.nonce
+            )
+            #print("reconstr_hash",reconstructed_hash)
+            if block.hash != reconstructed_hash:
+                raise Exception("Block hash must be correct")
+
+        if block.version >= MERKLE_BLOCK_VERSION and \
+            block.merkle_root != Block.calculate_merkle_root(block.data):
+            raise Exception("Block merkle root must be correct")
+
+
+    @staticmethod
+    def is_valid_header(last_header, header):
+        """
+        Validate a block header (header_json) without the block data:
+          - header must have the proper last_hash reference
+          - header must meet the proof of work requirement
+          - difficulty must only adjust by DIFFICULTY_STEP
+          - from version 3 the hash must be a valid combination of the
+            header fields, older hashes also cover the data
         """
-        if block.last_hash != last_block.hash:
+        if header["last_hash"] != last_header["hash"]:
             raise Exception("The block last_hash is not correct")
 
-        if hex_to_binary(block.hash)[0:block.difficulty] != "0" * block.difficulty:
+        if not hash_meets_difficulty(header["hash"], header["difficulty"]):
             raise Exception("The proof of work requirement not met")
 
-        if abs(last_block.difficulty - block.difficulty) > 1:
-            raise Exception("Block difficullty must only adjust by 1")
+        difficulty_change = abs(last_header["difficulty"] - header["difficulty"])
+        if round(difficulty_change, DIFFICULTY_DECIMALS) > DIFFICULTY_STEP:
+            raise Exception(
+                f"Block difficullty must only adjust by {DIFFICULTY_STEP}"
+            )
 
-        reconstructed_hash = crypto_hash(
-            block.timestamp,
-            block.last_hash,
-            block.data,
-            block.nonce,
-            block.difficulty
-        )
-        #print("reconstr_hash",reconstructed_hash)
-        if block.hash != reconstructed_hash:
-            raise Exception("Block hash must be correct")
+        version = header.get("version", LEGACY_BLOCK_VERSION)
+        if version >= MERKLE_BLOCK_VERSION:
+            reconstructed_hash = block_hash(
+                version,
+                header["timestamp"],
+                header["last_hash"],
+                None,
+                header["difficulty"],
+                header["nonce"],
+                header.get("merkle_root")
+            )
+            if header["hash"] != reconstructed_hash:
+                raise Exception("Block hash must be correct")
 
 
 def main():
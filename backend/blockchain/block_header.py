@@ -0,0 +1,89 @@
+import hashlib
+import json
+from backend.util.crypto_hash import crypto_hash
+
+# Version 1: crypto_hash over all block fields (sorted json strings).
+# Version 2: sha-256 over a serialized header prefix of the fields that do
+# not change while mining (last_hash and data), followed by the per attempt
+# timestamp, difficulty and nonce.
+# Version 3: as version 2, but the prefix commits to the merkle root of the
+# transactions instead of the transactions themselves.
+LEGACY_BLOCK_VERSION = 1
+DATA_BLOCK_VERSION = 2
+MERKLE_BLOCK_VERSION = 3
+BLOCK_VERSION = MERKLE_BLOCK_VERSION
+
+
+def header_prefix(version, last_hash, payload):
+    """
+    Serialize the immutable part of a block header.
+    The payload is the block data for version 2 and the merkle root
+    for version 3.
+    """
+    return json.dumps(
+        [version, last_hash, payload],
+        sort_keys=True,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+def header_midstate(version, last_hash, payload):
+    """
+    Return a sha-256 object that has already consumed the header prefix.
+    Copy it for each nonce so the prefix is only hashed once per block.
+    """
+    return hashlib.sha256(header_prefix(version, last_hash, payload))
+
+
+def header_suffix(timestamp, difficulty, nonce):
+    """
+    Serialize the part of the header that changes on every mining attempt.
+    """
+    return f"|{timestamp}|{difficulty}|{nonce}".encode("utf-8")
+
+
+def digest_with_midstate(midstate, timestamp, difficulty, nonce):
+    """
+    Return the raw block hash bytes, constant cost regardless of block size.
+    """
+    sha = midstate.copy()
+    sha.update(header_suffix(timestamp, difficulty, nonce))
+
+    return sha.digest()
+
+
+def hash_with_midstate(midstate, timestamp, difficulty, nonce):
+    """
+    Return the hex encoded block hash.
+    """
+    return digest_with_midstate(midstate, timestamp, difficulty, nonce).hex()
+
+
+def block_hash(
+    version,
+    timestamp,
+    last_hash,
+    data,
+    difficulty,
+    nonce,
+    merkle_root=None
+):
+    """
+    Return the hash of the block fields for the given block version.
+    """
+    if version == LEGACY_BLOCK_VERSION:
+        return crypto_hash(timestamp, last_hash, data, difficulty, nonce)
+
+    if version == DATA_BLOCK_VERSION:
+        payload = data
+    elif version == MERKLE_BLOCK_VERSION:
+        payload = merkle_root
+    else:
+        raise Exception(f"Unsupported block version: {version}")
+
+    return hash_with_midstate(
+        header_midstate(version, last_hash, payload),
+        timestamp,
+        difficulty,
+        nonce
+    )
@@ -0,0 +1,423 @@
+import hashlib
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from backend.blockchain.block import Block
+from backend.config import (
+    BLOCK_CACHE_SIZE,
+    BLOCK_STORE_SEGMENT_SIZE,
+    BLOCK_STORE_SYNC_INTERVAL
+)
+
+# Segment record: payload length, crc32 of the payload, binary encoded block
+RECORD_HEADER = struct.Struct(">II")
+# Index entry per height: segment number, offset, record length, hash key
+INDEX_ENTRY = struct.Struct(">IQI32s")
+SEGMENT_PATTERN = re.compile(r"blocks-(\d{5})\.dat")
+HEX_HASH_PATTERN = re.compile("[0-9a-f]{64}")
+
+
+def hash_key(hash):
+    """
+    Return the 32 byte index key of a block hash.
+    """
+    if HEX_HASH_PATTERN.fullmatch(hash):
+        return bytes.fromhex(hash)
+
+    # Hashes that are not hex digests, like the genesis hash
+    return hashlib.sha256(hash.encode("utf-8")).digest()
+
+
+class BlockStore():
+    """
+    Append-only storage of blocks on disk.
+    Blocks are appended to segment files, an index file maps each height
+    to the segment and offset of its block. Writes are fsynced every
+    sync_interval blocks and when a segment is full, torn writes are
+    truncated when the store opens.
+    Reads may run on other threads than the writer, lock serializes them
+    with the changes of the index and segments.
+    """
+    def __init__(
+        self,
+        directory,
+        segment_size=BLOCK_STORE_SEGMENT_SIZE,
+        sync_interval=BLOCK_STORE_SYNC_INTERVAL
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.unsynced = 0
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, "index.dat")
+        self.recover()
+        self.index_file = open(self.index_path, "r+b")
+
+    def __len__(self):
+        return self.length
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"blocks-{segment:05d}.dat")
+
+    def segments(self):
+        """
+        Return the numbers of the segment files, in order.
+        """
+        return sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_PATTERN.fullmatch, os.listdir(self.directory))
+            if match
+        )
+
+    def read_entry(self, height):
+        self.index_file.seek(height * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(self.index_file.read(INDEX_ENTRY.size))
+
+    def read_record(self, segment_file, offset):
+        """
+        Return the payload of the record at offset, or None if the record
+        is torn or corrupt.
+        """
+        segment_file.seek(offset)
+        header = segment_file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+
+        length, crc = RECORD_HEADER.unpack(header)
+        payload = segment_file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return None
+
+        return payload
+
+    def recover(self):
+        """
+        Bring the index and segments back in line after a crash:
+          - drop a partly written index entry
+          - drop index entries whose block was not fully written
+          - index complete blocks written after the last index entry,
+            through the following segments in order
+          - truncate a torn block at the end of the last segment
+        Segments after a torn block are removed, their blocks no longer
+        follow the chain of indexed blocks.
+        """
+        if not os.path.exists(self.index_path):
+            open(self.index_path, "wb").close()
+
+        with open(self.index_path, "r+b") as index_file:
+            index_data = index_file.read()
+            entries = [
+                INDEX_ENTRY.unpack_from(index_data, offset)
+                for offset in range(
+                    0,
+                    len(index_data) - INDEX_ENTRY.size + 1,
+                    INDEX_ENTRY.size
+                )
+            ]
+
+            # Drop entries pointing at missing or torn records
+            while entries:
+                segment, offset, length, key = entries[-1]
+                path = self.segment_path(segment)
+                if os.path.exists(path):
+                    with open(path, "rb") as segment_file:
+                        if self.read_record(segment_file, offset) is not None:
+                            break
+                entries.pop()
+
+            # Re-index complete records written after the last entry
+            segments = self.segments()
+            if entries:
+                segment, offset, length, key = entries[-1]
+                position = offset + length
+            else:
+                segment = segments[0] if segments else 0
+                position = 0
+
+            while os.path.exists(self.segment_path(segment)):
+                with open(self.segment_path(segment), "r+b") as segment_file:
+                    while True:
+                        payload = self.read_record(segment_file, position)
+                        if payload is None:
+                            break
+                        block = Block.from_bytes(payload)
+                        length = RECORD_HEADER.size + len(payload)
+                        entries.append((segment, position, length, hash_key(block.hash)))
+                        position += length
+                    complete = position == os.fstat(segment_file.fileno()).st_size
+                    # Truncate a torn write
+                    segment_file.truncate(position)
+
+                if not complete or segment + 1 not in segments:
+                    break
+                segment += 1
+                position = 0
+
+            for later_segment in segments:
+                if later_segment > segment:
+                    os.remove(self.segment_path(later_segment))
+
+            index_file.seek(0)
+            for entry in entries:
+                index_file.write(INDEX_ENTRY.pack(*entry))
+            index_file.truncate()
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+        self.length = len(entries)
+        self.hash_heights = {
+            entry[3]: height for height, entry in enumerate(entries)
+        }
+        self.segment = segment
+        self.position = position
+
+    def append(self, block):
+        """
+        Append a block at the next height.
+        """
+        payload = block.to_bytes()
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self.lock:
+            if self.position > 0 and self.position + len(record) > self.segment_size:
+                self.sync()
+                self.segment += 1
+                self.position = 0
+
+            with open(self.segment_path(self.segment), "ab") as segment_file:
+                segment_file.write(record)
+
+            key = hash_key(block.hash)
+            self.index_file.seek(self.length * INDEX_ENTRY.size)
+            self.index_file.write(
+                INDEX_ENTRY.pack(self.segment, self.position, len(record), key)
+            )
+            self.hash_heights[key] = self.length
+            self.length += 1
+            self.position += len(record)
+
+            self.unsynced += 1
+            if self.unsynced >= self.sync_interval:
+                self.sync()
+
+    def sync(self):
+        """
+        Flush the current segment and then the index to disk, a synced
+        index entry always points at a synced block. A segment is synced
+        before the store moves on to the next one.
+        """
+        with self.lock:
+            if os.path.exists(self.segment_path(self.segment)):
+                with open(self.segment_path(self.segment), "rb") as segment_file:
+                    os.fsync(segment_file.fileno())
+            self.index_file.flush()
+            os.fsync(self.index_file.fileno())
+            self.unsynced = 0
+
+    def read(self, height):
+        """
+        Return the block at height.
+        """
+        with self.lock:
+            if not 0 <= height < self.length:
+                raise IndexError(f"No block at height {height}")
+
+            self.index_file.flush()
+            segment, offset, length, key = self.read_entry(height)
+            with open(self.segment_path(segment), "rb") as segment_file:
+                payload = self.read_record(segment_file, offset)
+
+        if payload is None:
+            raise Exception(f"Block at height {height} is corrupt")
+
+        return Block.from_bytes(payload)
+
+    def height_of(self, hash):
+        """
+        Return the height of the block with the hash, or None.
+        """
+        return self.hash_heights.get(hash_key(hash))
+
+    def has_block_at(self, height, hash):
+        """
+        Whether the block at height is the block with the hash.
+        """
+        with self.lock:
+            if not 0 <= height < self.length:
+                return False
+
+            self.index_file.flush()
+            return self.read_entry(height)[3] == hash_key(hash)
+
+    def truncate(self, height):
+        """
+        Remove the blocks from height on.
+        """
+        with self.lock:
+            if height >= self.length:
+                return
+
+            for h in range(height, self.length):
+                self.hash_heights.pop(self.read_entry(h)[3], None)
+
+            if height > 0:
+                segment, offset, length, key = self.read_entry(height - 1)
+                position = offset + length
+            else:
+                segment = self.segments()[0] if self.segments() else 0
+                position = 0
+
+            if os.path.exists(self.segment_path(segment)):
+                with open(self.segment_path(segment), "r+b") as segment_file:
+                    segment_file.truncate(position)
+            for later_segment in self.segments():
+                if later_segment > segment:
+                    os.remove(self.segment_path(later_segment))
+
+            self.index_file.truncate(height * INDEX_ENTRY.size)
+            self.length = height
+            self.segment = segment
+            self.position = position
+        self.sync()
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.index_file.close()
+
+
+class StoredChain():
+    """
+    List like view of the blocks in a BlockStore.
+    Blocks are read from disk when accessed, the most recently used are
+    kept decoded in memory. The cache is guarded by the lock of the store,
+    readers on other threads see the chain between changes.
+    """
+    def __init__(self, store, cache_size=BLOCK_CACHE_SIZE):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        with self.store.lock:
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("chain index out of range")
+
+            if index in self.cache:
+                self.cache.move_to_end(index)
+                return self.cache[index]
+
+            block = self.store.read(index)
+            self.cache_block(index, block)
+
+            return block
+
+    def pinned(self, length):
+        """
+        Return a view of the first length blocks, see PinnedChain.
+        """
+        with self.store.lock:
+            return PinnedChain(self, length, self[length - 1].hash)
+
+    def read_pinned(self, height, tip_height, tip_hash):
+        """
+        Return the block at height of the chain whose block at tip_height
+        has tip_hash. Raise when that block is no longer stored.
+        """
+        with self.store.lock:
+            if not self.store.has_block_at(tip_height, tip_hash):
+                raise Exception("The chain changed, the blocks of the view are no longer stored")
+
+            return self[height]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(
+            block == other_block for block, other_block in zip(self, other)
+        )
+
+    def __repr__(self):
+        return f"StoredChain({len(self)} blocks in {self.store.directory})"
+
+    def cache_block(self, height, block):
+        self.cache[height] = block
+        self.cache.move_to_end(height)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def append(self, block):
+        with self.store.lock:
+            self.cache_block(len(self), block)
+            self.store.append(block)
+
+    def pop(self):
+        block = self[-1]
+        self.truncate(len(self) - 1)
+
+        return block
+
+    def truncate(self, height):
+        """
+        Remove the blocks from height on.
+        """
+        with self.store.lock:
+            for h in [h for h in self.cache if h >= height]:
+                del self.cache[h]
+            self.store.truncate(height)
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice) or index.stop is not None or index.step:
+            raise Exception("Only the blocks from a height on can be removed")
+
+        self.truncate(index.indices(len(self))[0])
+
+
+class PinnedChain():
+    """
+    Read only view of the first length blocks of a StoredChain, for
+    readers on other threads while the chain keeps changing. Every read
+    checks that the tip of the view is still stored, so a view of blocks
+    that were rolled back raises instead of returning another chain.
+    """
+    def __init__(self, chain, length, tip_hash):
+        self.chain = chain
+        self.length = length
+        self.tip_hash = tip_hash
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chain index out of range")
+
+        return self.chain.read_pinned(index, self.length - 1, self.tip_hash)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,160 @@
+import json
+from collections import OrderedDict
+from backend.wallet.transaction import Transaction
+from backend.config import (
+    BLOCK_MAX_BYTES,
+    BLOCK_MAX_TRANSACTIONS,
+    MINING_REWARD_INPUT,
+    STRATING_BALANCE
+)
+
+
+class BlockTemplate():
+    """
+    The pool transactions for the next mined block, kept up to date as
+    transactions are pooled and blocks change the chain.
+    Transactions are taken in pool order up to max_transactions and
+    max_bytes of json, skipping transactions that:
+      - are already recorded on the chain
+      - spend a balance that is no longer the sender's chain balance
+      - come from a sender with a transaction in the template already
+      - have invalid output values or signature (checked once)
+    Create the template after the pool is a blockchain listener, so mined
+    transactions have left the pool when the template revisits their
+    senders.
+    """
+    def __init__(
+        self,
+        blockchain,
+        transaction_pool,
+        max_transactions=BLOCK_MAX_TRANSACTIONS,
+        max_bytes=BLOCK_MAX_BYTES
+    ):
+        self.blockchain = blockchain
+        self.transaction_pool = transaction_pool
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        # transaction id -> (transaction, size in bytes), in pool order
+        self.selected = OrderedDict()
+        # sender address -> transaction id in the template
+        self.senders = {}
+        self.size = 0
+        # transaction id -> (input timestamp, valid), the result of the
+        # output values and signature check of that version of it
+        self.checked = {}
+        # Whether a transaction was left out for lack of space
+        self.overflow = False
+
+        transaction_pool.add_listener(self.on_transaction)
+        blockchain.add_listener(self.on_blocks)
+        self.refill()
+
+    def transaction_data(self):
+        """
+        Return the template transactions in json serialized form.
+        """
+        return [transaction.to_json() for transaction, size in self.selected.values()]
+
+    def is_includable(self, transaction):
+        if transaction.input == MINING_REWARD_INPUT or \
+            transaction.id in self.blockchain.transaction_heights:
+            return False
+
+        address = transaction.input["address"]
+        if self.blockchain.balances.get(address, STRATING_BALANCE) != \
+            transaction.input["amount"]:
+            return False
+
+        timestamp = transaction.input["timestamp"]
+        if self.checked.get(transaction.id, (None,))[0] != timestamp:
+            try:
+                Transaction.is_valid(transaction)
+                valid = True
+            except Exception:
+                valid = False
+            self.checked[transaction.id] = (timestamp, valid)
+
+        return self.checked[transaction.id][1]
+
+    def add(self, transaction):
+        """
+        Add a pool transaction if it is includable and fits.
+        """
+        if transaction.id in self.selected or \
+            transaction.input["address"] in self.senders or \
+            not self.is_includable(transaction):
+            return
+
+        size = len(json.dumps(transaction.to_json()))
+        if len(self.selected) >= self.max_transactions or \
+            self.size + size > self.max_bytes:
+            self.overflow = True
+            return
+
+        self.selected[transaction.id] = (transaction, size)
+        self.senders[transaction.input["address"]] = transaction.id
+        self.size += size
+
+    def remove(self, transaction_id):
+        entry = self.selected.pop(transaction_id, None)
+        if entry is None:
+            return False
+
+        transaction, size = entry
+        if self.senders.get(transaction.input["address"]) == transaction_id:
+            del self.senders[transaction.input["address"]]
+        self.size -= size
+
+        return True
+
+    def refill(self):
+        """
+        Add pool transactions until the template is full, in pool order.
+        """
+        self.overflow = False
+        for transaction in self.transaction_pool.transaction_map.values():
+            if len(self.selected) >= self.max_transactions:
+                self.overflow = True
+                break
+            self.add(transaction)
+
+    def on_transaction(self, transaction, removed_id):
+        """
+        TransactionPool listener.
+        """
+        if transaction is not None:
+            # A pooled transaction may have been updated, with a new
+            # output, size and signature
+            self.remove(transaction.id)
+            self.add(transaction)
+            return
+
+        self.checked.pop(removed_id, None)
+        if self.remove(removed_id) and self.overflow:
+            self.refill()
+
+    def on_blocks(self, added, removed):
+        """
+        Blockchain listener: revisit the senders whose balance changed.
+        Mined transactions already left through the pool listener.
+        """
+        addresses = {
+            address
+            for block in [*added, *removed] if isinstance(block.data, list)
+            for transaction in block.data
+            for address in transaction["output"]
+        }
+
+        for address in addresses:
+            transaction_id = self.senders.get(address)
+            if transaction_id is not None and \
+                not self.is_includable(self.selected[transaction_id][0]):
+                self.remove(transaction_id)
+
+        for address in addresses:
+            transaction = self.transaction_pool.existing_transaction(address)
+            if transaction is not None:
+                self.add(transaction)
+
+        if self.overflow and len(self.selected) < self.max_transactions:
+            self.refill()
@@ -1,38 +1,388 @@
+import bisect
+import heapq
+import os
+import time
+from collections import ChainMap
 from backend.blockchain.block import Block
+from backend.blockchain.block_store import StoredChain
+from backend.blockchain.state_snapshot import (
+    SNAPSHOT_FILE,
+    read_snapshot,
+    write_snapshot
+)
 from backend.wallet.transaction import Transaction
-from backend.wallet.wallet import Wallet
-from backend.config import MINING_REWARD_INPUT
+from backend.config import (
+    MINING_REWARD_INPUT,
+    KNOWN_ADDRESSES_LIMIT,
+    REORG_UNDO_DEPTH,
+    SNAPSHOT_INTERVAL,
+    STRATING_BALANCE,
+    VALIDATION_PROGRESS_INTERVAL
+)
+
+class TransactionIdView:
+    """
+    Set like view of transaction ids: the ids of a chain index minus
+    removed ids, plus ids added to the view.
+    """
+    def __init__(self, transaction_ids, removed):
+        self.transaction_ids = transaction_ids
+        self.removed = removed
+        self.added = set()
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self.added or (
+            transaction_id in self.transaction_ids and
+            transaction_id not in self.removed
+        )
+
+    def update(self, transaction_ids):
+        self.added.update(transaction_ids)
+
 
 class Blockchain:
     """
     Blockchain: a public ledger of transactions.
     Implemented as a list of blocks, data sets of transactions.
+    Keeps indices of the chain state, updated as blocks are appended:
+      - balances: address -> balance
+      - transaction_heights: transaction id -> height of its block
+      - block_heights: block hash -> height
+      - addresses: sorted list of the addresses in transaction outputs,
+        replaced rather than changed so readers can keep a reference
+    With a BlockStore the blocks are kept on disk and read lazily. The
+    indices are saved to a snapshot every SNAPSHOT_INTERVAL blocks, on
+    start they are loaded from the snapshot and only the blocks after it
+    are replayed.
+    Listeners are told about the blocks added to and removed from the
+    chain, see add_listener.
     """
-    def __init__(self):
-        self.chain = [Block.genesis()]
+    def __init__(self, store=None):
+        self.store = store
+        self.listeners = []
+        if store is None or len(store) == 0:
+            self.chain = [Block.genesis()]
+        else:
+            self._chain = StoredChain(store)
+            self.restore_indices()
+
+    @property
+    def chain(self):
+        return self._chain
+
+    @chain.setter
+    def chain(self, chain):
+        """
+        Set the chain and rebuild the indices from its blocks.
+        """
+        if self.store is None:
+            self._chain = []
+        else:
+            self._chain = StoredChain(self.store)
+            self._chain.truncate(0)
+        self.reset_indices()
+        for block in chain:
+            self.apply_block(block)
+
+    def reset_indices(self):
+        self.balances = {}
+        self.addresses = []
+        self.transaction_heights = {}
+        self.block_heights = {}
+        # height -> changes needed to roll the block back, kept for the
+        # most recent REORG_UNDO_DEPTH blocks
+        self.undo_log = {}
+
+    def rebuild_indices(self):
+        """
+        Rebuild the indices from the blocks of the chain, in one pass.
+        """
+        self.reset_indices()
+        for height, block in enumerate(self._chain):
+            self.index_block(height, block, index_addresses=False)
+        self.addresses = sorted(self.balances)
+
+    def snapshot_path(self):
+        return os.path.join(self.store.directory, SNAPSHOT_FILE)
+
+    def save_snapshot(self):
+        """
+        Save the indices of the stored chain, with the tip they belong to.
+        """
+        self.store.sync()
+        write_snapshot(self.snapshot_path(), {
+            "height": len(self._chain) - 1,
+            "tip_hash": self._chain[-1].hash,
+            "balances": self.balances,
+            "transaction_heights": self.transaction_heights,
+            "block_heights": self.block_heights
+        })
+
+    def restore_indices(self):
+        """
+        Load the indices from the snapshot and replay the stored blocks
+        after it. Rebuild them from genesis when the snapshot is missing or
+        its tip is no longer in the stored chain.
+        """
+        snapshot = read_snapshot(self.snapshot_path())
+        if snapshot is None or \
+            snapshot["height"] >= len(self._chain) or \
+            self._chain[snapshot["height"]].hash != snapshot["tip_hash"]:
+            self.rebuild_indices()
+            self.save_snapshot()
+            return
+
+        self.reset_indices()
+        self.balances = snapshot["balances"]
+        self.transaction_heights = snapshot["transaction_heights"]
+        self.block_heights = snapshot["block_heights"]
+        for height in range(snapshot["height"] + 1, len(self._chain)):
+            self.index_block(height, self._chain[height], index_addresses=False)
+        self.addresses = sorted(self.balances)
+
+        if len(self._chain) - 1 - snapshot["height"] >= SNAPSHOT_INTERVAL:
+            self.save_snapshot()
+
+    def add_listener(self, listener):
+        """
+        Call listener(added, removed) with the blocks appended to the chain
+        and the blocks rolled back from it (tip first), as they change.
+        """
+        self.listeners.append(listener)
+
+    def notify_listeners(self, added, removed):
+        for listener in self.listeners:
+            listener(added, removed)
 
     def add_block(self, data):
         last_block = self.chain[-1]
-        self.chain.append(Block.mine_block(last_block, data))
+        self.apply_block(Block.mine_block(last_block, data))
 
     def __repr__(self):
         return f"Blockchain: {self.chain}"
 
-    def replace_chain(self, chain):
+    def apply_block(self, block):
+        """
+        Append a block that is already validated and update the indices,
+        in O(block size).
+        """
+        self.index_block(len(self._chain), block)
+        self._chain.append(block)
+        self.notify_listeners([block], [])
+
+        if self.store is not None and len(self._chain) % SNAPSHOT_INTERVAL == 0:
+            self.save_snapshot()
+
+    def index_block(self, height, block, index_addresses=True):
+        """
+        Update the indices with the block at height.
+        index_addresses=False leaves the sorted addresses to be rebuilt
+        once from the balances, when indexing a whole chain.
+        """
+        transactions = block.data if isinstance(block.data, list) else []
+        previous_balances = {
+            address: self.balances.get(address)
+            for transaction in transactions
+            for address in transaction["output"]
+        }
+
+        Blockchain.apply_block_balances(self.balances, block)
+        if index_addresses:
+            # Every output address has a balance, new ones had none.
+            # Merged into a new list once per block, O(addresses)
+            new_addresses = sorted(
+                address for address, balance in previous_balances.items()
+                if balance is None
+            )
+            if new_addresses:
+                self.addresses = list(heapq.merge(self.addresses, new_addresses))
+        for transaction in transactions:
+            self.transaction_heights[transaction["id"]] = height
+        self.block_heights[block.hash] = height
+
+        self.undo_log[height] = previous_balances
+        self.undo_log.pop(height - REORG_UNDO_DEPTH, None)
+
+    def rollback(self, height):
+        """
+        Remove the blocks above height and restore the indices.
+        Rebuild the indices from the chain when the undo log does not
+        reach back far enough.
+        """
+        removed = []
+        if any(h not in self.undo_log for h in range(height + 1, len(self._chain))):
+            removed = self._chain[height + 1:]
+            del self._chain[height + 1:]
+            self.rebuild_indices()
+            self.notify_listeners([], removed[::-1])
+            return
+
+        removed_addresses = set()
+        while len(self._chain) > height + 1:
+            block = self._chain.pop()
+            removed.append(block)
+            for address, balance in self.undo_log.pop(len(self._chain)).items():
+                if balance is None:
+                    del self.balances[address]
+                    removed_addresses.add(address)
+                else:
+                    self.balances[address] = balance
+            if isinstance(block.data, list):
+                for transaction in block.data:
+                    del self.transaction_heights[transaction["id"]]
+            del self.block_heights[block.hash]
+
+        if removed_addresses:
+            self.addresses = [
+                address for address in self.addresses
+                if address not in removed_addresses
+            ]
+
+        if removed:
+            self.notify_listeners([], removed)
+
+    def state_at(self, height):
+        """
+        Return the balances and transaction ids of the chain up to and
+        including height, without changing the chain.
+        Both are views over the current indices with the blocks above
+        height rolled back, so the cost is proportional to the blocks
+        rolled back. Writes to the views do not reach the indices.
+        """
+        if any(h not in self.undo_log for h in range(height + 1, len(self._chain))):
+            balances = {}
+            transaction_ids = set()
+            for h in range(height + 1):
+                block = self._chain[h]
+                Blockchain.apply_block_balances(balances, block)
+                if isinstance(block.data, list):
+                    transaction_ids.update(
+                        transaction["id"] for transaction in block.data
+                    )
+            return balances, transaction_ids
+
+        rolled_back_balances = {}
+        removed_transaction_ids = set()
+        for h in range(len(self._chain) - 1, height, -1):
+            for address, balance in self.undo_log[h].items():
+                # An address not seen before has the starting balance
+                rolled_back_balances[address] = \
+                    STRATING_BALANCE if balance is None else balance
+            if isinstance(self._chain[h].data, list):
+                for transaction in self._chain[h].data:
+                    removed_transaction_ids.add(transaction["id"])
+
+        return (
+            ChainMap(rolled_back_balances, self.balances),
+            TransactionIdView(self.transaction_heights, removed_transaction_ids)
+        )
+
+    def append_block(self, block):
+        """
+        Append a block received from a peer that extends the local tip.
+        It is validated only against the tip and the current state, so the
+        cost does not grow with the chain height.
+        """
+        last_block = self.chain[-1]
+        if block.last_hash != last_block.hash:
+            raise Exception("The block does not extend the local tip")
+
+        Block.is_valid_block(last_block, block)
+        Blockchain.is_valid_block_transactions(
+            block,
+            self.balances,
+            self.transaction_heights
+        )
+        self.apply_block(block)
+
+    def fork_height(self, chain):
+        """
+        Return the height of the last block the incoming chain shares with
+        the local chain, or -1 if it does not even share the genesis block.
+        Walks back from the tip of the incoming chain.
+        """
+        for height in range(min(len(chain), len(self.chain)) - 1, -1, -1):
+            if self.block_heights.get(chain[height].hash) == height:
+                return height
+
+        return -1
+
+    def replace_chain(self, chain, progress=None, workers=None):
         """
         Replace local chain with incoming chain if following applies:
           - Incoming chain is longer then local chain.
           - Incoming chain is valid.
+        Only the blocks after the common ancestor with the local chain
+        are validated, against the state at the common ancestor.
+        With workers, validation runs on a pool of worker processes.
         """
         if len(chain) <= len(self.chain):
             raise Exception("Cannot replace. The incoming chain must be longer.")
-        
+
+        fork_height = self.fork_height(chain)
+
         try:
-            Blockchain.is_valid_chain(chain)
+            if fork_height < 0:
+                raise Exception("Gesesis block must be valid")
+            # Matched by hash only, the suffix is validated against the
+            # incoming copy of the common ancestor
+            if chain[fork_height].header_json() != \
+                self.chain[fork_height].header_json():
+                raise Exception("The common ancestor does not match the local block")
+
+            balances, transaction_ids = self.state_at(fork_height)
+            Blockchain.is_valid_chain_suffix(
+                chain,
+                fork_height + 1,
+                balances,
+                transaction_ids,
+                progress,
+                workers
+            )
         except Exception as e:
             raise Exception(f"Cannot replace. Incoming chain is invalid: {e}")
-        # if no exception, replace chain
-        self.chain = chain
+        # if no exception, replace the blocks after the common ancestor
+        self.rollback(fork_height)
+        for block in chain[fork_height + 1:]:
+            self.apply_block(block)
+
+    def known_addresses(self, prefix="", after=None, limit=KNOWN_ADDRESSES_LIMIT):
+        """
+        Return up to limit known addresses starting with prefix, in order,
+        all of them when limit is None.
+        Pass the last address of a page as after to get the next page.
+        O(log addresses + result size).
+        """
+        return Blockchain.page_addresses(self.addresses, prefix, after, limit)
+
+    @staticmethod
+    def page_addresses(addresses, prefix="", after=None, limit=KNOWN_ADDRESSES_LIMIT):
+        """
+        Return a page of the sorted addresses, see known_addresses.
+        """
+        if after is not None and after >= prefix:
+            start = bisect.bisect_right(addresses, after)
+        else:
+            start = bisect.bisect_left(addresses, prefix)
+
+        result = []
+        end = None if limit is None else start + limit
+        for address in addresses[start:end]:
+            if not address.startswith(prefix):
+                break
+            result.append(address)
+
+        return result
+
+    def find_transaction(self, transaction_id):
+        """
+        Return the block that records the transaction, or None.
+        """
+        height = self.transaction_heights.get(transaction_id)
+        if height is None:
+            return None
+
+        return self.chain[height]
 
     def to_json(self):
         """
@@ -59,75 +409,223 @@ class Blockchain:
         return blockchain
 
     @staticmethod
-    def is_valid_chain(chain):
+    def apply_block_balances(balances, block):
+        """
+        Update a balance index (address -> balance) with the transactions
+        of a block, in O(block size).
+        When an address sends coins its balance resets to the change in the
+        output, when it receives coins the amount is added.
+        """
+        if not isinstance(block.data, list):
+            return
+
+        for transaction in block.data:
+            sender = transaction["input"]["address"]
+            for address, amount in transaction["output"].items():
+                if address == sender:
+                    balances[address] = amount
+                else:
+                    balances[address] = \
+                        balances.get(address, STRATING_BALANCE) + amount
+
+    @staticmethod
+    def is_valid_chain(chain, progress=None, workers=None):
         """
         Validate incoming chain
         Enforce the following rules of the blockchain:
         - chain must start with genesis block
         - blocks must be formatted correctly
+        Return the seconds spent per validation step.
+        progress(step, done, total) is called every
+        VALIDATION_PROGRESS_INTERVAL blocks of each step.
+        With workers, validation runs on a pool of worker processes.
         """
         if chain[0] != Block.genesis():
             raise Exception("Gesesis block must be valid")
 
-        for i in range(1, len(chain)):
+        return Blockchain.is_valid_chain_suffix(
+            chain,
+            1,
+            {},
+            set(),
+            progress,
+            workers
+        )
+
+    @staticmethod
+    def is_valid_chain_suffix(
+        chain,
+        start,
+        balances,
+        transaction_ids,
+        progress=None,
+        workers=None
+    ):
+        """
+        Validate the blocks of the chain from height start, given the
+        balances and transaction ids of the chain before it.
+        balances and transaction_ids are updated while validating.
+        Return the seconds spent per validation step.
+        """
+        if workers and workers > 1:
+            # Imported here, parallel_validation imports this module
+            from backend.blockchain.parallel_validation import (
+                is_valid_chain_suffix_parallel
+            )
+            return is_valid_chain_suffix_parallel(
+                chain,
+                start,
+                balances,
+                transaction_ids,
+                workers,
+                progress
+            )
+
+        start_time = time.perf_counter()
+        for i in range(start, len(chain)):
             block = chain[i]
             last_block = chain[i-1]
             Block.is_valid_block(last_block, block)
+            Blockchain.report_progress(progress, "blocks", i + 1, len(chain))
+        blocks_time = time.perf_counter() - start_time
 
-        Blockchain.is_valid_transaction_chain(chain)
+        timings = Blockchain.is_valid_transaction_chain(
+            chain,
+            progress,
+            start,
+            balances,
+            transaction_ids
+        )
+        timings["blocks"] = blocks_time
+
+        return timings
 
     @staticmethod
-    def is_valid_transaction_chain(chain):
+    def is_valid_transaction_chain(
+        chain,
+        progress=None,
+        start=0,
+        balances=None,
+        transaction_ids=None
+    ):
         """
         Enforce rules of a chain composed of blocks of transactions.
           - Each transaction can only appear once in the chain.
           - Only one mining reward per block.
           - Each transaction must be valid.
+        One forward pass with rolling balances, linear in the number of
+        transactions. Return the seconds spent per validation step.
         """
+        timings = Blockchain.validation_timings()
         # Sets cannot have two items with the same value.
-        transaction_ids = set()
-        for i in range(len(chain)):
+        if transaction_ids is None:
+            transaction_ids = set()
+        # Balances of the chain before the current block
+        if balances is None:
+            balances = {}
+
+        for i in range(start, len(chain)):
             block = chain[i]
-            has_mining_rewards = False
+            transaction_ids.update(Blockchain.is_valid_block_transactions(
+                block,
+                balances,
+                transaction_ids,
+                timings
+            ))
 
-            for transaction_json in block.data:
-                transaction = Transaction.from_json(transaction_json)
+            start_time = time.perf_counter()
+            Blockchain.apply_block_balances(balances, block)
+            timings["balances"] += time.perf_counter() - start_time
 
-                # Check for duplicated transactions
-                if transaction.id in transaction_ids:
-                    raise Exception(f"Transaction {transaction.id} is not unique")
-                # Add transaction to set (it will then be checked for duplicate)
-                transaction_ids.add(transaction.id)
+            Blockchain.report_progress(progress, "transactions", i + 1, len(chain))
 
+        return timings
 
-                # Check for more than one mining rewards
-                if transaction.input == MINING_REWARD_INPUT:
-                    if has_mining_rewards == True:
-                        raise Exception(f"Duplicate mining rewards. \Check block with hash: {block.hash}")
-                    has_mining_rewards = True
+    @staticmethod
+    def is_valid_block_transactions(
+        block,
+        balances,
+        transaction_ids,
+        timings=None,
+        check_transactions=True
+    ):
+        """
+        Validate the transactions of a block against the balances and
+        transaction ids of the chain before it, neither is changed.
+        Return the ids of the block transactions. The time spent per step
+        is added to timings.
+        check_transactions=False skips the per transaction checks
+        (signature and output values) done separately in parallel mode.
+        """
+        if timings is None:
+            timings = Blockchain.validation_timings()
+        has_mining_rewards = False
+        block_transaction_ids = set()
 
-                # Check wallet balance so transaction input amount match blockchain balance
-                else:
-                    # Run if transaction is Not a mining transaction
-                    # Make historic_blockchain a Blockchain instance,
-                    # then copy in slice of chain
-                    historic_blockchain = Blockchain()
-                    historic_blockchain.chain = chain[0:i]
-
-                    historic_balance = Wallet.calculate_balance(
-                        historic_blockchain,
-                        transaction.input["address"]
-                        )
-
-                    if historic_balance != transaction.input["amount"]:
-                        raise Exception(
-                            f"Transaction {transaction.id} has "\
-                            "an invalid input amount"
-                        )
-
-                # Check that the transaction is valid
+        for transaction_json in block.data:
+            start_time = time.perf_counter()
+            transaction = Transaction.from_json(transaction_json)
+            deserialized_time = time.perf_counter()
+            timings["deserialize"] += deserialized_time - start_time
+
+            # Check for duplicated transactions
+            if transaction.id in transaction_ids or \
+                transaction.id in block_transaction_ids:
+                raise Exception(f"Transaction {transaction.id} is not unique")
+            # Add transaction to set (it will then be checked for duplicate)
+            block_transaction_ids.add(transaction.id)
+            unique_time = time.perf_counter()
+            timings["unique"] += unique_time - deserialized_time
+
+            # Check for more than one mining rewards
+            if transaction.input == MINING_REWARD_INPUT:
+                if has_mining_rewards == True:
+                    raise Exception(f"Duplicate mining rewards. Check block with hash: {block.hash}")
+                has_mining_rewards = True
+
+            # Check wallet balance so transaction input amount match blockchain balance
+            else:
+                # Run if transaction is Not a mining transaction
+                historic_balance = balances.get(
+                    transaction.input["address"],
+                    STRATING_BALANCE
+                )
+
+                if historic_balance != transaction.input["amount"]:
+                    raise Exception(
+                        f"Transaction {transaction.id} has "\
+                        "an invalid input amount"
+                    )
+            balance_time = time.perf_counter()
+            timings["balances"] += balance_time - unique_time
+
+            # Check that the transaction is valid
+            if check_transactions:
                 Transaction.is_valid(transaction)
+            timings["transactions"] += time.perf_counter() - balance_time
+
+        return block_transaction_ids
 
+    @staticmethod
+    def validation_timings():
+        """
+        Return the seconds spent per transaction validation step, zeroed.
+        """
+        return {
+            "deserialize": 0,
+            "unique": 0,
+            "balances": 0,
+            "transactions": 0
+        }
+
+    @staticmethod
+    def report_progress(progress, step, done, total):
+        """
+        Call the progress callback every VALIDATION_PROGRESS_INTERVAL
+        blocks and for the last block.
+        """
+        if progress and (done % VALIDATION_PROGRESS_INTERVAL == 0 or done == total):
+            progress(step, done, total)
 
 
 def main():
@@ -0,0 +1,277 @@
+import tempfile
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from backend.blockchain.block import Block
+from backend.blockchain.block_store import BlockStore, StoredChain
+from backend.blockchain.blockchain import Blockchain
+from backend.util.binary_encoding import BINARY_MIMETYPE, decode_blocks
+from backend.config import (
+    SYNC_BODIES_BATCH,
+    SYNC_HEADERS_BATCH,
+    SYNC_RETRIES,
+    SYNC_WORKERS,
+    VALIDATION_WORKERS
+)
+
+
+class ChainSync():
+    """
+    Headers-first sync of the local blockchain from a node.
+    Works through the remote chain in windows of SYNC_HEADERS_BATCH
+    blocks: the headers of a window are fetched and checked for linkage
+    and proof of work, then the bodies are fetched in parallel ranges of
+    SYNC_BODIES_BATCH blocks. The blocks of a window are validated
+    against the local state (on VALIDATION_WORKERS processes).
+    When the remote chain extends the local tip each window is appended
+    once validated. Memory is bounded by one window, and since every
+    appended block is kept by the local chain (and its block store) an
+    interrupted sync resumes from the local height.
+    When the remote chain forks from the local chain, each window is
+    validated as it arrives and staged in a temporary BlockStore, next to
+    the local block store when there is one. The local blocks after the
+    fork are rolled back only once the whole remote suffix is valid, so a
+    failed sync never shortens the chain, and memory is still bounded by
+    one window.
+    With a StateEngine blocks are validated and applied on its writer
+    thread.
+    """
+    def __init__(
+        self,
+        blockchain,
+        url,
+        workers=SYNC_WORKERS,
+        progress=print,
+        state_engine=None
+    ):
+        self.blockchain = blockchain
+        self.state_engine = state_engine
+        self.url = url
+        self.workers = workers
+        self.progress = progress
+        self.session = requests.Session()
+
+    def get(self, path, params, headers=None):
+        """
+        GET from the node, retried SYNC_RETRIES times.
+        """
+        for attempt in range(SYNC_RETRIES):
+            try:
+                response = self.session.get(
+                    f"{self.url}{path}",
+                    params=params,
+                    headers=headers,
+                    timeout=30
+                )
+                response.raise_for_status()
+                return response
+            except requests.RequestException:
+                if attempt == SYNC_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def fetch_length(self):
+        return self.get("/blockchain/length", {}).json()
+
+    def fetch_headers(self, start, count):
+        """
+        Return the headers of the remote blocks from height start.
+        """
+        return self.get(
+            "/blockchain/headers",
+            {"start": start, "count": count}
+        ).json()
+
+    def fetch_blocks(self, start, end):
+        """
+        Return the remote blocks from height start up to end.
+        """
+        response = self.get(
+            "/blockchain/blocks",
+            {"start": start, "end": end},
+            {"Accept": BINARY_MIMETYPE}
+        )
+        if response.headers.get("Content-Type", "").startswith(BINARY_MIMETYPE):
+            blocks_json = decode_blocks(response.content)
+        else:
+            blocks_json = response.json()
+
+        return [Block.from_json(block_json) for block_json in blocks_json]
+
+    def fork_height(self):
+        """
+        Return the height of the last local block that is also in the
+        remote chain, walking back from the local tip one batch at a time.
+        """
+        height = len(self.blockchain.chain) - 1
+        while height >= 0:
+            start = max(0, height - SYNC_HEADERS_BATCH + 1)
+            headers = self.fetch_headers(start, height - start + 1)
+            for offset in range(len(headers) - 1, -1, -1):
+                if self.blockchain.block_heights.get(headers[offset]["hash"]) == \
+                    start + offset:
+                    return start + offset
+            height = start - 1
+
+        raise Exception("Gesesis block must be valid")
+
+    def sync(self):
+        """
+        Sync the local chain up to the remote tip.
+        Return the number of blocks appended.
+        """
+        remote_length = self.fetch_length()
+        if remote_length <= len(self.blockchain.chain):
+            return 0
+
+        fork_height = self.fork_height()
+        start_time = time.perf_counter()
+
+        if fork_height == len(self.blockchain.chain) - 1:
+            synced = 0
+            for end, blocks in self.fetch_windows(fork_height, remote_length):
+                self.write(self.extend, fork_height + synced, blocks)
+                synced += len(blocks)
+                self.report_progress(end, remote_length, synced, start_time)
+            return synced
+
+        local_tip = self.write(self.local_tip)
+        balances, transaction_ids = self.write(self.blockchain.state_at, fork_height)
+        last_block = self.blockchain.chain[fork_height]
+        synced = 0
+        with tempfile.TemporaryDirectory(dir=self.staging_directory()) as directory:
+            staged = BlockStore(directory)
+            try:
+                for end, blocks in self.fetch_windows(fork_height, remote_length):
+                    self.write(
+                        self.validate_staged,
+                        local_tip,
+                        last_block,
+                        blocks,
+                        balances,
+                        transaction_ids
+                    )
+                    for block in blocks:
+                        staged.append(block)
+                    last_block = blocks[-1]
+                    synced += len(blocks)
+                    self.report_progress(end, remote_length, synced, start_time)
+
+                self.write(self.replace_suffix, local_tip, fork_height, StoredChain(staged))
+            finally:
+                staged.close()
+
+        return synced
+
+    def write(self, function, *args):
+        if self.state_engine is None:
+            return function(*args)
+        return self.state_engine.call(function, *args)
+
+    def staging_directory(self):
+        if self.blockchain.store is None:
+            return None
+        return self.blockchain.store.directory
+
+    def local_tip(self):
+        return len(self.blockchain.chain), self.blockchain.chain[-1].hash
+
+    @staticmethod
+    def validate(last_block, blocks, balances, transaction_ids):
+        """
+        Validate blocks following last_block, given the balances and
+        transaction ids of the chain up to it. Both are updated, so the
+        next blocks can be validated after these.
+        """
+        Blockchain.is_valid_chain_suffix(
+            [last_block, *blocks],
+            1,
+            balances,
+            transaction_ids,
+            workers=VALIDATION_WORKERS
+        )
+
+    def validate_staged(self, local_tip, last_block, blocks, balances, transaction_ids):
+        """
+        Validate a window of the remote suffix, the state views read the
+        local indices as they were at local_tip.
+        """
+        if self.local_tip() != local_tip:
+            raise Exception("The local chain changed during the sync")
+
+        self.validate(last_block, blocks, balances, transaction_ids)
+
+    def extend(self, height, blocks):
+        """
+        Validate blocks following the local tip at height and append them.
+        """
+        if height != len(self.blockchain.chain) - 1:
+            raise Exception("The local chain changed during the sync")
+
+        balances, transaction_ids = self.blockchain.state_at(height)
+        self.validate(self.blockchain.chain[height], blocks, balances, transaction_ids)
+        for block in blocks:
+            self.blockchain.apply_block(block)
+
+    def replace_suffix(self, local_tip, fork_height, blocks):
+        """
+        Replace the local blocks after fork_height with the validated
+        blocks, read one at a time from the staging store.
+        """
+        if self.local_tip() != local_tip:
+            raise Exception("The local chain changed during the sync")
+        if fork_height + 1 + len(blocks) <= len(self.blockchain.chain):
+            raise Exception("The remote chain is not longer than the local chain")
+
+        self.blockchain.rollback(fork_height)
+        for block in blocks:
+            self.blockchain.apply_block(block)
+
+    def fetch_windows(self, fork_height, remote_length):
+        """
+        Yield the remote blocks after fork_height one window at a time,
+        with the height the window ends at. Headers are checked for
+        linkage and proof of work before their bodies are fetched.
+        """
+        last_header = self.blockchain.chain[fork_height].header_json()
+        with ThreadPoolExecutor(self.workers) as executor:
+            for window_start in range(fork_height + 1, remote_length, SYNC_HEADERS_BATCH):
+                headers = self.fetch_headers(window_start, SYNC_HEADERS_BATCH)
+                if not headers:
+                    break
+                for header in headers:
+                    Block.is_valid_header(last_header, header)
+                    last_header = header
+
+                ranges = [
+                    (start, min(start + SYNC_BODIES_BATCH, window_start + len(headers)))
+                    for start in range(
+                        window_start,
+                        window_start + len(headers),
+                        SYNC_BODIES_BATCH
+                    )
+                ]
+                window = []
+                # map returns the ranges in order while fetching ahead
+                for (start, end), blocks in zip(
+                    ranges,
+                    executor.map(lambda r: self.fetch_blocks(*r), ranges)
+                ):
+                    if len(blocks) != end - start:
+                        raise Exception(f"Missing blocks from height {start}")
+                    for height, block in enumerate(blocks, start):
+                        if block.hash != headers[height - window_start]["hash"]:
+                            raise Exception(
+                                f"Block at height {height} does not match its header"
+                            )
+                    window.extend(blocks)
+
+                yield window_start + len(window), window
+
+    def report_progress(self, height, total, synced, start_time):
+        if self.progress:
+            seconds = time.perf_counter() - start_time
+            self.progress(
+                f" -- Synced {height}/{total} blocks, "
+                f"{synced / seconds if seconds else 0:.0f} blocks/s"
+            )
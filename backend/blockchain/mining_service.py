@@ -0,0 +1,224 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from backend.blockchain.parallel_miner import ParallelMiner
+from backend.wallet.transaction import Transaction
+from backend.config import (
+    MINING_JOB_HISTORY,
+    MINING_TEMPLATE_REFRESH,
+    SECONDS
+)
+
+# Why a mining job ended
+JOB_MINED = "mined"
+JOB_NEW_TIP = "new tip"
+JOB_NEW_TEMPLATE = "new template"
+JOB_STOPPED = "stopped"
+
+
+class MiningService():
+    """
+    Mine blocks in a background thread, one job per block.
+    A job mines the block template on the current tip with a
+    ParallelMiner. It is cancelled and restarted when another block
+    becomes the tip, and when the transaction pool changes (at most every
+    MINING_TEMPLATE_REFRESH). Mined blocks are appended to the chain and
+    passed to on_block, for example to broadcast them.
+    With a StateEngine jobs read and change the chain on its writer
+    thread.
+    """
+    def __init__(
+        self,
+        blockchain,
+        block_template,
+        wallet,
+        on_block=None,
+        workers=None,
+        state_engine=None
+    ):
+        self.blockchain = blockchain
+        self.state_engine = state_engine
+        self.block_template = block_template
+        self.wallet = wallet
+        self.on_block = on_block
+        self.miner = ParallelMiner(workers)
+        # Reentrant: appending a mined block calls the blockchain listener
+        self.lock = threading.RLock()
+        self.thread = None
+        self.running = False
+        # The job being mined: last block, stop event, start time and the
+        # reason it is cancelled
+        self.job = None
+        self.refresh_timer = None
+        self.jobs = 0
+        self.blocks_mined = 0
+        self.history = deque(maxlen=MINING_JOB_HISTORY)
+
+        blockchain.add_listener(self.on_blocks)
+        block_template.transaction_pool.add_listener(self.on_transaction)
+
+    def start(self):
+        """
+        Start mining, return False if already mining.
+        """
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+        return True
+
+    def stop(self, wait=True):
+        """
+        Stop mining, cancelling the current job.
+        """
+        with self.lock:
+            if not self.running:
+                return False
+            self.running = False
+            self.cancel_job(JOB_STOPPED)
+            thread = self.thread
+
+        if wait:
+            thread.join()
+
+        return True
+
+    def run(self):
+        while self.running:
+            self.mine_job()
+
+    def write(self, function, *args):
+        if self.state_engine is None:
+            return function(*args)
+        return self.state_engine.call(function, *args)
+
+    def mine_job(self):
+        """
+        Mine one block on the current tip, unless the job is cancelled.
+        """
+        job = self.write(self.new_job)
+        if job is None:
+            return
+
+        block = self.miner.mine_block(job["last_block"], job["data"], job["stop_event"])
+        block, reason = self.write(self.finish_job, job, block)
+
+        if block is not None and self.on_block:
+            self.on_block(block)
+
+        elapsed = (time.time_ns() - job["started"]) / SECONDS
+        self.history.append({
+            "height": job["height"],
+            "hash": block.hash if block else None,
+            "result": reason,
+            "transactions": job["transactions"],
+            "seconds": elapsed,
+            "hash_rate": self.miner.hash_rate()
+        })
+
+    def new_job(self):
+        """
+        Start a job on the current tip, return None when stopped.
+        """
+        with self.lock:
+            if not self.running:
+                return None
+            last_block = self.blockchain.chain[-1]
+            data = self.block_template.transaction_data()
+            data.append(Transaction.reward_transaction(self.wallet).to_json())
+            self.job = {
+                "height": len(self.blockchain.chain),
+                "last_block": last_block,
+                "data": data,
+                "stop_event": multiprocessing.get_context().Event(),
+                "started": time.time_ns(),
+                "transactions": len(data),
+                "reason": None
+            }
+            self.jobs += 1
+
+            return self.job
+
+    def finish_job(self, job, block):
+        """
+        Append the mined block if its last block is still the tip.
+        Return the appended block, or None, and why the job ended.
+        """
+        with self.lock:
+            self.job = None
+            reason = job["reason"]
+            if block is not None:
+                if self.blockchain.chain[-1].hash == job["last_block"].hash:
+                    reason = JOB_MINED
+                    self.blockchain.apply_block(block)
+                    self.blocks_mined += 1
+                else:
+                    block = None
+                    reason = reason or JOB_NEW_TIP
+
+            return block, reason
+
+    def cancel_job(self, reason):
+        """
+        Cancel the current job, called with the lock held.
+        """
+        if self.job is not None and self.job["reason"] is None:
+            self.job["reason"] = reason
+            self.job["stop_event"].set()
+
+    def on_blocks(self, added, removed):
+        """
+        Blockchain listener: restart on the new tip.
+        """
+        with self.lock:
+            if self.job is not None and \
+                self.blockchain.chain[-1].hash != self.job["last_block"].hash:
+                self.cancel_job(JOB_NEW_TIP)
+
+    def on_transaction(self, transaction, removed_id):
+        """
+        TransactionPool listener: restart with the new template, at most
+        every MINING_TEMPLATE_REFRESH.
+        """
+        with self.lock:
+            if self.job is None or self.refresh_timer is not None:
+                return
+            wait = MINING_TEMPLATE_REFRESH - (time.time_ns() - self.job["started"])
+            if wait <= 0:
+                self.cancel_job(JOB_NEW_TEMPLATE)
+                return
+            self.refresh_timer = threading.Timer(wait / SECONDS, self.refresh_template)
+            self.refresh_timer.daemon = True
+            self.refresh_timer.start()
+
+    def refresh_template(self):
+        with self.lock:
+            self.refresh_timer = None
+            self.cancel_job(JOB_NEW_TEMPLATE)
+
+    def status(self):
+        """
+        Return whether mining runs, the current job and the recent jobs.
+        """
+        with self.lock:
+            current_job = None
+            if self.job is not None:
+                current_job = {
+                    "height": self.job["height"],
+                    "last_hash": self.job["last_block"].hash,
+                    "transactions": self.job["transactions"],
+                    "seconds": (time.time_ns() - self.job["started"]) / SECONDS
+                }
+
+            return {
+                "running": self.running,
+                "workers": self.miner.workers,
+                "jobs": self.jobs,
+                "blocks_mined": self.blocks_mined,
+                "current_job": current_job,
+                "recent_jobs": list(self.history)
+            }
@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+import queue
+import time
+from backend.blockchain.block import Block
+from backend.blockchain.block_header import (
+    BLOCK_VERSION,
+    digest_with_midstate,
+    header_midstate
+)
+from backend.util.proof_of_work import difficulty_to_target, digest_meets_target
+from backend.config import MINING_WORKERS, MINING_STOP_CHECK_INTERVAL, SECONDS
+
+
+def mine_worker(worker_id, step, last_block, data, stop_event, result_queue):
+    """
+    Search every step-th nonce starting at worker_id.
+    Put the mined block (if found) and the worker stats on the result queue.
+    """
+    start_time = time.time_ns()
+    last_hash = last_block.hash
+    root = Block.calculate_merkle_root(data)
+    midstate = header_midstate(BLOCK_VERSION, last_hash, root)
+    nonce = worker_id
+    hashes = 0
+    block = None
+
+    while True:
+        if hashes % MINING_STOP_CHECK_INTERVAL == 0 and stop_event.is_set():
+            break
+
+        timestamp = time.time_ns()
+        difficulty = Block.adjust_difficulty(last_block, timestamp)
+        digest = digest_with_midstate(midstate, timestamp, difficulty, nonce)
+        hashes += 1
+
+        if digest_meets_target(digest, difficulty_to_target(difficulty)):
+            block = Block(
+                timestamp,
+                last_hash,
+                digest.hex(),
+                data,
+                difficulty,
+                nonce,
+                BLOCK_VERSION,
+                root
+            )
+            # Cancel the other workers right away
+            stop_event.set()
+            break
+
+        nonce += step
+
+    elapsed = (time.time_ns() - start_time) / SECONDS
+    result_queue.put({
+        "worker": worker_id,
+        "block": block.to_json() if block else None,
+        "hashes": hashes,
+        "seconds": elapsed,
+        "hash_rate": hashes / elapsed if elapsed > 0 else 0
+    })
+
+
+class ParallelMiner():
+    """
+    Mine blocks on several cores.
+    The nonce space is split across a pool of worker processes, worker i
+    tries nonces i, i + workers, i + 2 * workers ...
+    The first valid block wins and the other workers are cancelled.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or MINING_WORKERS or os.cpu_count() or 1
+        # Per worker stats of the last run: hashes, seconds and hash_rate
+        self.stats = []
+
+    def mine_block(self, last_block, data, stop_event=None):
+        """
+        Mine block based on last block and data.
+        Return None if stop_event is set before a block is found.
+        """
+        context = multiprocessing.get_context()
+        stop_event = stop_event or context.Event()
+        result_queue = context.Queue()
+
+        processes = [
+            context.Process(
+                target=mine_worker,
+                args=(i, self.workers, last_block, data, stop_event, result_queue),
+                daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        # Every worker reports exactly once, either with a block or when
+        # cancelled. Read before join so no worker blocks on a full pipe.
+        results = []
+        while len(results) < self.workers:
+            workers_alive = any(process.is_alive() for process in processes)
+            try:
+                results.append(result_queue.get(timeout=1))
+            except queue.Empty:
+                if not workers_alive:
+                    raise Exception("Mining workers exited without a result")
+
+        for process in processes:
+            process.join()
+
+        results.sort(key=lambda result: result["worker"])
+        self.stats = [
+            {key: value for key, value in result.items() if key != "block"}
+            for result in results
+        ]
+
+        # Several workers may hit a valid nonce before seeing the stop event,
+        # pick the earliest one so the result does not depend on scheduling.
+        found = [result["block"] for result in results if result["block"]]
+        if not found:
+            return None
+
+        return Block.from_json(min(found, key=lambda block: block["timestamp"]))
+
+    def hash_rate(self):
+        """
+        Total hashes per second of the last run over all workers.
+        """
+        return sum(stat["hash_rate"] for stat in self.stats)
+
+
+def main():
+    miner = ParallelMiner()
+    genesis_block = Block.genesis()
+    block = miner.mine_block(genesis_block, "foo")
+    Block.is_valid_block(genesis_block, block)
+    print(block)
+    for stat in miner.stats:
+        print(f"worker {stat['worker']}: {stat['hash_rate']:.0f} hashes/s")
+
+if __name__ == "__main__":
+    main()
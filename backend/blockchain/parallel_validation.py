@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.transaction import Transaction
+from backend.config import VALIDATION_CHUNK_SIZE
+
+
+def validate_chunk(start, blocks):
+    """
+    Check the blocks of a chunk that do not depend on chain state:
+    hash, proof of work and link to the previous block, and for each
+    transaction the output values and signature.
+    blocks[0] is the block before height start.
+    Return the first failure as (height, message), or None.
+    """
+    for offset in range(1, len(blocks)):
+        height = start + offset - 1
+        block = blocks[offset]
+        try:
+            Block.is_valid_block(blocks[offset - 1], block)
+            for transaction_json in block.data:
+                Transaction.is_valid(Transaction.from_json(transaction_json))
+        except Exception as e:
+            return height, str(e)
+
+    return None
+
+
+def is_valid_chain_suffix_parallel(
+    chain,
+    start,
+    balances,
+    transaction_ids,
+    workers,
+    progress=None
+):
+    """
+    Validate the blocks of the chain from height start on a pool of
+    worker processes.
+    Chunks of VALIDATION_CHUNK_SIZE blocks are checked in parallel, while
+    the stateful checks (unique transactions, mining rewards and balances)
+    run sequentially in this process.
+    The lowest failing height is reported, at equal heights the failure
+    found by the workers. Return the seconds spent per validation step.
+    """
+    timings = Blockchain.validation_timings()
+    executor = ProcessPoolExecutor(workers)
+    try:
+        futures = [
+            (chunk_start, executor.submit(
+                validate_chunk,
+                chunk_start,
+                chain[chunk_start - 1:chunk_start + VALIDATION_CHUNK_SIZE]
+            ))
+            for chunk_start in range(start, len(chain), VALIDATION_CHUNK_SIZE)
+        ]
+
+        # Stateful checks while the workers run
+        failure = None
+        for height in range(start, len(chain)):
+            block = chain[height]
+            try:
+                transaction_ids.update(Blockchain.is_valid_block_transactions(
+                    block,
+                    balances,
+                    transaction_ids,
+                    timings,
+                    check_transactions=False
+                ))
+            except Exception as e:
+                failure = (height, str(e))
+                break
+            Blockchain.apply_block_balances(balances, block)
+            Blockchain.report_progress(progress, "transactions", height + 1, len(chain))
+
+        start_time = time.perf_counter()
+        for chunk_start, future in futures:
+            if failure and chunk_start > failure[0]:
+                break
+            chunk_failure = future.result()
+            chunk_end = min(chunk_start + VALIDATION_CHUNK_SIZE, len(chain))
+            Blockchain.report_progress(progress, "blocks", chunk_end, len(chain))
+            if chunk_failure and (not failure or chunk_failure[0] <= failure[0]):
+                failure = chunk_failure
+                break
+        timings["blocks"] = time.perf_counter() - start_time
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if failure:
+        raise Exception(failure[1])
+
+    return timings
@@ -0,0 +1,50 @@
+import json
+import threading
+from collections import OrderedDict
+from backend.util.binary_encoding import encode_blocks_item
+from backend.config import SERIALIZED_BLOCK_CACHE_SIZE
+
+
+class SerializedBlockCache():
+    """
+    Least recently used cache of the serialized bytes of blocks.
+    A block does not change once it is in the chain, so it is serialized
+    once per format and keyed by its hash, which stays correct across
+    chain reorgs.
+    """
+    def __init__(self, size=SERIALIZED_BLOCK_CACHE_SIZE):
+        self.size = size
+        self.cache = OrderedDict()
+        # Requests are served from several threads
+        self.lock = threading.Lock()
+
+    def get(self, block, encoding):
+        key = (block.hash, encoding.__name__)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        serialized = encoding(block.to_json())
+        with self.lock:
+            self.cache[key] = serialized
+            while len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+        return serialized
+
+    def json_bytes(self, block):
+        """
+        Return the block as a json document.
+        """
+        return self.get(block, encode_json)
+
+    def binary_bytes(self, block):
+        """
+        Return the block as an item of a binary list of blocks.
+        """
+        return self.get(block, encode_blocks_item)
+
+
+def encode_json(block_json):
+    return json.dumps(block_json).encode("utf-8")
@@ -0,0 +1,145 @@
+import copy
+import queue
+import threading
+from concurrent.futures import Future
+from backend.blockchain.blockchain import Blockchain
+from backend.config import KNOWN_ADDRESSES_LIMIT, STATE_QUEUE_SIZE
+
+
+class StateSnapshot():
+    """
+    Immutable view of the chain tip and the transaction pool, read by
+    request threads without locks.
+    """
+    def __init__(self, version, blockchain, transaction_pool):
+        self.version = version
+        chain = blockchain.chain
+        # Blocks do not change once appended, so copying the list only
+        # copies references. A stored chain is read from disk through a
+        # view pinned to the snapshot length and tip.
+        self.chain = chain[:] if isinstance(chain, list) else chain.pinned(len(chain))
+        self.length = len(chain)
+        self.tip = chain[-1]
+        # The chain replaces its address list rather than changing it
+        self.addresses = blockchain.addresses
+        # Live index, only a hint: lookups are checked against the blocks
+        self.transaction_heights = blockchain.transaction_heights
+        # Copied, the pool updates its transactions in place
+        self.transactions = copy.deepcopy(transaction_pool.transaction_data())
+        self.pool_stats = transaction_pool.stats()
+
+    def known_addresses(self, prefix="", after=None, limit=KNOWN_ADDRESSES_LIMIT):
+        """
+        Return a page of the known addresses, see Blockchain.known_addresses.
+        """
+        return Blockchain.page_addresses(self.addresses, prefix, after, limit)
+
+    def find_transaction(self, transaction_id):
+        """
+        Return the snapshot block that records the transaction, or None.
+        Also None when a later change moved the transaction out of the
+        live index, a stale snapshot never returns a wrong block.
+        """
+        height = self.transaction_heights.get(transaction_id)
+        if height is None or height >= self.length:
+            return None
+
+        block = self.chain[height]
+        if isinstance(block.data, list) and any(
+            transaction["id"] == transaction_id for transaction in block.data
+        ):
+            return block
+
+        return None
+
+
+class StateEngine():
+    """
+    Single writer of the blockchain and the transaction pool.
+    Changes are submitted to a queue (at most STATE_QUEUE_SIZE, submit
+    blocks when full) and run one at a time on the writer thread, in
+    submission order. After a change the writer publishes a StateSnapshot
+    of the new state, before the submitter gets the result. Readers use
+    snapshot(), the last published snapshot, and never wait for the
+    writer.
+    """
+    def __init__(self, blockchain, transaction_pool, queue_size=STATE_QUEUE_SIZE):
+        self.blockchain = blockchain
+        self.transaction_pool = transaction_pool
+        self.queue = queue.Queue(queue_size)
+        # Counts the changes, told by the chain and pool listeners
+        self.version = 0
+        self.last_snapshot = StateSnapshot(self.version, blockchain, transaction_pool)
+
+        blockchain.add_listener(self.on_blocks)
+        transaction_pool.add_listener(self.on_transaction)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Run function on the writer thread, return a Future of its result.
+        Called on the writer thread, function runs right away.
+        """
+        future = Future()
+        if threading.current_thread() is self.thread:
+            self.execute(future, function, args, kwargs)
+        else:
+            self.queue.put((future, function, args, kwargs))
+
+        return future
+
+    def call(self, function, *args, **kwargs):
+        """
+        Run function on the writer thread and return its result.
+        """
+        return self.submit(function, *args, **kwargs).result()
+
+    def run(self):
+        while True:
+            future, function, args, kwargs = self.queue.get()
+            self.execute(future, function, args, kwargs, self.publish_snapshot)
+
+    @staticmethod
+    def execute(future, function, args, kwargs, done=None):
+        """
+        Run a change and set its future, calling done first.
+        """
+        if not future.set_running_or_notify_cancel():
+            return
+        result, error = None, None
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            error = e
+
+        if done is not None:
+            done()
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def on_blocks(self, added, removed):
+        self.version += 1
+
+    def on_transaction(self, transaction, removed_id):
+        self.version += 1
+
+    def snapshot(self):
+        """
+        Return the snapshot published after the last change.
+        """
+        return self.last_snapshot
+
+    def publish_snapshot(self):
+        """
+        Build and publish the snapshot of the state, on the writer thread
+        between changes, when a change was made.
+        """
+        if self.last_snapshot.version != self.version:
+            self.last_snapshot = StateSnapshot(
+                self.version,
+                self.blockchain,
+                self.transaction_pool
+            )
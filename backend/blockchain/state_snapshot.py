@@ -0,0 +1,36 @@
+import json
+import os
+
+# Snapshot of the chain state derived from the blocks, so a node can
+# start from it and replay only the blocks after it
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "snapshot.json"
+
+
+def write_snapshot(path, snapshot):
+    """
+    Write a snapshot atomically: to a temporary file that is fsynced and
+    then renamed over the previous snapshot.
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as snapshot_file:
+        json.dump({"version": SNAPSHOT_VERSION, **snapshot}, snapshot_file)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_snapshot(path):
+    """
+    Return the snapshot at path, or None if there is no usable snapshot.
+    """
+    try:
+        with open(path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    return snapshot
@@ -4,8 +4,106 @@ MILLISECONDS = 1000 * MICROSECONDS
 SECONDS = 1000 * MILLISECONDS
 
 MINE_RATE = 4 * SECONDS
+# Leading zero bits the difficulty moves per block, fractions such as
+# 0.25 give finer steps
+DIFFICULTY_STEP = 1
 
 STRATING_BALANCE = 1000
 
 MINING_REWARD = 50
 MINING_REWARD_INPUT = {"address": "*--official-mining-reward--*"}
+
+# Worker processes for parallel mining, None uses every core
+MINING_WORKERS = None
+# Nonces tried by a mining worker between checks for cancellation
+MINING_STOP_CHECK_INTERVAL = 256
+
+# Blocks validated between calls to a validation progress callback
+VALIDATION_PROGRESS_INTERVAL = 1000
+
+# Recent blocks that keep the data to roll them back in a reorg,
+# deeper reorgs rebuild the chain state from genesis
+REORG_UNDO_DEPTH = 100
+
+# Worker processes for parallel chain validation (None or 1 validates
+# in process) and the number of blocks each worker checks per task
+VALIDATION_WORKERS = None
+VALIDATION_CHUNK_SIZE = 100
+
+# Parsed public keys kept in the Wallet.verify cache
+PUBLIC_KEY_CACHE_SIZE = 1024
+
+# Block store: maximum bytes per segment file, blocks appended between
+# fsyncs, and decoded blocks kept in memory when reading from the store
+BLOCK_STORE_SEGMENT_SIZE = 64 * 1024 * 1024
+BLOCK_STORE_SYNC_INTERVAL = 16
+BLOCK_CACHE_SIZE = 256
+
+# Blocks between snapshots of the chain state kept with a block store
+SNAPSHOT_INTERVAL = 1000
+
+# Headers-first peer sync: headers per request (and per sync window),
+# blocks per body request, parallel body requests and retries per request
+SYNC_HEADERS_BATCH = 2000
+SYNC_BODIES_BATCH = 100
+SYNC_WORKERS = 4
+SYNC_RETRIES = 3
+
+# Serialized blocks (json and binary) kept for the blockchain endpoints
+SERIALIZED_BLOCK_CACHE_SIZE = 4096
+
+# Maximum addresses returned per page of /known-addresses
+KNOWN_ADDRESSES_LIMIT = 1000
+
+# Transaction pool caps: transactions, bytes of transaction json and age.
+# Over a cap, "oldest" or "lowest_amount" transactions are evicted first
+TRANSACTION_POOL_MAX_COUNT = 5000
+TRANSACTION_POOL_MAX_BYTES = 5 * 1024 * 1024
+TRANSACTION_POOL_MAX_AGE = 10 * 60 * SECONDS
+TRANSACTION_POOL_EVICTION = "oldest"
+
+# Block template limits on the pool transactions of a mined block (the
+# mining reward is added on top): transactions and bytes of json
+BLOCK_MAX_TRANSACTIONS = 1000
+BLOCK_MAX_BYTES = 1024 * 1024
+
+# Background mining: the least time between restarts of a mining job for
+# a changed transaction pool, and the finished jobs kept for the status
+MINING_TEMPLATE_REFRESH = 1 * SECONDS
+MINING_JOB_HISTORY = 10
+
+# TCP transport: frames queued per peer while it is down or slow, the
+# backoff between reconnects, and the largest frame accepted
+TCP_SEND_QUEUE_SIZE = 1000
+TCP_RECONNECT_MIN = 100 * MILLISECONDS
+TCP_RECONNECT_MAX = 10 * SECONDS
+TCP_MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# PubSub outbound queue: messages waiting to be published (publishing
+# blocks when full) and messages sent per batch
+PUBLISH_QUEUE_SIZE = 10000
+PUBLISH_BATCH_SIZE = 20
+# Most json bytes per published batch, below the 32 KB PubNub message
+# limit with room for its encoding, and the retries of a failed publish
+PUBLISH_BATCH_BYTES = 24 * 1024
+PUBLISH_RETRIES = 3
+PUBLISH_RETRY_DELAY = 100 * MILLISECONDS
+
+# Inventory gossip: block and transaction ids remembered as seen or
+# requested, and the time before an unanswered request is sent again
+GOSSIP_SEEN_SIZE = 100000
+GOSSIP_REQUEST_TIMEOUT = 5 * SECONDS
+
+# Compact blocks waiting for the transactions missing from the pool
+COMPACT_BLOCK_PENDING = 100
+
+# Changes of the chain and pool waiting for the state engine writer
+STATE_QUEUE_SIZE = 10000
+
+# ASGI server: executor threads running requests, body bytes sent per
+# executor round trip, and the cached snapshot route responses (at most
+# ASGI_CACHE_BODY_SIZE bytes each)
+ASGI_WORKERS = 32
+ASGI_CHUNK_SIZE = 64 * 1024
+ASGI_RESPONSE_CACHE_SIZE = 1000
+ASGI_CACHE_BODY_SIZE = 256 * 1024
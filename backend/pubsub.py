@@ -1,91 +1,516 @@
+import copy
+import json
+import queue
+import threading
 import time
-from pubnub.pubnub import PubNub
-from pubnub.pnconfiguration import PNConfiguration
-from pubnub.callbacks import SubscribeCallback
-from pubnub.enums import PNReconnectionPolicy
+import uuid
 from backend.blockchain.block import Block
 from backend.wallet.transaction import Transaction
-
-pnconfig = PNConfiguration()
-pnconfig.subscribe_key = 'sub-c-78070285-db89-4898-a7e7-d4731855cafa'
-pnconfig.publish_key = 'pub-c-c12b168a-f8e1-4458-9413-522ec2713d12'
-## Below for new version of pubsub (ran into issues so I downgraded)
-#pnconfig.user_id = "g"
-#pnconfig.reconnect_policy = PNReconnectionPolicy.LINEAR
+from backend.util.bounded_cache import BoundedCache
+from backend.util.crypto_hash import crypto_hash
+from backend.config import (
+    COMPACT_BLOCK_PENDING,
+    GOSSIP_REQUEST_TIMEOUT,
+    GOSSIP_SEEN_SIZE,
+    MINING_REWARD_INPUT,
+    PUBLISH_BATCH_BYTES,
+    PUBLISH_BATCH_SIZE,
+    PUBLISH_QUEUE_SIZE,
+    PUBLISH_RETRIES,
+    PUBLISH_RETRY_DELAY,
+    SECONDS
+)
 
 CHANNELS = {
 "TEST": "TEST",
 "BLOCK": "BLOCK",
-"TRANSACTION": "TRANSACTION"
+"TRANSACTION": "TRANSACTION",
+"INV": "INV",
+"GETDATA": "GETDATA",
+"CMPCTBLOCK": "CMPCTBLOCK",
+"GETBLOCKTXN": "GETBLOCKTXN",
+"BLOCKTXN": "BLOCKTXN"
 }
 
-class Listener(SubscribeCallback):
-    def __init__(self, blockchain, transaction_pool):
+# Length of the short transaction ids of compact blocks, in hex digits
+SHORT_ID_LENGTH = 12
+
+class PubSub():
+    """
+    Handles the publish/subscribe layer of the application.
+    Provide communication between nodes of the blockchain network.
+    Messages travel over a pluggable transport (backend.transport),
+    PubNub by default.
+    Published messages are queued (at most PUBLISH_QUEUE_SIZE, publish
+    blocks when full) and sent from a background thread in batches per
+    channel of up to PUBLISH_BATCH_BYTES of json, tagged with the node id
+    so a node drops its own messages.
+    Blocks and transactions are gossiped by inventory: a node announces
+    their ids on INV, a node that has not seen them asks the announcer on
+    GETDATA, and the announcer publishes the bodies on BLOCK and
+    TRANSACTION. Transactions are announced by version, an updated
+    transaction keeps its id. Requests and their replies name the node they are for
+    in "to", other nodes skip them. Accepted bodies are announced again,
+    so they spread over transports that only reach some of the nodes.
+    Blocks are sent compact on CMPCTBLOCK: the header, the reward
+    transactions and a short id for every other transaction. The
+    receiver rebuilds the block from its transaction pool and asks the
+    sender for the missing transactions only (GETBLOCKTXN, BLOCKTXN).
+    With a StateEngine received messages are handled on its writer
+    thread.
+    """
+    def __init__(
+        self,
+        blockchain,
+        transaction_pool,
+        transport=None,
+        state_engine=None
+    ):
         self.blockchain = blockchain
         self.transaction_pool = transaction_pool
+        self.state_engine = state_engine
+        if transport is None:
+            # Imported here so other transports do not need pubnub
+            from backend.transport.pubnub_transport import PubNubTransport
+            transport = PubNubTransport(CHANNELS.values())
+        self.transport = transport
+        self.node_id = uuid.uuid4().hex
+        self.outbound = queue.Queue(PUBLISH_QUEUE_SIZE)
+        # Ids of the blocks and transactions this node has, and of the
+        # ones requested (id -> time of the request)
+        self.seen = BoundedCache(GOSSIP_SEEN_SIZE)
+        self.requested = BoundedCache(GOSSIP_SEEN_SIZE)
+        # (transaction id, input timestamp) -> short id of that version
+        self.short_ids = BoundedCache(GOSSIP_SEEN_SIZE)
+        # block hash -> compact block waiting for transactions
+        self.pending_blocks = BoundedCache(COMPACT_BLOCK_PENDING)
+        threading.Thread(target=self.run_publisher, daemon=True).start()
+        self.transport.start(self.message)
 
-    def message(self, pubnub, message_object):
-        print(f"\n-- Channel: {message_object.channel}, Message: {message_object.message}")
+    def message(self, channel, message):
+        """
+        Handle a batch of messages from another node.
+        """
+        origin = None
+        if isinstance(message, dict) and "origin" in message:
+            origin = message["origin"]
+            if origin == self.node_id:
+                return
+            messages = message["messages"]
+        else:
+            # Untagged message, from a node publishing one at a time
+            messages = [message]
 
-        if message_object.channel == CHANNELS["BLOCK"]:
-            block = Block.from_json(message_object.message)
-            potential_chain = self.blockchain.chain[:]
-            potential_chain.append(block)
-            try:
-                self.blockchain.replace_chain(potential_chain)
-                # Clear transaction pool after new block (if transactions
-                # already in a new block)
-                self.transaction_pool.clear_blockchain_transactions(
-                    self.blockchain
-                )
-                print("\n -- Successfully replaced local chain")
-            except Exception as e:
-                print(f"\n -- Did not replace chain: {e}")
+        for message in messages:
+            if self.state_engine is None:
+                self.handle_message(channel, message, origin)
+            else:
+                self.state_engine.submit(
+                    self.handle_message, channel, message, origin
+                ).add_done_callback(self.report_error)
+
+    @staticmethod
+    def report_error(future):
+        if future.exception() is not None:
+            print(f"\n -- Error handling message: {future.exception()}")
+
+    def handle_message(self, channel, message, origin=None):
+        """
+        Handle a message from another node.
+        """
+        to = message.get("to") if isinstance(message, dict) else None
+        if to is not None and to != self.node_id:
+            return
+
+        if channel == CHANNELS["INV"]:
+            self.handle_inventory(message, origin)
+
+        elif channel == CHANNELS["GETDATA"]:
+            if to == self.node_id:
+                self.handle_getdata(message, origin)
+
+        elif channel == CHANNELS["CMPCTBLOCK"]:
+            self.handle_compact_block(message, origin)
+
+        elif channel == CHANNELS["GETBLOCKTXN"]:
+            if to == self.node_id:
+                self.handle_getblocktxn(message, origin)
+
+        elif channel == CHANNELS["BLOCKTXN"]:
+            if to == self.node_id:
+                self.handle_blocktxn(message)
+
+        elif channel == CHANNELS["BLOCK"]:
+            # A reply to a request, or a block broadcast whole
+            message = message.get("block", message)
+            if message["hash"] in self.seen:
+                return
+            print(f"\n-- Channel: {channel}, Message: {message}")
+            self.accept_block(Block.from_json(message))
         
-        elif message_object.channel == CHANNELS["TRANSACTION"]:
-            transaction = Transaction.from_json(message_object.message)
+        elif channel == CHANNELS["TRANSACTION"]:
+            message = message.get("transaction", message)
+            version = PubSub.transaction_version(message)
+            if self.has_transaction(version):
+                return
+            print(f"\n-- Channel: {channel}, Message: {message}")
+            transaction = Transaction.from_json(message)
             self.transaction_pool.set_transaction(transaction)
             print("\n -- Set the new transaction in transaction pool")
+            self.announce("transactions", version)
 
-class PubSub():
-    """
-    Handles the publish/subscribe layer of the application.
-    Provide communication between nodes of the blockchain network.
-    """
-    def __init__(self, blockchain, transaction_pool):
-        self.pubnub = PubNub(pnconfig)
-        self.pubnub.subscribe().channels(CHANNELS.values()).execute()
-        self.pubnub.add_listener(Listener(blockchain, transaction_pool))
+    def accept_block(self, block):
+        """
+        Append a block from another node, return whether it was appended.
+        """
+        try:
+            # Validated against the local tip only, the transaction
+            # pool is updated by its blockchain listener
+            self.blockchain.append_block(block)
+            print("\n -- Successfully replaced local chain")
+            self.announce("blocks", block.hash)
+            return True
+        except Exception as e:
+            print(f"\n -- Did not replace chain: {e}")
+            return False
+
+    def has_block(self, hash):
+        return hash in self.seen or hash in self.blockchain.block_heights
+
+    def has_transaction(self, version):
+        """
+        Whether this node has seen the version of a transaction, pools the
+        same or a later version, or has it in a block.
+        """
+        transaction_id, _, timestamp = version.partition(":")
+        if version in self.seen or transaction_id in self.blockchain.transaction_heights:
+            return True
+
+        pooled = self.transaction_pool.transaction_map.get(transaction_id)
+        return pooled is not None and (
+            not timestamp.isdigit() or pooled.input["timestamp"] >= int(timestamp)
+        )
+
+    @staticmethod
+    def transaction_version(transaction_json):
+        """
+        Return the inventory id of a version of a transaction: its id and
+        the timestamp of its signed input, which an update changes.
+        """
+        return f"{transaction_json['id']}:{transaction_json['input']['timestamp']}"
+
+    def handle_inventory(self, message, origin):
+        """
+        Ask the announcing node for the blocks and transactions this node
+        does not have and has not requested in the last
+        GOSSIP_REQUEST_TIMEOUT.
+        """
+        now = time.time_ns()
+        wanted = {"blocks": [], "transactions": []}
+        for kind, has in [
+            ("blocks", self.has_block),
+            ("transactions", self.has_transaction)
+        ]:
+            for id in message.get(kind, []):
+                if has(id) or now - self.requested.get(id, 0) < GOSSIP_REQUEST_TIMEOUT:
+                    continue
+                self.requested[id] = now
+                wanted[kind].append(id)
+
+        if origin is not None and (wanted["blocks"] or wanted["transactions"]):
+            self.publish(CHANNELS["GETDATA"], {"to": origin, **wanted})
+
+    def handle_getdata(self, message, origin):
+        """
+        Publish the requested bodies this node has to the requester,
+        blocks compact.
+        """
+        for hash in message.get("blocks", []):
+            height = self.blockchain.block_heights.get(hash)
+            if height is None:
+                continue
+            block = self.blockchain.chain[height]
+            # A rebuilt block is checked against its merkle root
+            if isinstance(block.data, list) and block.merkle_root:
+                self.publish(CHANNELS["CMPCTBLOCK"], {
+                    "to": origin,
+                    **self.compact_block(block)
+                })
+            else:
+                self.publish(CHANNELS["BLOCK"], {"to": origin, "block": block.to_json()})
+
+        for version in message.get("transactions", []):
+            transaction = self.find_transaction(version.partition(":")[0])
+            if transaction is not None:
+                self.publish(CHANNELS["TRANSACTION"], {
+                    "to": origin,
+                    "transaction": transaction
+                })
+
+    def short_id(self, transaction_json):
+        """
+        Return the short id of a version of a transaction. Its id stays
+        the same when the transaction is updated, the short id does not.
+        """
+        key = (transaction_json["id"], transaction_json["input"].get("timestamp"))
+        short_id = self.short_ids.get(key)
+        if short_id is None:
+            short_id = crypto_hash(transaction_json)[:SHORT_ID_LENGTH]
+            self.short_ids[key] = short_id
+
+        return short_id
+
+    def compact_block(self, block):
+        """
+        Return the compact form of a block: its header, the reward
+        transactions by index and the short ids of the others.
+        """
+        short_ids = []
+        prefilled = []
+        for index, transaction_json in enumerate(block.data):
+            if transaction_json["input"] == MINING_REWARD_INPUT:
+                # No other node has it in its pool
+                short_ids.append(None)
+                prefilled.append([index, transaction_json])
+            else:
+                short_ids.append(self.short_id(transaction_json))
+
+        return {
+            "header": block.header_json(),
+            "short_ids": short_ids,
+            "prefilled": prefilled
+        }
+
+    def handle_compact_block(self, message, origin):
+        """
+        Rebuild a compact block from the transaction pool, and append it
+        or ask the sender for the missing transactions.
+        """
+        hash = message["header"]["hash"]
+        if self.has_block(hash) or hash in self.pending_blocks:
+            return
+
+        data = [None] * len(message["short_ids"])
+        for index, transaction_json in message["prefilled"]:
+            data[index] = transaction_json
+
+        pooled = {
+            self.short_id(transaction_json): transaction_json
+            for transaction_json in (
+                transaction.to_json()
+                for transaction in list(self.transaction_pool.transaction_map.values())
+            )
+        }
+        for index, short_id in enumerate(message["short_ids"]):
+            if data[index] is None and short_id in pooled:
+                # Copied, the pool updates its transactions in place
+                data[index] = copy.deepcopy(pooled[short_id])
+
+        pending = {
+            "header": message["header"],
+            "data": data,
+            "origin": origin,
+            "retried": False
+        }
+        missing = [index for index, transaction_json in enumerate(data) if transaction_json is None]
+        if missing:
+            self.request_block_transactions(hash, pending, missing)
+        else:
+            self.complete_block(pending)
+
+    def request_block_transactions(self, hash, pending, indexes):
+        if pending["origin"] is None:
+            return
+        self.pending_blocks[hash] = pending
+        self.publish(CHANNELS["GETBLOCKTXN"], {
+            "to": pending["origin"],
+            "hash": hash,
+            "indexes": indexes
+        })
+
+    def complete_block(self, pending):
+        """
+        Append a rebuilt block. A short id may match another pool
+        transaction, so a block whose transactions do not match its
+        merkle root is requested again with all its transactions, once.
+        """
+        header = pending["header"]
+        if Block.calculate_merkle_root(pending["data"]) != header["merkle_root"]:
+            if not pending["retried"]:
+                pending["retried"] = True
+                self.request_block_transactions(
+                    header["hash"],
+                    pending,
+                    list(range(len(pending["data"])))
+                )
+            return
+
+        self.accept_block(Block.from_json({**header, "data": pending["data"]}))
+
+    def handle_getblocktxn(self, message, origin):
+        """
+        Publish the requested transactions of a block to the requester.
+        """
+        height = self.blockchain.block_heights.get(message["hash"])
+        if height is None or origin is None:
+            return
+
+        data = self.blockchain.chain[height].data
+        self.publish(CHANNELS["BLOCKTXN"], {
+            "to": origin,
+            "hash": message["hash"],
+            "indexes": message["indexes"],
+            "transactions": [data[index] for index in message["indexes"]]
+        })
+
+    def handle_blocktxn(self, message):
+        pending = self.pending_blocks.pop(message["hash"], None)
+        if pending is None:
+            return
+
+        for index, transaction_json in zip(message["indexes"], message["transactions"]):
+            pending["data"][index] = transaction_json
+        self.complete_block(pending)
+
+    def find_transaction(self, transaction_id):
+        """
+        Return the json of a pooled or mined transaction, or None.
+        """
+        transaction = self.transaction_pool.transaction_map.get(transaction_id)
+        if transaction is not None:
+            return transaction.to_json()
+
+        block = self.blockchain.find_transaction(transaction_id)
+        if block is not None:
+            for transaction_json in block.data:
+                if transaction_json["id"] == transaction_id:
+                    return transaction_json
+
+        return None
+
+    def announce(self, kind, id):
+        """
+        Announce a block hash (kind "blocks") or a transaction version
+        (kind "transactions", see transaction_version) this node has.
+        """
+        self.seen[id] = True
+        self.publish(CHANNELS["INV"], {kind: [id]})
 
     def publish(self, channel, message):
         """
-        Publish the message object to the channel.
+        Queue the message object to be published to the channel.
+        """
+        # Copied, the object may change before it is sent
+        self.outbound.put((channel, copy.deepcopy(message)))
+
+    def run_publisher(self):
+        """
+        Publish the queued messages, up to PUBLISH_BATCH_SIZE at a time.
         """
-        # NOTE Unsubscribe before publish so that we do not receive
-        # the block over pubsub. Block added locally already.
-        self.pubnub.unsubscribe().channels([channel]).execute()
-        self.pubnub.publish().channel(channel).message(message).sync()
-        # Subscribe again
-        self.pubnub.subscribe().channels([channel]).execute()
+        while True:
+            batch = [self.outbound.get()]
+            while len(batch) < PUBLISH_BATCH_SIZE:
+                try:
+                    batch.append(self.outbound.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.publish_batch(batch)
+            except Exception as e:
+                print(f"\n -- Error publishing: {e}")
+            finally:
+                for item in batch:
+                    self.outbound.task_done()
+
+    def publish_batch(self, batch):
+        """
+        Publish tagged messages per channel and node they are for ("to"),
+        in the order of their first message, split to stay within
+        PUBLISH_BATCH_BYTES.
+        """
+        groups = {}
+        for channel, message in batch:
+            to = message.get("to") if isinstance(message, dict) else None
+            groups.setdefault((channel, to), []).append(message)
+
+        for (channel, to), messages in groups.items():
+            for chunk in PubSub.split_by_size(messages):
+                self.publish_messages(channel, chunk, to)
+
+    @staticmethod
+    def split_by_size(messages, max_bytes=PUBLISH_BATCH_BYTES):
+        """
+        Split messages into runs of up to max_bytes of json. A larger
+        message is a run of its own.
+        """
+        chunk = []
+        size = 0
+        for message in messages:
+            message_size = len(json.dumps(message)) + 1
+            if chunk and size + message_size > max_bytes:
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(message)
+            size += message_size
+
+        if chunk:
+            yield chunk
+
+    def publish_messages(self, channel, messages, to=None):
+        """
+        Publish one tagged message, retried PUBLISH_RETRIES times. Messages
+        that keep failing are published again in halves, until a single
+        message is dropped.
+        """
+        for attempt in range(PUBLISH_RETRIES):
+            try:
+                self.transport.publish(channel, {
+                    "origin": self.node_id,
+                    "messages": messages
+                }, to)
+                return
+            except Exception as e:
+                error = e
+                time.sleep(PUBLISH_RETRY_DELAY * 2 ** attempt / SECONDS)
+
+        if len(messages) > 1:
+            half = len(messages) // 2
+            self.publish_messages(channel, messages[:half], to)
+            self.publish_messages(channel, messages[half:], to)
+        else:
+            print(f"\n -- Dropped a message on {channel}: {error}")
+
+    def flush(self):
+        """
+        Wait until the queued messages are published.
+        """
+        self.outbound.join()
 
     def broadcast_block(self, block):
         """
-        Broadcast blockchain object to all nodes.
+        Announce a block to all nodes, they fetch it if they need it.
         """
-        self.publish(CHANNELS["BLOCK"], block.to_json())
+        self.announce("blocks", block.hash)
 
     def broadcast_transaction(self, transaction):
         """
-        Broadcast transaction to all nodes.
+        Announce a version of a transaction to all nodes, they fetch it if
+        they do not have it or an older version.
         """
-        self.publish(CHANNELS["TRANSACTION"], transaction.to_json())
+        self.announce("transactions", PubSub.transaction_version(transaction.to_json()))
 
 
 # Experimental code
 def main():
-    pubsub = PubSub()
+    from backend.blockchain.blockchain import Blockchain
+    from backend.wallet.transaction_pool import TransactionPool
+
+    pubsub = PubSub(Blockchain(), TransactionPool())
     time.sleep(1)
     pubsub.publish(CHANNELS["TEST"], {"foo": "bar"})
+    pubsub.flush()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,35 @@
+import time
+from backend.blockchain.block_header import (
+    DATA_BLOCK_VERSION,
+    hash_with_midstate,
+    header_midstate
+)
+from backend.util.crypto_hash import crypto_hash
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+## NOTE Compare the cost per nonce of the legacy crypto_hash over all block
+## fields with the version 2 header midstate, for growing block sizes.
+
+NONCES = 2000
+
+wallet = Wallet()
+transaction = Transaction(wallet, "recipient", 1).to_json()
+
+for block_size in [1, 10, 100, 1000]:
+    data = [transaction] * block_size
+
+    start_time = time.perf_counter()
+    for nonce in range(NONCES):
+        crypto_hash(time.time_ns(), "last_hash", data, 3, nonce)
+    legacy_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    midstate = header_midstate(DATA_BLOCK_VERSION, "last_hash", data)
+    for nonce in range(NONCES):
+        hash_with_midstate(midstate, time.time_ns(), 3, nonce)
+    midstate_time = time.perf_counter() - start_time
+
+    print(f"Transactions per block: {block_size}")
+    print(f"  crypto_hash: {NONCES / legacy_time:.0f} hashes/s")
+    print(f"  midstate:    {NONCES / midstate_time:.0f} hashes/s")
@@ -0,0 +1,29 @@
+import timeit
+from backend.util.crypto_hash import crypto_hash
+from backend.util.hex_to_binary import hex_to_binary
+from backend.util.proof_of_work import (
+    difficulty_to_target,
+    digest_meets_target,
+    hash_meets_difficulty
+)
+
+## NOTE Microbenchmark of the proof of work check done for every nonce:
+## hex_to_binary string prefix versus comparing against a 256-bit target.
+
+NUMBER = 100000
+DIFFICULTY = 8
+
+hex_hash = crypto_hash("benchmark")
+digest = bytes.fromhex(hex_hash)
+
+checks = {
+    "hex_to_binary prefix": lambda: \
+        hex_to_binary(hex_hash)[0:DIFFICULTY] == "0" * DIFFICULTY,
+    "hex hash vs target": lambda: hash_meets_difficulty(hex_hash, DIFFICULTY),
+    "digest vs target": lambda: \
+        digest_meets_target(digest, difficulty_to_target(DIFFICULTY)),
+}
+
+for name, check in checks.items():
+    seconds = timeit.timeit(check, number=NUMBER)
+    print(f"{name}: {seconds / NUMBER * 1e9:.0f} ns per check")
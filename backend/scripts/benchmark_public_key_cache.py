@@ -0,0 +1,53 @@
+import time
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+## NOTE Compare is_valid_transaction_chain with and without the parsed
+## public key cache, for a chain where a few wallets sign many transactions.
+
+BLOCKS = 10
+WALLETS = 5
+TRANSACTIONS_PER_WALLET = 40
+
+blockchain = Blockchain()
+wallets = [Wallet(blockchain) for i in range(WALLETS)]
+
+for i in range(BLOCKS):
+    blockchain.add_block([
+        Transaction(wallet, "recipient", 1).to_json()
+        for wallet in wallets
+        for j in range(TRANSACTIONS_PER_WALLET)
+    ])
+
+cached_load_public_key = Wallet.load_public_key
+
+# Parse the key for every signature, as before the cache
+Wallet.load_public_key = staticmethod(cached_load_public_key.__wrapped__)
+start_time = time.perf_counter()
+Blockchain.is_valid_transaction_chain(blockchain.chain)
+uncached_time = time.perf_counter() - start_time
+
+Wallet.load_public_key = cached_load_public_key
+Wallet.load_public_key.cache_clear()
+start_time = time.perf_counter()
+Blockchain.is_valid_transaction_chain(blockchain.chain)
+cached_time = time.perf_counter() - start_time
+
+print(f"Transactions: {BLOCKS * WALLETS * TRANSACTIONS_PER_WALLET}")
+print(f"Signing wallets: {WALLETS}")
+print(f"Without key cache: {uncached_time:.3f}s")
+print(f"With key cache:    {cached_time:.3f}s")
+print(f"Cache: {Wallet.load_public_key.cache_info()}")
+
+# The key parsing on its own
+public_key = wallets[0].public_key
+start_time = time.perf_counter()
+for i in range(BLOCKS * WALLETS * TRANSACTIONS_PER_WALLET):
+    Wallet.load_public_key.__wrapped__(public_key)
+parse_time = time.perf_counter() - start_time
+start_time = time.perf_counter()
+for i in range(BLOCKS * WALLETS * TRANSACTIONS_PER_WALLET):
+    Wallet.load_public_key(public_key)
+lookup_time = time.perf_counter() - start_time
+print(f"Parsing keys: {parse_time:.3f}s, cache lookups: {lookup_time:.3f}s")
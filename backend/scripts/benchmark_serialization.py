@@ -0,0 +1,44 @@
+import json
+import time
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+from backend.util.binary_encoding import decode_blocks, encode_blocks
+
+## NOTE Compare size and speed of the json and binary formats for a chain.
+
+BLOCKS = 10
+TRANSACTIONS_PER_BLOCK = 20
+REPEAT = 20
+
+blockchain = Blockchain()
+for i in range(BLOCKS):
+    blockchain.add_block([
+        Transaction(Wallet(), Wallet().address, 10).to_json()
+        for j in range(TRANSACTIONS_PER_BLOCK)
+    ])
+chain_json = blockchain.to_json()
+
+start_time = time.perf_counter()
+for i in range(REPEAT):
+    json_bytes = json.dumps(chain_json).encode("utf-8")
+json_encode_time = (time.perf_counter() - start_time) / REPEAT
+start_time = time.perf_counter()
+for i in range(REPEAT):
+    json.loads(json_bytes)
+json_decode_time = (time.perf_counter() - start_time) / REPEAT
+
+start_time = time.perf_counter()
+for i in range(REPEAT):
+    binary_bytes = encode_blocks(chain_json)
+binary_encode_time = (time.perf_counter() - start_time) / REPEAT
+start_time = time.perf_counter()
+for i in range(REPEAT):
+    decode_blocks(binary_bytes)
+binary_decode_time = (time.perf_counter() - start_time) / REPEAT
+
+print(f"Blocks: {BLOCKS + 1}, transactions: {BLOCKS * TRANSACTIONS_PER_BLOCK}")
+print(f"json:   {len(json_bytes)} bytes, "
+    f"encode {json_encode_time * 1000:.2f}ms, decode {json_decode_time * 1000:.2f}ms")
+print(f"binary: {len(binary_bytes)} bytes, "
+    f"encode {binary_encode_time * 1000:.2f}ms, decode {binary_decode_time * 1000:.2f}ms")
@@ -3,6 +3,7 @@ import time
 from backend.blockchain.block import Block, GENESIS_DATA
 from backend.config import MINE_RATE, SECONDS
 from backend.util.hex_to_binary import hex_to_binary
+from backend.util.merkle_tree import verify_merkle_proof
 
 def test_mine_block():
     last_block = Block.genesis()
@@ -55,6 +56,28 @@ def test_mined_block_difficulty_limits_at_1():
 
     assert mined_block.difficulty == 1
 
+@pytest.mark.parametrize("step", [0.1, 0.25])
+def test_fractional_difficulty_step_through_the_floor(monkeypatch, step):
+    monkeypatch.setattr("backend.blockchain.block.DIFFICULTY_STEP", step)
+    # Every block mined too slowly, the difficulty drops to the floor
+    monkeypatch.setattr("backend.blockchain.block.MINE_RATE", 0)
+    last_block = Block.genesis()
+    difficulties = []
+    for i in range(round(last_block.difficulty / step) + 2):
+        block = Block.mine_block(last_block, f"data-{i}")
+        Block.is_valid_block(last_block, block)
+        difficulties.append(block.difficulty)
+        last_block = block
+
+    assert difficulties[0] == round(3 - step, 9)
+    assert difficulties[-3:] == [step, step, step]
+
+    # Back up from the floor by a step
+    monkeypatch.setattr("backend.blockchain.block.MINE_RATE", 60 * SECONDS)
+    block = Block.mine_block(last_block, "up")
+    Block.is_valid_block(last_block, block)
+    assert block.difficulty == round(2 * step, 9)
+
 ## Validation of block
 @pytest.fixture
 def last_block():
@@ -82,15 +105,48 @@ def test_is_valid_block_bad_proof_of_work(last_block, block):
 def test_is_valid_block_jumped_difficulty(last_block, block):
     jumped_difficulty = 10
     block.difficulty = jumped_difficulty
-    block.hash = f"{'0' * jumped_difficulty}112abcd" # to set hash to match fake difficulty
+    block.hash = f"{'0' * jumped_difficulty}112abcd".ljust(64, "0") # to set hash to match fake difficulty
 
     with pytest.raises(Exception, match="Block difficullty must only adjust by 1"):
         Block.is_valid_block(last_block, block)
 
 def test_is_valid_block_bad_block_hash(last_block, block):
-    bad_hash = "0000000000000000000abc"
+    bad_hash = "0000000000000000000abc".ljust(64, "0")
     block.hash = bad_hash
 
     with pytest.raises(Exception, match="Block hash must be correct"):
         Block.is_valid_block(last_block, block)
 
+
+def test_is_valid_block_bad_merkle_root(last_block, block):
+    block.data = "evil_data"
+
+    with pytest.raises(Exception, match="Block merkle root must be correct"):
+        Block.is_valid_block(last_block, block)
+
+def test_is_valid_header(last_block, block):
+    header = block.header_json()
+
+    assert "data" not in header
+    Block.is_valid_header(last_block.header_json(), header)
+
+def test_is_valid_header_bad_block_hash(last_block, block):
+    header = block.header_json()
+    header["merkle_root"] = "evil_merkle_root"
+
+    with pytest.raises(Exception, match="Block hash must be correct"):
+        Block.is_valid_header(last_block.header_json(), header)
+
+def test_transaction_proof():
+    data = [{"id": f"id-{i}", "output": {}} for i in range(5)]
+    block = Block.mine_block(Block.genesis(), data)
+    index, proof = block.transaction_proof("id-3")
+
+    assert index == 3
+    assert verify_merkle_proof(data[3], proof, block.merkle_root)
+
+def test_transaction_proof_unknown_transaction():
+    block = Block.mine_block(Block.genesis(), [{"id": "id-0", "output": {}}])
+
+    with pytest.raises(Exception, match="is not in the block"):
+        block.transaction_proof("unknown_id")
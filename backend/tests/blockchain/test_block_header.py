@@ -0,0 +1,65 @@
+import hashlib
+import pytest
+from backend.blockchain.block import Block
+from backend.blockchain.block_header import (
+    DATA_BLOCK_VERSION,
+    LEGACY_BLOCK_VERSION,
+    MERKLE_BLOCK_VERSION,
+    block_hash,
+    hash_with_midstate,
+    header_midstate,
+    header_prefix,
+    header_suffix
+)
+from backend.util.crypto_hash import crypto_hash
+from backend.util.hex_to_binary import hex_to_binary
+
+def test_hash_with_midstate():
+    midstate = header_midstate(DATA_BLOCK_VERSION, "last_hash", ["data"])
+    expected = hashlib.sha256(
+        header_prefix(DATA_BLOCK_VERSION, "last_hash", ["data"]) +
+        header_suffix(1, 3, 7)
+    ).hexdigest()
+
+    assert hash_with_midstate(midstate, 1, 3, 7) == expected
+    # The midstate is copied, so it can be reused for the next nonce
+    assert hash_with_midstate(midstate, 1, 3, 7) == expected
+
+def test_block_hash_versions():
+    assert block_hash(LEGACY_BLOCK_VERSION, 1, "last_hash", "data", 3, 7) == \
+        crypto_hash(1, "last_hash", "data", 3, 7)
+    assert block_hash(DATA_BLOCK_VERSION, 1, "last_hash", "data", 3, 7) == \
+        hash_with_midstate(
+            header_midstate(DATA_BLOCK_VERSION, "last_hash", "data"), 1, 3, 7
+        )
+    assert block_hash(
+        MERKLE_BLOCK_VERSION, 1, "last_hash", "data", 3, 7, "root"
+    ) == hash_with_midstate(
+        header_midstate(MERKLE_BLOCK_VERSION, "last_hash", "root"), 1, 3, 7
+    )
+
+def test_block_hash_unsupported_version():
+    with pytest.raises(Exception, match="Unsupported block version"):
+        block_hash(99, 1, "last_hash", "data", 3, 7)
+
+def test_is_valid_legacy_block():
+    last_block = Block.genesis()
+    difficulty = last_block.difficulty + 1
+    nonce = 0
+    hash = crypto_hash(2, last_block.hash, "data", difficulty, nonce)
+    while hex_to_binary(hash)[0:difficulty] != "0" * difficulty:
+        nonce += 1
+        hash = crypto_hash(2, last_block.hash, "data", difficulty, nonce)
+
+    # Blocks from older nodes have no version field
+    block = Block.from_json({
+        "timestamp": 2,
+        "last_hash": last_block.hash,
+        "hash": hash,
+        "data": "data",
+        "difficulty": difficulty,
+        "nonce": nonce
+    })
+
+    assert block.version == LEGACY_BLOCK_VERSION
+    Block.is_valid_block(last_block, block)
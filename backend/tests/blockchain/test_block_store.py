@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import pytest
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.block_store import BlockStore, StoredChain, INDEX_ENTRY
+from backend.wallet.wallet import Wallet
+from backend.wallet.transaction import Transaction
+
+@pytest.fixture
+def blocks():
+    blockchain = Blockchain()
+    for i in range(4):
+        blockchain.add_block([Transaction(Wallet(), "recipient", i).to_json()])
+    # Blocks as received from a peer, signatures are lists in json
+    return Blockchain.from_json(json.loads(json.dumps(blockchain.to_json()))).chain
+
+def test_append_and_read(tmp_path, blocks):
+    store = BlockStore(str(tmp_path))
+    for block in blocks:
+        store.append(block)
+
+    assert len(store) == len(blocks)
+    assert [store.read(height) for height in range(len(blocks))] == blocks
+    assert store.height_of(blocks[2].hash) == 2
+    assert store.height_of(blocks[0].hash) == 0
+    assert store.height_of("unknown") is None
+
+def test_reopen(tmp_path, blocks):
+    store = BlockStore(str(tmp_path))
+    for block in blocks:
+        store.append(block)
+    store.close()
+
+    store = BlockStore(str(tmp_path))
+
+    assert len(store) == len(blocks)
+    assert store.read(len(blocks) - 1) == blocks[-1]
+
+def test_segment_rollover(tmp_path, blocks):
+    store = BlockStore(str(tmp_path), segment_size=1)
+    for block in blocks:
+        store.append(block)
+
+    assert store.segments() == list(range(len(blocks)))
+    assert [store.read(height) for height in range(len(blocks))] == blocks
+
+def test_segment_synced_before_index(tmp_path, blocks, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def record_fsync(fd):
+        synced.append(os.path.basename(os.readlink(f"/proc/self/fd/{fd}")))
+        fsync(fd)
+
+    store = BlockStore(str(tmp_path), segment_size=1, sync_interval=100)
+    monkeypatch.setattr("backend.blockchain.block_store.os.fsync", record_fsync)
+    for block in blocks[:3]:
+        store.append(block)
+
+    # The full segments are synced before the index that points at them
+    assert synced == [
+        "blocks-00000.dat", "index.dat", "blocks-00001.dat", "index.dat"
+    ]
+
+    synced.clear()
+    store.sync()
+
+    assert synced == ["blocks-00002.dat", "index.dat"]
+
+def test_truncate(tmp_path, blocks):
+    store = BlockStore(str(tmp_path), segment_size=1)
+    for block in blocks:
+        store.append(block)
+    store.truncate(2)
+    store.append(blocks[3])
+    store.close()
+
+    store = BlockStore(str(tmp_path))
+
+    assert len(store) == 3
+    assert store.read(2) == blocks[3]
+    assert store.height_of(blocks[2].hash) is None
+
+def test_recover_torn_block(tmp_path, blocks):
+    store = BlockStore(str(tmp_path))
+    for block in blocks:
+        store.append(block)
+    store.close()
+    segment_path = store.segment_path(0)
+    size = os.path.getsize(segment_path)
+    # Lose the end of the last block
+    with open(segment_path, "r+b") as segment_file:
+        segment_file.truncate(size - 10)
+
+    store = BlockStore(str(tmp_path))
+
+    assert len(store) == len(blocks) - 1
+    store.append(blocks[-1])
+    assert store.read(len(blocks) - 1) == blocks[-1]
+
+def test_recover_unindexed_block(tmp_path, blocks):
+    store = BlockStore(str(tmp_path))
+    for block in blocks:
+        store.append(block)
+    store.close()
+    # Lose the last index entry and half of the one before
+    with open(store.index_path, "r+b") as index_file:
+        index_file.truncate((2 * len(blocks) - 3) * INDEX_ENTRY.size // 2)
+
+    store = BlockStore(str(tmp_path))
+
+    assert len(store) == len(blocks)
+    assert store.height_of(blocks[-1].hash) == len(blocks) - 1
+
+def test_recover_lost_index(tmp_path, blocks):
+    store = BlockStore(str(tmp_path), segment_size=1)
+    for block in blocks:
+        store.append(block)
+    store.close()
+    os.remove(store.index_path)
+
+    store = BlockStore(str(tmp_path), segment_size=1)
+
+    assert store.segments() == list(range(len(blocks)))
+    assert [store.read(height) for height in range(len(blocks))] == blocks
+    assert store.height_of(blocks[-1].hash) == len(blocks) - 1
+
+def test_blockchain_with_store(tmp_path, blocks):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    blockchain.replace_chain(blocks)
+    blockchain.store.close()
+
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+
+    assert list(blockchain.chain) == blocks
+    assert blockchain.balances == Blockchain.from_json(
+        [block.to_json() for block in blocks]
+    ).balances
+    transaction_id = blocks[2].data[0]["id"]
+    assert blockchain.find_transaction(transaction_id) == blocks[2]
+
+def test_blockchain_with_store_rollback(tmp_path, blocks):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    blockchain.replace_chain(blocks)
+    blockchain.rollback(1)
+    blockchain.add_block([])
+
+    assert len(blockchain.chain) == 3
+    assert blockchain.chain[1] == blocks[1]
+    assert blockchain.store.height_of(blocks[2].hash) is None
+    Blockchain.is_valid_chain(blockchain.chain)
+
+def test_read_while_appending(tmp_path, blocks):
+    store = BlockStore(str(tmp_path), segment_size=2048)
+    chain = StoredChain(store, cache_size=2)
+    chain.append(blocks[0])
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                for height in range(len(chain)):
+                    assert chain[height].hash == blocks[height % len(blocks)].hash
+            except Exception as e:
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for i in range(1, 200):
+        chain.append(blocks[i % len(blocks)])
+    done.set()
+    reader.join()
+    store.close()
+
+    assert errors == []
+    store = BlockStore(str(tmp_path))
+    assert [store.read(height).hash for height in range(len(store))] == \
+        [blocks[i % len(blocks)].hash for i in range(200)]
+
+def test_pinned_chain(tmp_path, blocks):
+    chain = StoredChain(BlockStore(str(tmp_path)))
+    for block in blocks:
+        chain.append(block)
+    pinned = chain.pinned(3)
+
+    assert len(pinned) == 3
+    assert list(pinned) == blocks[:3]
+    chain.append(blocks[0])
+    assert pinned[-1] == blocks[2]
+
+    # The tip of the view rolled back, another block at its height
+    chain.truncate(2)
+    chain.append(blocks[3])
+
+    with pytest.raises(Exception, match="no longer stored"):
+        pinned[1]
@@ -0,0 +1,83 @@
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+def test_template_follows_pool(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    block_template = node.block_template()
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+
+    assert block_template.transaction_data() == [transaction.to_json()]
+
+    transaction_pool.remove_transaction(transaction.id)
+
+    assert block_template.transaction_data() == []
+
+def test_template_limits(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    block_template = node.block_template(max_transactions=2)
+    transactions = [Transaction(Wallet(), "recipient", 1) for i in range(3)]
+    for transaction in transactions:
+        transaction_pool.set_transaction(transaction)
+
+    assert list(block_template.selected) == [transactions[0].id, transactions[1].id]
+
+    # Space freed by a removal is refilled from the pool
+    transaction_pool.remove_transaction(transactions[0].id)
+
+    assert list(block_template.selected) == [transactions[1].id, transactions[2].id]
+
+def test_template_byte_limit(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    block_template = node.block_template(max_bytes=1)
+    transaction_pool.set_transaction(Transaction(Wallet(), "recipient", 1))
+
+    assert block_template.transaction_data() == []
+
+def test_template_skips_invalid_transaction(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    block_template = node.block_template()
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction.output["recipient"] = 900
+    transaction_pool.set_transaction(transaction)
+
+    assert block_template.transaction_data() == []
+
+def test_template_skips_stale_balance(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    block_template = node.block_template()
+    wallet = Wallet(blockchain)
+    transaction = Transaction(wallet, "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+
+    # A block changes the sender balance
+    blockchain.add_block([Transaction(wallet, "other_recipient", 2).to_json()])
+
+    assert block_template.transaction_data() == []
+
+def test_template_after_block(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    block_template = node.block_template()
+    transaction_1 = Transaction(Wallet(), "recipient", 1)
+    transaction_2 = Transaction(Wallet(), "recipient", 2)
+    transaction_pool.set_transaction(transaction_1)
+    transaction_pool.set_transaction(transaction_2)
+
+    blockchain.add_block([transaction_1.to_json()])
+
+    assert block_template.transaction_data() == [transaction_2.to_json()]
+
+    blockchain.rollback(0)
+
+    assert {
+        transaction["id"] for transaction in block_template.transaction_data()
+    } == {transaction_1.id, transaction_2.id}
+
+def test_template_one_transaction_per_sender(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    block_template = node.block_template()
+    wallet = Wallet()
+    transaction_pool.set_transaction(Transaction(wallet, "recipient", 1))
+    transaction_pool.set_transaction(Transaction(wallet, "recipient", 2))
+
+    assert len(block_template.transaction_data()) == 1
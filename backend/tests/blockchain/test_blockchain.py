@@ -1,8 +1,9 @@
 import pytest
 from backend.blockchain.blockchain import Blockchain
-from backend.blockchain.block import GENESIS_DATA
+from backend.blockchain.block import GENESIS_DATA, Block
 from backend.wallet.wallet import Wallet
 from backend.wallet.transaction import Transaction
+from backend.config import STRATING_BALANCE
 
 def test_blockchain_instance():
     blockchain = Blockchain()
@@ -100,3 +101,173 @@ def test_is_valid_transaction_chain_bad_historic_balance(blockchain_three_blocks
 
     with pytest.raises(Exception, match="invalid input amount"):
         Blockchain.is_valid_transaction_chain(blockchain_three_blocks.chain)
+
+def test_find_transaction(blockchain_three_blocks):
+    transaction = blockchain_three_blocks.chain[2].data[0]
+
+    assert blockchain_three_blocks.find_transaction(transaction["id"]) == \
+        blockchain_three_blocks.chain[2]
+    assert blockchain_three_blocks.find_transaction("unknown_id") is None
+
+def test_balance_index_add_block():
+    blockchain = Blockchain()
+    wallet = Wallet(blockchain)
+    transaction = Transaction(wallet, "recipient", 10)
+    blockchain.add_block([transaction.to_json()])
+
+    assert blockchain.balances[wallet.address] == STRATING_BALANCE - 10
+    assert blockchain.balances["recipient"] == STRATING_BALANCE + 10
+
+def test_balance_index_replace_chain(blockchain_three_blocks):
+    blockchain = Blockchain()
+    blockchain.replace_chain(blockchain_three_blocks.chain)
+
+    assert blockchain.balances == blockchain_three_blocks.balances
+    assert blockchain.balances["recipient"] == STRATING_BALANCE + 0 + 1 + 2
+
+def test_is_valid_chain_timings(blockchain_three_blocks):
+    timings = Blockchain.is_valid_chain(blockchain_three_blocks.chain)
+
+    assert set(timings) == {
+        "blocks", "deserialize", "unique", "balances", "transactions"
+    }
+    assert all(seconds >= 0 for seconds in timings.values())
+
+def test_is_valid_chain_progress(blockchain_three_blocks):
+    calls = []
+    Blockchain.is_valid_chain(
+        blockchain_three_blocks.chain,
+        progress=lambda step, done, total: calls.append((step, done, total))
+    )
+
+    assert ("blocks", 4, 4) in calls
+    assert ("transactions", 4, 4) in calls
+
+def test_is_valid_transaction_chain_spent_twice(blockchain_three_blocks):
+    wallet = Wallet(blockchain_three_blocks)
+    transaction = Transaction(wallet, "recipient", 10)
+    blockchain_three_blocks.add_block([transaction.to_json()])
+    # Same input amount again, the balance already dropped by 10
+    replayed_transaction = Transaction(
+        output=transaction.output,
+        input=transaction.input
+    )
+    blockchain_three_blocks.add_block([replayed_transaction.to_json()])
+
+    with pytest.raises(Exception, match="invalid input amount"):
+        Blockchain.is_valid_transaction_chain(blockchain_three_blocks.chain)
+
+def test_append_block(blockchain_three_blocks):
+    blockchain = Blockchain()
+    blockchain.replace_chain(blockchain_three_blocks.chain[:3])
+    blockchain.append_block(blockchain_three_blocks.chain[3])
+
+    assert blockchain.chain == blockchain_three_blocks.chain
+    assert blockchain.balances == blockchain_three_blocks.balances
+
+def test_append_block_not_extending_tip(blockchain_three_blocks):
+    blockchain = Blockchain()
+
+    with pytest.raises(Exception, match="does not extend the local tip"):
+        blockchain.append_block(blockchain_three_blocks.chain[2])
+
+def test_append_block_invalid_transaction(blockchain_three_blocks):
+    blockchain = Blockchain()
+    blockchain.replace_chain(blockchain_three_blocks.chain)
+    transaction = blockchain_three_blocks.chain[1].data[0]
+    blockchain_three_blocks.add_block([transaction])
+
+    with pytest.raises(Exception, match="is not unique"):
+        blockchain.append_block(blockchain_three_blocks.chain[-1])
+    assert len(blockchain.chain) == 4
+
+def fork(blockchain, height, blocks):
+    forked_blockchain = Blockchain()
+    forked_blockchain.chain = blockchain.chain[:height + 1]
+    for i in range(blocks):
+        forked_blockchain.add_block(
+            [Transaction(Wallet(forked_blockchain), "fork_recipient", i).to_json()]
+        )
+    return forked_blockchain
+
+def test_replace_chain_fork(blockchain_three_blocks):
+    forked_blockchain = fork(blockchain_three_blocks, 1, 4)
+
+    assert blockchain_three_blocks.fork_height(forked_blockchain.chain) == 1
+    blockchain_three_blocks.replace_chain(forked_blockchain.chain)
+
+    assert blockchain_three_blocks.chain == forked_blockchain.chain
+    assert blockchain_three_blocks.balances == forked_blockchain.balances
+    assert blockchain_three_blocks.transaction_heights == \
+        forked_blockchain.transaction_heights
+    assert "recipient" in blockchain_three_blocks.balances
+    assert blockchain_three_blocks.balances["recipient"] == STRATING_BALANCE + 0
+
+def test_replace_chain_fork_beyond_undo_log(blockchain_three_blocks, monkeypatch):
+    monkeypatch.setattr("backend.blockchain.blockchain.REORG_UNDO_DEPTH", 1)
+    blockchain = Blockchain()
+    blockchain.chain = blockchain_three_blocks.chain
+    forked_blockchain = fork(blockchain_three_blocks, 1, 4)
+    blockchain.replace_chain(forked_blockchain.chain)
+
+    assert blockchain.chain == forked_blockchain.chain
+    assert blockchain.balances == forked_blockchain.balances
+
+def test_replace_chain_fork_invalid_suffix(blockchain_three_blocks):
+    forked_blockchain = fork(blockchain_three_blocks, 1, 4)
+    # Spend a transaction already on the shared part of the chain again
+    forked_blockchain.add_block([blockchain_three_blocks.chain[1].data[0]])
+    chain = blockchain_three_blocks.chain[:]
+
+    with pytest.raises(Exception, match="is not unique"):
+        blockchain_three_blocks.replace_chain(forked_blockchain.chain)
+    assert blockchain_three_blocks.chain == chain
+
+def test_replace_chain_forged_common_ancestor(blockchain_three_blocks):
+    forked_blockchain = fork(blockchain_three_blocks, 1, 4)
+    chain = forked_blockchain.chain[:]
+    # Same hash as the local block, another difficulty
+    chain[1] = Block.from_json({
+        **chain[1].to_json(),
+        "difficulty": chain[1].difficulty + 5
+    })
+
+    with pytest.raises(Exception, match="common ancestor does not match"):
+        blockchain_three_blocks.replace_chain(chain)
+
+def test_known_addresses(blockchain_three_blocks):
+    addresses = sorted({
+        address
+        for block in blockchain_three_blocks.chain
+        for transaction in block.data
+        for address in transaction["output"]
+    })
+
+    assert blockchain_three_blocks.known_addresses() == addresses
+    assert blockchain_three_blocks.known_addresses(limit=2) == addresses[:2]
+    assert blockchain_three_blocks.known_addresses(limit=None) == addresses
+    assert blockchain_three_blocks.known_addresses(after=addresses[1]) == \
+        addresses[2:]
+
+def test_known_addresses_prefix():
+    blockchain = Blockchain()
+    blockchain.add_block([
+        Transaction(Wallet(), recipient, 1).to_json()
+        # Wallet addresses are hex, so these prefixes only match recipients
+        for recipient in ["xa1", "xb1", "xb2", "y1"]
+    ])
+
+    assert blockchain.known_addresses(prefix="xb") == ["xb1", "xb2"]
+    assert blockchain.known_addresses(prefix="xb", after="xb1") == ["xb2"]
+    assert blockchain.known_addresses(prefix="z") == []
+
+def test_known_addresses_rollback(blockchain_three_blocks):
+    addresses = blockchain_three_blocks.known_addresses()
+    blockchain_three_blocks.add_block([
+        Transaction(Wallet(), "new_recipient", 1).to_json()
+    ])
+    assert "new_recipient" in blockchain_three_blocks.known_addresses()
+
+    blockchain_three_blocks.rollback(3)
+
+    assert blockchain_three_blocks.known_addresses() == addresses
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import pytest
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.chain_sync import ChainSync
+from backend.blockchain.state_engine import StateEngine
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+from backend.wallet.transaction import Transaction
+
+class LocalChainSync(ChainSync):
+    """
+    Sync from a blockchain in this process instead of over http.
+    """
+    def __init__(self, blockchain, remote, state_engine=None):
+        super().__init__(
+            blockchain,
+            "local",
+            workers=2,
+            progress=None,
+            state_engine=state_engine
+        )
+        self.remote = json.loads(json.dumps(remote.to_json()))
+        self.block_requests = 0
+
+    def fetch_length(self):
+        return len(self.remote)
+
+    def fetch_headers(self, start, count):
+        return [
+            Block.from_json(block_json).header_json()
+            for block_json in self.remote[start:start + count]
+        ]
+
+    def fetch_blocks(self, start, end):
+        self.block_requests += 1
+        return [Block.from_json(block_json) for block_json in self.remote[start:end]]
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr("backend.blockchain.chain_sync.SYNC_HEADERS_BATCH", 4)
+    monkeypatch.setattr("backend.blockchain.chain_sync.SYNC_BODIES_BATCH", 2)
+
+@pytest.fixture
+def remote():
+    blockchain = Blockchain()
+    for i in range(7):
+        blockchain.add_block([Transaction(Wallet(), "recipient", i).to_json()])
+    return blockchain
+
+def test_sync(remote):
+    blockchain = Blockchain()
+    chain_sync = LocalChainSync(blockchain, remote)
+
+    assert chain_sync.sync() == 7
+    assert blockchain.to_json() == chain_sync.remote
+    assert chain_sync.block_requests == 4
+
+def test_sync_resumes_from_local_height(remote):
+    blockchain = Blockchain()
+    for block_json in LocalChainSync(blockchain, remote).remote[1:5]:
+        blockchain.append_block(Block.from_json(block_json))
+    chain_sync = LocalChainSync(blockchain, remote)
+
+    assert chain_sync.sync() == 3
+    assert blockchain.to_json() == chain_sync.remote
+
+def test_sync_up_to_date(remote):
+    assert LocalChainSync(remote, remote).sync() == 0
+
+def test_sync_from_fork(remote):
+    blockchain = Blockchain()
+    remote_json = LocalChainSync(blockchain, remote).remote
+    for block_json in remote_json[1:3]:
+        blockchain.append_block(Block.from_json(block_json))
+    blockchain.add_block([])
+    chain_sync = LocalChainSync(blockchain, remote)
+
+    assert chain_sync.sync() == 5
+    assert blockchain.to_json() == remote_json
+
+def test_sync_bad_header(remote):
+    remote.chain[3].nonce = "evil_nonce"
+    remote.chain[3].merkle_root = "evil_merkle_root"
+    blockchain = Blockchain()
+
+    with pytest.raises(Exception, match="Block hash must be correct"):
+        LocalChainSync(blockchain, remote).sync()
+
+    assert len(blockchain.chain) == 1
+
+def test_sync_validates_in_parallel(remote, monkeypatch):
+    monkeypatch.setattr("backend.blockchain.chain_sync.VALIDATION_WORKERS", 2)
+    blockchain = Blockchain()
+    chain_sync = LocalChainSync(blockchain, remote)
+
+    assert chain_sync.sync() == 7
+    assert blockchain.to_json() == chain_sync.remote
+
+def test_sync_from_fork_keeps_local_chain_on_failure(remote):
+    blockchain = Blockchain()
+    remote_json = LocalChainSync(blockchain, remote).remote
+    for block_json in remote_json[1:3]:
+        blockchain.append_block(Block.from_json(block_json))
+    blockchain.add_block([])
+    local_json = blockchain.to_json()
+    chain_sync = LocalChainSync(blockchain, remote)
+    # Spend a transaction of the shared blocks again, in the last window
+    chain_sync.remote[7]["data"] = chain_sync.remote[1]["data"]
+
+    with pytest.raises(Exception):
+        chain_sync.sync()
+
+    assert blockchain.to_json() == local_json
+
+def test_sync_from_fork_validates_each_window(remote):
+    blockchain = Blockchain()
+    remote_json = LocalChainSync(blockchain, remote).remote
+    for block_json in remote_json[1:3]:
+        blockchain.append_block(Block.from_json(block_json))
+    blockchain.add_block([])
+    chain_sync = LocalChainSync(blockchain, remote)
+    # Spend a transaction of the shared blocks again, in the first window
+    chain_sync.remote[3]["data"] = chain_sync.remote[1]["data"]
+
+    with pytest.raises(Exception):
+        chain_sync.sync()
+
+    # The second window is never fetched
+    assert chain_sync.block_requests == 2
+
+def test_sync_from_fork_with_store(tmp_path, remote):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    remote_json = LocalChainSync(blockchain, remote).remote
+    for block_json in remote_json[1:3]:
+        blockchain.append_block(Block.from_json(block_json))
+    blockchain.add_block([])
+    chain_sync = LocalChainSync(blockchain, remote)
+
+    assert chain_sync.sync() == 5
+    assert blockchain.to_json() == remote_json
+    # The staging store is removed
+    assert not any(os.path.isdir(tmp_path / name) for name in os.listdir(tmp_path))
+
+def test_sync_through_state_engine(remote):
+    blockchain = Blockchain()
+    state_engine = StateEngine(blockchain, TransactionPool())
+    writers = []
+    blockchain.add_listener(
+        lambda added, removed: writers.append(threading.current_thread())
+    )
+    chain_sync = LocalChainSync(blockchain, remote, state_engine)
+
+    assert chain_sync.sync() == 7
+    assert set(writers) == {state_engine.thread}
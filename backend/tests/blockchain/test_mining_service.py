@@ -0,0 +1,84 @@
+import threading
+import time
+import pytest
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.mining_service import (
+    JOB_MINED,
+    JOB_NEW_TIP,
+    JOB_NEW_TEMPLATE,
+    MiningService
+)
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+def wait_for(condition, timeout=30):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+def test_mining_service_mines_blocks(node):
+    mined = []
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    mining_service = node.mining_service(mined.append)
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+
+    assert mining_service.start()
+    assert not mining_service.start()
+    wait_for(lambda: mining_service.blocks_mined >= 2)
+    assert mining_service.stop()
+
+    status = mining_service.status()
+    assert status["running"] is False
+    assert status["current_job"] is None
+    assert mined == list(blockchain.chain)[1:len(mined) + 1]
+    assert blockchain.chain[1].data[0] == transaction.to_json()
+    assert not transaction_pool.transaction_map
+    Blockchain.is_valid_chain(blockchain.chain)
+
+    job = next(job for job in status["recent_jobs"] if job["result"] == JOB_MINED)
+    assert job["hash_rate"] > 0
+    assert job["seconds"] > 0
+
+@pytest.mark.parametrize("node", [{"state_engine": True}], indirect=True)
+def test_mining_service_with_state_engine(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    mining_service = node.mining_service()
+
+    assert mining_service.start()
+    wait_for(lambda: mining_service.blocks_mined >= 1)
+    assert mining_service.stop()
+
+    snapshot = mining_service.state_engine.snapshot()
+    assert snapshot.length == len(blockchain.chain) >= 2
+    Blockchain.is_valid_chain(blockchain.chain)
+
+def current_job(blockchain, started):
+    return {
+        "height": len(blockchain.chain),
+        "last_block": blockchain.chain[-1],
+        "stop_event": threading.Event(),
+        "started": started,
+        "transactions": 1,
+        "reason": None
+    }
+
+def test_new_tip_cancels_job(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    mining_service = node.mining_service()
+    mining_service.job = current_job(blockchain, time.time_ns())
+    blockchain.add_block([])
+
+    assert mining_service.job["stop_event"].is_set()
+    assert mining_service.job["reason"] == JOB_NEW_TIP
+
+def test_pool_change_refreshes_job(node):
+    blockchain, transaction_pool = node.blockchain, node.transaction_pool
+    mining_service = node.mining_service()
+    # Started long enough ago to refresh right away
+    mining_service.job = current_job(blockchain, 0)
+    transaction_pool.set_transaction(Transaction(Wallet(), "recipient", 1))
+
+    assert mining_service.job["stop_event"].is_set()
+    assert mining_service.job["reason"] == JOB_NEW_TEMPLATE
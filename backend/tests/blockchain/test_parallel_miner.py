@@ -0,0 +1,27 @@
+import multiprocessing
+from backend.blockchain.block import Block
+from backend.blockchain.parallel_miner import ParallelMiner
+
+def test_parallel_mine_block():
+    last_block = Block.genesis()
+    miner = ParallelMiner(workers=2)
+    block = miner.mine_block(last_block, "test-data")
+
+    assert isinstance(block, Block)
+    assert block.data == "test-data"
+    Block.is_valid_block(last_block, block)
+
+def test_parallel_mine_block_stats():
+    miner = ParallelMiner(workers=2)
+    miner.mine_block(Block.genesis(), "test-data")
+
+    assert [stat["worker"] for stat in miner.stats] == [0, 1]
+    assert sum(stat["hashes"] for stat in miner.stats) >= 1
+    assert miner.hash_rate() >= 0
+
+def test_parallel_mine_block_cancelled():
+    stop_event = multiprocessing.get_context().Event()
+    stop_event.set()
+    miner = ParallelMiner(workers=2)
+
+    assert miner.mine_block(Block.genesis(), "test-data", stop_event) is None
@@ -0,0 +1,68 @@
+import pytest
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.parallel_validation import validate_chunk
+from backend.wallet.wallet import Wallet
+from backend.wallet.transaction import Transaction
+
+@pytest.fixture
+def blockchain_five_blocks(monkeypatch):
+    monkeypatch.setattr(
+        "backend.blockchain.parallel_validation.VALIDATION_CHUNK_SIZE", 2
+    )
+    blockchain = Blockchain()
+    for i in range(5):
+        blockchain.add_block([Transaction(Wallet(), "recipient", i).to_json()])
+    return blockchain
+
+def bad_balance_transaction():
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 10)
+    transaction.output[wallet.address] = 9900
+    transaction.input["amount"] = 9910
+    transaction.input["signature"] = wallet.sign(transaction.output)
+    return transaction.to_json()
+
+def test_validate_chunk(blockchain_five_blocks):
+    chain = blockchain_five_blocks.chain
+    assert validate_chunk(1, chain[0:3]) is None
+
+    chain[2].hash = "fake_hash"
+    height, message = validate_chunk(1, chain[0:3])
+    assert height == 2
+    assert "proof of work" in message
+
+def test_is_valid_chain_parallel(blockchain_five_blocks):
+    timings = Blockchain.is_valid_chain(blockchain_five_blocks.chain, workers=2)
+
+    assert "blocks" in timings
+
+def test_is_valid_chain_parallel_bad_block_first(blockchain_five_blocks):
+    blockchain_five_blocks.add_block([bad_balance_transaction()])
+    blockchain_five_blocks.chain[3].hash = "fake_hash"
+
+    with pytest.raises(Exception, match="proof of work requirement not met"):
+        Blockchain.is_valid_chain(blockchain_five_blocks.chain, workers=2)
+
+def test_is_valid_chain_parallel_bad_balance_first(blockchain_five_blocks):
+    chain = blockchain_five_blocks.chain
+    blockchain = Blockchain()
+    blockchain.chain = chain[0:2]
+    blockchain.add_block([bad_balance_transaction()])
+    blockchain.chain = blockchain.chain + chain[2:]
+
+    with pytest.raises(Exception, match="invalid input amount"):
+        Blockchain.is_valid_chain(blockchain.chain, workers=2)
+
+def test_is_valid_chain_parallel_bad_signature(blockchain_five_blocks):
+    bad_transaction = Transaction(Wallet(), "recipient", 10)
+    bad_transaction.input["signature"] = Wallet().sign(bad_transaction.output)
+    blockchain_five_blocks.add_block([bad_transaction.to_json()])
+
+    with pytest.raises(Exception, match="Invalid signature"):
+        Blockchain.is_valid_chain(blockchain_five_blocks.chain, workers=2)
+
+def test_replace_chain_parallel(blockchain_five_blocks):
+    blockchain = Blockchain()
+    blockchain.replace_chain(blockchain_five_blocks.chain, workers=2)
+
+    assert blockchain.chain == blockchain_five_blocks.chain
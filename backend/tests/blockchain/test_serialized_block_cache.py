@@ -0,0 +1,29 @@
+import json
+from backend.blockchain.block import Block
+from backend.blockchain.serialized_block_cache import SerializedBlockCache
+from backend.util.binary_encoding import (
+    decode_blocks,
+    encode_blocks_header
+)
+
+def test_json_bytes():
+    cache = SerializedBlockCache()
+    block = Block.genesis()
+
+    assert json.loads(cache.json_bytes(block)) == block.to_json()
+    assert cache.json_bytes(block) is cache.json_bytes(block)
+
+def test_binary_bytes():
+    cache = SerializedBlockCache()
+    block = Block.genesis()
+
+    assert decode_blocks(encode_blocks_header(1) + cache.binary_bytes(block)) == \
+        [block.to_json()]
+
+def test_cache_size():
+    cache = SerializedBlockCache(size=1)
+    block = Block.genesis()
+    cache.json_bytes(block)
+    cache.binary_bytes(block)
+
+    assert list(cache.cache) == [(block.hash, "encode_blocks_item")]
@@ -0,0 +1,119 @@
+import threading
+import pytest
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.state_engine import StateEngine
+from backend.wallet.transaction import Transaction
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+
+@pytest.fixture
+def state_engine(make_node):
+    return make_node(state_engine=True).state_engine
+
+def test_changes_run_on_writer_thread(state_engine):
+    threads = []
+
+    def change():
+        threads.append(threading.current_thread())
+        # Nested calls run right away instead of waiting for themselves
+        return state_engine.call(lambda: len(state_engine.blockchain.chain))
+
+    assert state_engine.call(change) == 1
+    assert threads == [state_engine.thread]
+
+def test_call_raises_the_change_error(state_engine):
+    def change():
+        raise Exception("Invalid change")
+
+    with pytest.raises(Exception, match="Invalid change"):
+        state_engine.call(change)
+
+def test_snapshot_is_reused_until_a_change(state_engine):
+    snapshot = state_engine.snapshot()
+    assert state_engine.snapshot() is snapshot
+
+    transaction = Transaction(Wallet(), "recipient", 1)
+    state_engine.call(state_engine.transaction_pool.set_transaction, transaction)
+    state_engine.call(state_engine.blockchain.add_block, [])
+    changed = state_engine.snapshot()
+
+    assert changed is not snapshot
+    assert snapshot.length == 1
+    assert snapshot.transactions == []
+    assert changed.length == 2
+    assert changed.tip.hash == state_engine.blockchain.chain[-1].hash
+    assert changed.transactions == [transaction.to_json()]
+    assert changed.pool_stats["transactions"] == 1
+
+def test_snapshot_is_not_changed_by_writes(state_engine):
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 1)
+    state_engine.call(state_engine.transaction_pool.set_transaction, transaction)
+    snapshot = state_engine.snapshot()
+
+    def update():
+        transaction.update(wallet, "other_recipient", 2)
+        state_engine.transaction_pool.set_transaction(transaction)
+        state_engine.blockchain.add_block([])
+
+    state_engine.call(update)
+
+    assert "other_recipient" not in snapshot.transactions[0]["output"]
+    assert len(snapshot.chain) == snapshot.length == 1
+
+def test_snapshot_lookups(state_engine):
+    transaction = Transaction(Wallet(), "recipient", 1)
+    state_engine.call(state_engine.blockchain.add_block, [transaction.to_json()])
+    snapshot = state_engine.snapshot()
+    assert snapshot.find_transaction(transaction.id) is snapshot.chain[1]
+    state_engine.call(state_engine.blockchain.rollback, 0)
+    other = Transaction(Wallet(), "other_recipient", 1)
+    state_engine.call(state_engine.blockchain.add_block, [other.to_json()])
+
+    # Still the addresses and blocks of the state it was taken from
+    assert "recipient" in snapshot.known_addresses()
+    assert "other_recipient" not in snapshot.known_addresses()
+    # The rolled back transaction is no longer indexed
+    assert snapshot.find_transaction(transaction.id) is None
+    assert snapshot.find_transaction(other.id) is None
+    assert state_engine.snapshot().find_transaction(other.id) is \
+        state_engine.blockchain.chain[1]
+
+def test_snapshot_does_not_wait_for_the_writer(state_engine):
+    snapshot = state_engine.snapshot()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_change():
+        started.set()
+        state_engine.blockchain.add_block([])
+        release.wait(5)
+
+    future = state_engine.submit(slow_change)
+    started.wait(5)
+
+    # The writer is busy, readers get the last published snapshot
+    assert state_engine.snapshot() is snapshot
+    release.set()
+    future.result()
+    assert state_engine.snapshot().length == 2
+
+def test_snapshot_of_stored_chain(tmp_path):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    state_engine = StateEngine(blockchain, TransactionPool())
+    for i in range(3):
+        state_engine.call(blockchain.add_block, [])
+    snapshot = state_engine.snapshot()
+
+    assert snapshot.chain is not blockchain.chain
+    assert list(snapshot.chain) == list(blockchain.chain)
+
+    # A reorg through the engine
+    state_engine.call(blockchain.rollback, 1)
+    for i in range(3):
+        state_engine.call(blockchain.add_block, [Transaction(Wallet(), "recipient", i).to_json()])
+
+    # Its blocks are no longer read, instead of blocks of the new chain
+    assert len(snapshot.chain) == snapshot.length == 4
+    with pytest.raises(Exception, match="no longer stored"):
+        snapshot.chain[2]
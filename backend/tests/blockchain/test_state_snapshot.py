@@ -0,0 +1,62 @@
+import pytest
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.state_snapshot import read_snapshot, write_snapshot
+from backend.wallet.wallet import Wallet
+from backend.wallet.transaction import Transaction
+
+@pytest.fixture
+def snapshot_interval(monkeypatch):
+    monkeypatch.setattr("backend.blockchain.blockchain.SNAPSHOT_INTERVAL", 3)
+
+def add_blocks(blockchain, count):
+    for i in range(count):
+        blockchain.add_block([Transaction(Wallet(), "recipient", i).to_json()])
+
+def test_write_and_read_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    write_snapshot(path, {"height": 4})
+
+    assert read_snapshot(path)["height"] == 4
+
+def test_read_snapshot_missing_or_corrupt(tmp_path):
+    path = tmp_path / "snapshot.json"
+    assert read_snapshot(str(path)) is None
+
+    path.write_text('{"height": ')
+    assert read_snapshot(str(path)) is None
+
+def test_snapshot_taken_at_interval(tmp_path, snapshot_interval):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    add_blocks(blockchain, 4)
+
+    snapshot = read_snapshot(blockchain.snapshot_path())
+    assert snapshot["height"] == 2
+    assert snapshot["tip_hash"] == blockchain.chain[2].hash
+
+def test_restart_replays_blocks_after_snapshot(tmp_path, snapshot_interval):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    add_blocks(blockchain, 4)
+    blockchain.store.close()
+
+    restarted = Blockchain(BlockStore(str(tmp_path)))
+
+    # Only the blocks after the snapshot at height 2 were replayed
+    assert list(restarted.undo_log) == [3, 4]
+    assert restarted.balances == blockchain.balances
+    assert restarted.transaction_heights == blockchain.transaction_heights
+    assert restarted.block_heights == blockchain.block_heights
+
+def test_restart_with_stale_snapshot(tmp_path, snapshot_interval):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    add_blocks(blockchain, 4)
+    # The snapshot at height 2 is above the new tip
+    blockchain.rollback(1)
+    blockchain.store.close()
+
+    restarted = Blockchain(BlockStore(str(tmp_path)))
+
+    assert restarted.balances == blockchain.balances
+    assert restarted.block_heights == blockchain.block_heights
+    assert read_snapshot(restarted.snapshot_path())["tip_hash"] == \
+        blockchain.chain[-1].hash
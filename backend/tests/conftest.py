@@ -0,0 +1,62 @@
+import pytest
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.block_template import BlockTemplate
+from backend.blockchain.mining_service import MiningService
+from backend.blockchain.state_engine import StateEngine
+from backend.pubsub import PubSub
+from backend.transport.loopback_transport import LoopbackNetwork, LoopbackTransport
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+
+class Node():
+    """
+    The parts of a node wired as in backend.app: a blockchain and its
+    transaction pool, with a state engine when asked for. The services
+    on top are built on demand.
+    """
+    def __init__(self, state_engine=False):
+        self.blockchain = Blockchain()
+        self.transaction_pool = TransactionPool()
+        self.blockchain.add_listener(self.transaction_pool.apply_blocks)
+        self.state_engine = None
+        if state_engine:
+            self.state_engine = StateEngine(self.blockchain, self.transaction_pool)
+
+    def block_template(self, **limits):
+        return BlockTemplate(self.blockchain, self.transaction_pool, **limits)
+
+    def mining_service(self, on_block=None):
+        return MiningService(
+            self.blockchain,
+            self.block_template(),
+            Wallet(self.blockchain),
+            on_block=on_block,
+            workers=1,
+            state_engine=self.state_engine
+        )
+
+    def pubsub(self, network=None):
+        """
+        Return a PubSub over a loopback transport of the network.
+        """
+        return PubSub(
+            self.blockchain,
+            self.transaction_pool,
+            LoopbackTransport(network or LoopbackNetwork()),
+            self.state_engine
+        )
+
+@pytest.fixture
+def make_node():
+    """
+    Build nodes, make_node(state_engine=True) for one with a state engine.
+    """
+    return Node
+
+@pytest.fixture
+def node(request):
+    """
+    A node, parametrize indirectly with {"state_engine": True} for one
+    with a state engine.
+    """
+    return Node(**getattr(request, "param", {}))
@@ -0,0 +1,296 @@
+import time
+from backend.blockchain.blockchain import Blockchain
+from backend.pubsub import CHANNELS, PubSub
+from backend.transport.loopback_transport import LoopbackNetwork, LoopbackTransport
+from backend.transport.tcp_transport import TcpTransport
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+def wait_for(condition, *pubsubs):
+    """
+    Flush the nodes until the condition holds, a reply may queue a new
+    message on another node.
+    """
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+        for pubsub in pubsubs:
+            pubsub.flush()
+        time.sleep(0.01)
+
+    return condition()
+
+def listen(network):
+    """
+    Return the list of the channels published on the network, as another
+    node receives them.
+    """
+    received = []
+    LoopbackTransport(network).start(
+        lambda channel, message: received.append(channel)
+    )
+    return received
+
+def test_pubsub_over_loopback(make_node):
+    network = LoopbackNetwork()
+    node_1, node_2 = make_node(), make_node()
+    blockchain_1, blockchain_2 = node_1.blockchain, node_2.blockchain
+    transaction_pool_1, transaction_pool_2 = node_1.transaction_pool, node_2.transaction_pool
+    pubsub_1, pubsub_2 = node_1.pubsub(network), node_2.pubsub(network)
+
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool_1.set_transaction(transaction)
+    pubsub_1.broadcast_transaction(transaction)
+    assert wait_for(
+        lambda: transaction.id in transaction_pool_2.transaction_map,
+        pubsub_1, pubsub_2
+    )
+
+    blockchain_1.add_block([transaction.to_json()])
+    pubsub_1.broadcast_block(blockchain_1.chain[-1])
+    assert wait_for(
+        lambda: blockchain_2.chain[-1].hash == blockchain_1.chain[-1].hash,
+        pubsub_1, pubsub_2
+    )
+
+def test_updated_transaction_propagates(make_node):
+    network = LoopbackNetwork()
+    node_1, node_2 = make_node(), make_node()
+    transaction_pool_1, transaction_pool_2 = node_1.transaction_pool, node_2.transaction_pool
+    pubsub_1, pubsub_2 = node_1.pubsub(network), node_2.pubsub(network)
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 10)
+    transaction_pool_1.set_transaction(transaction)
+    pubsub_1.broadcast_transaction(transaction)
+    assert wait_for(
+        lambda: transaction.id in transaction_pool_2.transaction_map,
+        pubsub_1, pubsub_2
+    )
+
+    # Same id, another version
+    transaction.update(wallet, "other_recipient", 20)
+    transaction_pool_1.set_transaction(transaction)
+    pubsub_1.broadcast_transaction(transaction)
+
+    assert wait_for(
+        lambda: transaction_pool_2.transaction_map[transaction.id].output == \
+            transaction.output,
+        pubsub_1, pubsub_2
+    )
+
+def test_older_transaction_version_is_not_requested(node):
+    transaction_pool = node.transaction_pool
+    pubsub = node.pubsub()
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 10)
+    older = PubSub.transaction_version(transaction.to_json())
+    transaction.update(wallet, "other_recipient", 20)
+    transaction_pool.set_transaction(transaction)
+
+    assert pubsub.has_transaction(older)
+    assert pubsub.has_transaction(PubSub.transaction_version(transaction.to_json()))
+    assert not pubsub.has_transaction(f"{transaction.id}:{transaction.input['timestamp'] + 1}")
+
+def test_inventory_requests_unseen_ids_once(node):
+    network = LoopbackNetwork()
+    blockchain = node.blockchain
+    blockchain.add_block([])
+    pubsub = node.pubsub(network)
+    received = []
+    LoopbackTransport(network).start(
+        lambda channel, message: received.append((channel, message))
+    )
+    inventory = {
+        "blocks": [blockchain.chain[-1].hash, "unseen_hash"],
+        "transactions": ["unseen_id"]
+    }
+
+    pubsub.handle_message(CHANNELS["INV"], inventory, "other_node")
+    pubsub.handle_message(CHANNELS["INV"], inventory, "other_node")
+    pubsub.flush()
+
+    assert received == [(
+        CHANNELS["GETDATA"],
+        {
+            "origin": pubsub.node_id,
+            "messages": [{
+                "to": "other_node",
+                "blocks": ["unseen_hash"],
+                "transactions": ["unseen_id"]
+            }]
+        }
+    )]
+
+def test_compact_block_relay(make_node):
+    network = LoopbackNetwork()
+    node_1, node_2 = make_node(), make_node()
+    blockchain_1, blockchain_2 = node_1.blockchain, node_2.blockchain
+    transaction_pool_2 = node_2.transaction_pool
+    pubsub_1, pubsub_2 = node_1.pubsub(network), node_2.pubsub(network)
+    channels = listen(network)
+
+    pooled = Transaction(Wallet(), "recipient", 1)
+    transaction_pool_2.set_transaction(pooled)
+    missing = Transaction(Wallet(), "recipient", 2)
+    reward = Transaction.reward_transaction(Wallet())
+    blockchain_1.add_block([pooled.to_json(), missing.to_json(), reward.to_json()])
+    pubsub_1.broadcast_block(blockchain_1.chain[-1])
+
+    assert wait_for(
+        lambda: blockchain_2.chain[-1].hash == blockchain_1.chain[-1].hash,
+        pubsub_1, pubsub_2
+    )
+    assert "BLOCK" not in channels
+    assert channels[:5] == ["INV", "GETDATA", "CMPCTBLOCK", "GETBLOCKTXN", "BLOCKTXN"]
+
+def test_compact_block_not_appended_is_not_requested_again(node):
+    network = LoopbackNetwork()
+    pubsub, transaction_pool = node.pubsub(network), node.transaction_pool
+    received = listen(network)
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+    # A block on another chain, its last block is unknown here
+    other_blockchain = Blockchain()
+    other_blockchain.add_block([])
+    other_blockchain.add_block([transaction.to_json()])
+
+    pubsub.handle_compact_block(
+        pubsub.compact_block(other_blockchain.chain[-1]),
+        "other_node"
+    )
+    pubsub.flush()
+
+    assert len(pubsub.blockchain.chain) == 1
+    assert received == []
+
+def test_compact_block_short_id_collision(node):
+    network = LoopbackNetwork()
+    pubsub, transaction_pool = node.pubsub(network), node.transaction_pool
+    received = listen(network)
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 1)
+    blockchain = Blockchain()
+    blockchain.add_block([transaction.to_json()])
+    compact = pubsub.compact_block(blockchain.chain[-1])
+    # Another pooled transaction with the same short id
+    colliding = Transaction(Wallet(), "recipient", 2)
+    pubsub.short_ids[(colliding.id, colliding.input["timestamp"])] = \
+        compact["short_ids"][0]
+    transaction_pool.set_transaction(colliding)
+
+    pubsub.handle_compact_block(compact, "other_node")
+    pubsub.flush()
+
+    assert received == ["GETBLOCKTXN"]
+    assert len(pubsub.blockchain.chain) == 1
+
+    pubsub.handle_blocktxn({
+        "to": pubsub.node_id,
+        "hash": blockchain.chain[-1].hash,
+        "indexes": [0],
+        "transactions": [transaction.to_json()]
+    })
+
+    assert pubsub.blockchain.chain[-1].hash == blockchain.chain[-1].hash
+
+def test_compact_block_short_ids(node):
+    pubsub = node.pubsub()
+    transaction = Transaction(Wallet(), "recipient", 1)
+    reward = Transaction.reward_transaction(Wallet())
+    blockchain = Blockchain()
+    blockchain.add_block([transaction.to_json(), reward.to_json()])
+
+    compact = pubsub.compact_block(blockchain.chain[-1])
+
+    assert "data" not in compact["header"]
+    assert compact["short_ids"] == [pubsub.short_id(transaction.to_json()), None]
+    assert compact["prefilled"] == [[1, reward.to_json()]]
+
+def test_getdata_replies_to_the_requester_only(make_node):
+    network = LoopbackNetwork()
+    node, other_node = make_node(), make_node()
+    transaction_pool, other_pool = node.transaction_pool, other_node.transaction_pool
+    pubsub = node.pubsub(network)
+    other_node.pubsub(network)
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+
+    pubsub.handle_message(
+        CHANNELS["GETDATA"],
+        {"to": pubsub.node_id, "transactions": [transaction.id]},
+        "third_node"
+    )
+    pubsub.flush()
+    # Requests without a target are skipped
+    pubsub.handle_message(CHANNELS["GETDATA"], {"transactions": [transaction.id]}, "other")
+
+    assert transaction.id not in other_pool.transaction_map
+    assert pubsub.outbound.empty()
+
+def test_getdata_reply_reaches_node_outside_peers(make_node):
+    node_1, node_2 = make_node(), make_node()
+    transaction_pool_1, transaction_pool_2 = node_1.transaction_pool, node_2.transaction_pool
+    # The announcing node has the other node as a peer, not the reverse
+    transport_2 = TcpTransport("127.0.0.1", 0, [])
+    pubsub_2 = PubSub(node_2.blockchain, transaction_pool_2, transport_2)
+    transport_1 = TcpTransport("127.0.0.1", 0, [("127.0.0.1", transport_2.port)])
+    pubsub_1 = PubSub(node_1.blockchain, transaction_pool_1, transport_1)
+    try:
+        transaction = Transaction(Wallet(), "recipient", 1)
+        transaction_pool_1.set_transaction(transaction)
+        pubsub_1.broadcast_transaction(transaction)
+
+        assert wait_for(
+            lambda: transaction.id in transaction_pool_2.transaction_map,
+            pubsub_1, pubsub_2
+        )
+    finally:
+        transport_1.close()
+        transport_2.close()
+
+def test_pubsub_drops_own_messages(node):
+    pubsub = node.pubsub()
+    handled = []
+    pubsub.handle_message = lambda channel, message, origin: handled.append(message)
+    message = {"origin": pubsub.node_id, "messages": [{"foo": "bar"}]}
+
+    pubsub.message("TEST", message)
+    pubsub.message("TEST", {**message, "origin": "other_node"})
+    pubsub.message("TEST", {"foo": "untagged"})
+
+    assert handled == [{"foo": "bar"}, {"foo": "untagged"}]
+
+def test_pubsub_batches_messages(node):
+    network = LoopbackNetwork()
+    pubsub = node.pubsub(network)
+    received = []
+    LoopbackTransport(network).start(
+        lambda channel, message: received.append((channel, message))
+    )
+
+    pubsub.publish_batch([("A", 1), ("B", 2), ("A", 3)])
+
+    assert received == [
+        ("A", {"origin": pubsub.node_id, "messages": [1, 3]}),
+        ("B", {"origin": pubsub.node_id, "messages": [2]})
+    ]
+
+def test_pubsub_splits_batches_by_size():
+    messages = [{"data": "x" * 10}] * 5
+
+    assert [len(chunk) for chunk in PubSub.split_by_size(messages, 50)] == [2, 2, 1]
+
+def test_pubsub_splits_failing_batches(node, monkeypatch):
+    monkeypatch.setattr("backend.pubsub.PUBLISH_RETRY_DELAY", 0)
+    pubsub = node.pubsub()
+    published = []
+
+    def publish(channel, message, to=None):
+        # Only single messages fit
+        if len(message["messages"]) > 1:
+            raise Exception("Message too large")
+        published.extend(message["messages"])
+
+    pubsub.transport.publish = publish
+    pubsub.publish_batch([("A", 1), ("A", 2), ("A", 3)])
+
+    assert published == [1, 2, 3]
@@ -0,0 +1,36 @@
+import pytest
+from backend.transport.loopback_transport import LoopbackNetwork, LoopbackTransport
+from backend.transport.transport import Transport
+
+def test_loopback_publish():
+    network = LoopbackNetwork()
+    received = []
+    transport_1 = LoopbackTransport(network)
+    transport_2 = LoopbackTransport(network)
+    transport_1.start(lambda channel, message: received.append((1, channel, message)))
+    transport_2.start(lambda channel, message: received.append((2, channel, message)))
+
+    transport_1.publish("TEST", {"foo": "bar"})
+
+    assert received == [(2, "TEST", {"foo": "bar"})]
+
+def test_loopback_close():
+    network = LoopbackNetwork()
+    received = []
+    transport_1 = LoopbackTransport(network)
+    transport_2 = LoopbackTransport(network)
+    transport_1.start(lambda channel, message: None)
+    transport_2.start(lambda channel, message: received.append(message))
+    transport_2.close()
+
+    transport_1.publish("TEST", {"foo": "bar"})
+
+    assert received == []
+
+def test_transport_must_implement_publish():
+    class StartOnlyTransport(Transport):
+        def start(self, on_message):
+            pass
+
+    with pytest.raises(TypeError):
+        StartOnlyTransport()
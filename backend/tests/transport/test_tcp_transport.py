@@ -0,0 +1,106 @@
+import asyncio
+import queue
+import socket
+from backend.transport.tcp_transport import (
+    TcpTransport,
+    encode_frame,
+    parse_peers
+)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_parse_peers():
+    assert parse_peers("localhost:7000, 10.0.0.2:7001,") == \
+        [("localhost", 7000), ("10.0.0.2", 7001)]
+
+def test_encode_frame():
+    frame = encode_frame("TEST", {"foo": "bar"})
+
+    assert int.from_bytes(frame[:4], "big") == len(frame) - 4
+
+def test_tcp_publish():
+    port_1, port_2 = free_port(), free_port()
+    received = queue.Queue()
+    transport_1 = TcpTransport("127.0.0.1", port_1, [("127.0.0.1", port_2)])
+    transport_2 = TcpTransport("127.0.0.1", port_2, [("127.0.0.1", port_1)])
+    transport_1.start(lambda channel, message: received.put((1, channel, message)))
+    transport_2.start(lambda channel, message: received.put((2, channel, message)))
+    try:
+        for i in range(3):
+            transport_1.publish("TEST", {"i": i})
+        transport_2.publish("TEST", {"i": 3})
+
+        messages = [received.get(timeout=10) for i in range(4)]
+        assert [m for m in messages if m[0] == 2] == \
+            [(2, "TEST", {"i": i}) for i in range(3)]
+        assert (1, "TEST", {"i": 3}) in messages
+    finally:
+        transport_1.close()
+        transport_2.close()
+
+def test_tcp_reply_to_node_outside_peers():
+    port_1, port_2 = free_port(), free_port()
+    received_1, received_2 = queue.Queue(), queue.Queue()
+    # Only the first node connects to the other
+    transport_1 = TcpTransport("127.0.0.1", port_1, [("127.0.0.1", port_2)])
+    transport_2 = TcpTransport("127.0.0.1", port_2, [])
+    transport_1.start(lambda channel, message: received_1.put(message))
+    transport_2.start(lambda channel, message: received_2.put(message))
+    try:
+        transport_1.publish("TEST", {"origin": "node_1", "messages": ["request"]})
+        assert received_2.get(timeout=10)["messages"] == ["request"]
+
+        transport_2.publish(
+            "TEST",
+            {"origin": "node_2", "messages": ["reply"]},
+            to="node_1"
+        )
+        assert received_1.get(timeout=10)["messages"] == ["reply"]
+
+        transport_1.publish(
+            "TEST",
+            {"origin": "node_1", "messages": ["reply to the reply"]},
+            to="node_2"
+        )
+        assert received_2.get(timeout=10)["messages"] == ["reply to the reply"]
+    finally:
+        transport_1.close()
+        transport_2.close()
+
+def test_tcp_reconnect_delivers_queued_messages():
+    port_1, port_2 = free_port(), free_port()
+    received = queue.Queue()
+    transport_1 = TcpTransport("127.0.0.1", port_1, [("127.0.0.1", port_2)])
+    transport_1.start(lambda channel, message: None)
+    # The peer is not listening yet
+    transport_1.publish("TEST", {"foo": "bar"})
+
+    transport_2 = TcpTransport("127.0.0.1", port_2, [])
+    transport_2.start(lambda channel, message: received.put(message))
+    try:
+        assert received.get(timeout=10) == {"foo": "bar"}
+    finally:
+        transport_1.close()
+        transport_2.close()
+
+def test_tcp_send_queue_drops_oldest():
+    # The peer is down, so frames stay queued
+    transport = TcpTransport(
+        "127.0.0.1",
+        0,
+        [("127.0.0.1", free_port())],
+        send_queue_size=2
+    )
+    transport.start(lambda channel, message: None)
+    try:
+        for i in range(5):
+            transport.publish("TEST", {"i": i})
+        # Wait for the loop to run the enqueues
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), transport.loop).result()
+
+        assert transport.dropped >= 2
+    finally:
+        transport.close()
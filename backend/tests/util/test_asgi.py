@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from flask import Flask, Response, jsonify, request
+from backend.util.asgi import AsgiApp
+
+@pytest.fixture
+def asgi_node(make_node):
+    node = make_node(state_engine=True)
+    blockchain, state_engine = node.blockchain, node.state_engine
+    app = Flask(__name__)
+    calls = []
+
+    @app.route("/blockchain/length")
+    def route_blockchain_length():
+        calls.append(request.path)
+        return jsonify(state_engine.snapshot().length)
+
+    @app.route("/echo", methods=["POST"])
+    def route_echo():
+        calls.append(request.path)
+        return jsonify({
+            "json": request.get_json(),
+            "query": request.args.get("q"),
+            "header": request.headers.get("X-Test")
+        })
+
+    @app.route("/stream")
+    def route_stream():
+        return Response((str(i).encode("utf-8") for i in range(3)))
+
+    asgi_app = AsgiApp(app, state_engine, ["/blockchain/length"], workers=2)
+
+    return asgi_app, blockchain, state_engine, calls
+
+def request_asgi(asgi_app, method, path, query=b"", body=b"", headers=()):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": list(headers),
+        "http_version": "1.1"
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    response_body = b"".join(message.get("body", b"") for message in sent[1:])
+
+    return sent[0]["status"], dict(sent[0]["headers"]), response_body
+
+def test_asgi_runs_wsgi_routes(asgi_node):
+    asgi_app, blockchain, state_engine, calls = asgi_node
+
+    status, headers, body = request_asgi(
+        asgi_app,
+        "POST",
+        "/echo",
+        query=b"q=foo",
+        body=b'{"amount": 1}',
+        headers=[(b"content-type", b"application/json"), (b"x-test", b"bar")]
+    )
+
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    assert body == b'{"header":"bar","json":{"amount":1},"query":"foo"}\n'
+
+def test_asgi_streams_body(asgi_node):
+    asgi_app, blockchain, state_engine, calls = asgi_node
+
+    assert request_asgi(asgi_app, "GET", "/stream")[2] == b"012"
+
+def test_asgi_caches_snapshot_routes_until_a_change(asgi_node):
+    asgi_app, blockchain, state_engine, calls = asgi_node
+
+    assert request_asgi(asgi_app, "GET", "/blockchain/length")[2] == b"1\n"
+    assert request_asgi(asgi_app, "GET", "/blockchain/length")[2] == b"1\n"
+    assert calls == ["/blockchain/length"]
+
+    state_engine.call(blockchain.add_block, [])
+
+    assert request_asgi(asgi_app, "GET", "/blockchain/length")[2] == b"2\n"
+    assert len(calls) == 2
+
+def test_asgi_lifespan(asgi_node):
+    asgi_app = asgi_node[0]
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(asgi_app({"type": "lifespan"}, receive, send))
+
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
@@ -0,0 +1,82 @@
+import json
+import pytest
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+from backend.util.binary_encoding import (
+    decode_block,
+    decode_blocks,
+    decode_transaction,
+    decode_value,
+    encode_blocks,
+    encode_blocks_header,
+    encode_blocks_item,
+    encode_transaction,
+    encode_value
+)
+
+def json_round_trip(value):
+    return json.loads(json.dumps(value))
+
+def test_encode_value_round_trip():
+    values = [
+        None, True, False, 0, 1, -1, 300, -300, 2 ** 70, 1.5, "", "text",
+        "0" * 64, "f" * 63, [1, [2, "three"]], {"a": 1, "b": {"c": None}}
+    ]
+    for value in values:
+        buffer = bytearray()
+        encode_value(value, buffer)
+        decoded_value, offset = decode_value(buffer, 0)
+
+        assert decoded_value == value
+        assert offset == len(buffer)
+
+def test_transaction_round_trip():
+    transaction = Transaction(Wallet(), "recipient", 10)
+    transaction_json = json_round_trip(transaction.to_json())
+    transaction_bytes = transaction.to_bytes()
+
+    assert decode_transaction(transaction_bytes) == transaction_json
+    assert Transaction.is_valid(Transaction.from_bytes(transaction_bytes)) is None
+    assert len(transaction_bytes) < len(json.dumps(transaction_json)) / 3
+
+def test_reward_transaction_round_trip():
+    transaction = Transaction.reward_transaction(Wallet())
+
+    assert decode_transaction(encode_transaction(transaction.to_json())) == \
+        transaction.to_json()
+
+def test_block_round_trip():
+    data = [
+        Transaction(Wallet(), "recipient", 10).to_json(),
+        Transaction.reward_transaction(Wallet()).to_json()
+    ]
+    block = Block.mine_block(Block.genesis(), data)
+    block_json = json_round_trip(block.to_json())
+
+    assert decode_block(block.to_bytes()) == block_json
+    assert Block.from_bytes(block.to_bytes()) == Block.from_json(block_json)
+    Block.is_valid_block(Block.genesis(), Block.from_bytes(block.to_bytes()))
+
+def test_blocks_round_trip():
+    blockchain = Blockchain()
+    blockchain.add_block([Transaction(Wallet(), "recipient", 1).to_json()])
+    blockchain.add_block("not a list of transactions")
+    chain_json = json_round_trip(blockchain.to_json())
+
+    assert decode_blocks(encode_blocks(blockchain.to_json())) == chain_json
+
+def test_blocks_streamed():
+    blockchain = Blockchain()
+    blockchain.add_block([Transaction(Wallet(), "recipient", 1).to_json()])
+    chain_json = blockchain.to_json()
+
+    streamed = encode_blocks_header(len(chain_json)) + \
+        b"".join(map(encode_blocks_item, chain_json))
+
+    assert streamed == encode_blocks(chain_json)
+
+def test_decode_bad_header():
+    with pytest.raises(Exception, match="Not a binary encoded"):
+        decode_block(b"{}")
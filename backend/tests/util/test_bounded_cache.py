@@ -0,0 +1,10 @@
+from backend.util.bounded_cache import BoundedCache
+
+def test_bounded_cache():
+    cache = BoundedCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["a"] = 3
+    cache["c"] = 4
+
+    assert list(cache.items()) == [("a", 3), ("c", 4)]
@@ -0,0 +1,35 @@
+from backend.util.merkle_tree import (
+    EMPTY_ROOT,
+    leaf_hash,
+    merkle_proof,
+    merkle_root,
+    node_hash,
+    verify_merkle_proof
+)
+
+def test_merkle_root():
+    assert merkle_root([]) == EMPTY_ROOT
+    assert merkle_root(["a"]) == leaf_hash("a")
+    assert merkle_root(["a", "b", "c"]) == node_hash(
+        node_hash(leaf_hash("a"), leaf_hash("b")),
+        leaf_hash("c")
+    )
+
+def test_merkle_proof():
+    items = [{"id": i} for i in range(7)]
+    root = merkle_root(items)
+
+    for index, item in enumerate(items):
+        proof = merkle_proof(items, index)
+        # log2 of the number of items, rounded up
+        assert len(proof) <= 3
+        assert verify_merkle_proof(item, proof, root)
+
+def test_merkle_proof_invalid():
+    items = ["a", "b", "c", "d"]
+    root = merkle_root(items)
+    proof = merkle_proof(items, 1)
+
+    assert not verify_merkle_proof("x", proof, root)
+    assert not verify_merkle_proof("a", proof, root)
+    assert not verify_merkle_proof("b", proof, merkle_root(["a", "x", "c", "d"]))
@@ -0,0 +1,30 @@
+from backend.util.crypto_hash import crypto_hash
+from backend.util.hex_to_binary import hex_to_binary
+from backend.util.proof_of_work import (
+    difficulty_to_target,
+    digest_meets_target,
+    hash_meets_difficulty
+)
+
+def test_difficulty_to_target():
+    assert difficulty_to_target(0) == 2 ** 256
+    assert difficulty_to_target(3) == 2 ** 253
+    assert difficulty_to_target(3) < difficulty_to_target(2.5) < difficulty_to_target(2)
+
+def test_hash_meets_difficulty_matches_leading_zero_bits():
+    for i in range(200):
+        hash = crypto_hash(i)
+        for difficulty in range(1, 8):
+            leading_zeros = hex_to_binary(hash)[0:difficulty] == "0" * difficulty
+            assert hash_meets_difficulty(hash, difficulty) == leading_zeros
+            assert digest_meets_target(
+                bytes.fromhex(hash),
+                difficulty_to_target(difficulty)
+            ) == leading_zeros
+
+def test_hash_meets_difficulty_short_or_invalid_hash():
+    assert not hash_meets_difficulty("000", 12)
+    assert not hash_meets_difficulty("0" * 65, 12)
+    assert not hash_meets_difficulty(None, 1)
+    assert not hash_meets_difficulty("fff", 1)
+    assert not hash_meets_difficulty("not_a_hash", 1)
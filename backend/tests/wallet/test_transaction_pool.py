@@ -1,3 +1,4 @@
+import pytest
 from backend.wallet.transaction_pool import TransactionPool
 from backend.wallet.transaction import Transaction
 from backend.blockchain.blockchain import Blockchain
@@ -27,4 +28,145 @@ def test_clear_blockchain_transactions():
     transaction_pool.clear_blockchain_transactions(blockchain)
 
     assert not transaction_1.id in transaction_pool.transaction_map
-    assert not transaction_2.id in transaction_pool.transaction_map
\ No newline at end of file
+    assert not transaction_2.id in transaction_pool.transaction_map
+
+def test_existing_transaction():
+    transaction_pool = TransactionPool()
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+
+    assert transaction_pool.existing_transaction(wallet.address) == transaction
+    assert transaction_pool.existing_transaction(Wallet().address) is None
+
+def test_set_updated_transaction():
+    transaction_pool = TransactionPool()
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+    transaction.update(wallet, "other_recipient", 2)
+    transaction_pool.set_transaction(transaction)
+
+    assert list(transaction_pool.transaction_map) == [transaction.id]
+    assert transaction_pool.stats()["transactions"] == 1
+
+def test_updated_transaction_expires_in_order():
+    transaction_pool = TransactionPool()
+    wallet = Wallet()
+    transaction = Transaction(wallet, "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+    other_transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool.set_transaction(other_transaction)
+    transaction.update(wallet, "other_recipient", 2)
+    transaction_pool.set_transaction(transaction)
+    added = transaction_pool.entries[other_transaction.id][0]
+
+    # Expired up to the other transaction, the updated one is newer
+    transaction_pool.max_age = 0
+    transaction_pool.expire_transactions(added + 1)
+
+    assert list(transaction_pool.transaction_map) == [transaction.id]
+
+def test_evict_oldest():
+    transaction_pool = TransactionPool(max_count=2)
+    transactions = [Transaction(Wallet(), "recipient", 1) for i in range(3)]
+    for transaction in transactions:
+        transaction_pool.set_transaction(transaction)
+
+    assert list(transaction_pool.transaction_map) == \
+        [transactions[1].id, transactions[2].id]
+    assert transaction_pool.existing_transaction(
+        transactions[0].input["address"]
+    ) is None
+    assert transaction_pool.stats()["evictions"]["count"] == 1
+
+def test_evict_lowest_amount():
+    transaction_pool = TransactionPool(max_count=2, eviction="lowest_amount")
+    transactions = [
+        Transaction(Wallet(), "recipient", amount) for amount in [5, 1, 9]
+    ]
+    results = [
+        transaction_pool.set_transaction(transaction)
+        for transaction in transactions
+    ]
+
+    assert results == [True, True, True]
+    assert set(transaction_pool.transaction_map) == \
+        {transactions[0].id, transactions[2].id}
+    assert transaction_pool.set_transaction(
+        Transaction(Wallet(), "recipient", 2)
+    ) is False
+
+def test_evict_by_bytes():
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool = TransactionPool(max_bytes=1)
+
+    assert transaction_pool.set_transaction(transaction) is False
+    assert transaction_pool.stats() == {
+        "transactions": 0,
+        "bytes": 0,
+        "evictions": {"count": 0, "bytes": 1, "age": 0}
+    }
+
+def test_expire_transactions():
+    transaction_pool = TransactionPool(max_age=0)
+    transaction = Transaction(Wallet(), "recipient", 1)
+    transaction_pool.set_transaction(transaction)
+    transaction_pool.expire_transactions()
+
+    assert transaction.id not in transaction_pool.transaction_map
+    assert transaction_pool.stats()["evictions"]["age"] == 1
+
+def test_unknown_eviction_policy():
+    with pytest.raises(Exception, match="Unknown transaction pool eviction"):
+        TransactionPool(eviction="random")
+
+def test_apply_blocks():
+    transaction_pool = TransactionPool()
+    transaction_1 = Transaction(Wallet(), "recipient", 1)
+    transaction_2 = Transaction(Wallet(), "recipient", 2)
+    transaction_pool.set_transaction(transaction_1)
+    transaction_pool.set_transaction(transaction_2)
+
+    blockchain = Blockchain()
+    blockchain.add_listener(transaction_pool.apply_blocks)
+    blockchain.add_block([transaction_1.to_json()])
+
+    assert list(transaction_pool.transaction_map) == [transaction_2.id]
+
+def test_apply_blocks_reorg():
+    transaction_pool = TransactionPool()
+    transaction = Transaction(Wallet(), "recipient", 1)
+    reward = Transaction.reward_transaction(Wallet())
+
+    blockchain = Blockchain()
+    blockchain.add_listener(transaction_pool.apply_blocks)
+    blockchain.add_block([transaction.to_json(), reward.to_json()])
+    assert not transaction_pool.transaction_map
+
+    blockchain.rollback(0)
+
+    assert list(transaction_pool.transaction_map) == [transaction.id]
+    assert transaction_pool.existing_transaction(transaction.input["address"]).output == \
+        transaction.output
+
+def test_apply_blocks_reorg_keeps_newer_sender_transaction():
+    transaction_pool = TransactionPool()
+    wallet = Wallet()
+    transaction_1 = Transaction(wallet, "recipient", 1)
+    blockchain = Blockchain()
+    blockchain.add_listener(transaction_pool.apply_blocks)
+    blockchain.add_block([transaction_1.to_json()])
+    transaction_2 = Transaction(wallet, "recipient", 2)
+    transaction_pool.set_transaction(transaction_2)
+
+    # Reorg to a chain that records transaction_1 in another block
+    blockchain.rollback(0)
+    assert transaction_pool.existing_transaction(wallet.address) == transaction_2
+    blockchain.add_block([
+        Transaction(Wallet(), "recipient", 3).to_json(),
+        transaction_1.to_json()
+    ])
+
+    assert list(transaction_pool.transaction_map) == [transaction_2.id]
+    assert transaction_pool.existing_transaction(wallet.address) == transaction_2
@@ -48,3 +48,16 @@ def test_calculate_balance():
     # When wallet receives coins
     assert wallet.calculate_balance(blockchain, wallet.address) == \
         STRATING_BALANCE - amount + amount_2 + amount_3
+
+def test_load_public_key_cache():
+    wallet = Wallet()
+    data = {"foo": "test_data"}
+    signature = wallet.sign(data)
+    Wallet.load_public_key.cache_clear()
+
+    assert Wallet.verify(wallet.public_key, data, signature)
+    assert Wallet.verify(wallet.public_key, data, signature)
+
+    cache_info = Wallet.load_public_key.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 1
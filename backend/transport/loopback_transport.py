@@ -0,0 +1,33 @@
+from backend.transport.transport import Transport
+
+
+class LoopbackNetwork():
+    """
+    The nodes of an in process network of LoopbackTransport.
+    """
+    def __init__(self):
+        self.transports = []
+
+
+class LoopbackTransport(Transport):
+    """
+    Transport between nodes in the same process, for tests.
+    Messages are delivered synchronously to every other started transport
+    of the network.
+    """
+    def __init__(self, network):
+        self.network = network
+        self.on_message = None
+
+    def start(self, on_message):
+        self.on_message = on_message
+        self.network.transports.append(self)
+
+    def publish(self, channel, message, to=None):
+        for transport in list(self.network.transports):
+            if transport is not self:
+                transport.on_message(channel, message)
+
+    def close(self):
+        if self in self.network.transports:
+            self.network.transports.remove(self)
@@ -0,0 +1,41 @@
+from pubnub.pubnub import PubNub
+from pubnub.pnconfiguration import PNConfiguration
+from pubnub.callbacks import SubscribeCallback
+from pubnub.enums import PNReconnectionPolicy
+from backend.transport.transport import Transport
+
+pnconfig = PNConfiguration()
+pnconfig.subscribe_key = 'sub-c-78070285-db89-4898-a7e7-d4731855cafa'
+pnconfig.publish_key = 'pub-c-c12b168a-f8e1-4458-9413-522ec2713d12'
+## Below for new version of pubsub (ran into issues so I downgraded)
+#pnconfig.user_id = "g"
+#pnconfig.reconnect_policy = PNReconnectionPolicy.LINEAR
+
+
+class Listener(SubscribeCallback):
+    def __init__(self, on_message):
+        self.on_message = on_message
+
+    def message(self, pubnub, message_object):
+        self.on_message(message_object.channel, message_object.message)
+
+
+class PubNubTransport(Transport):
+    """
+    Transport over the hosted PubNub service.
+    """
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.pubnub = PubNub(pnconfig)
+
+    def start(self, on_message):
+        self.pubnub.subscribe().channels(self.channels).execute()
+        self.pubnub.add_listener(Listener(on_message))
+
+    def publish(self, channel, message, to=None):
+        # Stays subscribed, PubSub drops the messages of its own node
+        self.pubnub.publish().channel(channel).message(message).sync()
+
+    def close(self):
+        self.pubnub.unsubscribe_all()
+        self.pubnub.stop()
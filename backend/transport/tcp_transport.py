@@ -0,0 +1,200 @@
+import asyncio
+import json
+import queue
+import struct
+import threading
+from backend.transport.transport import Transport
+from backend.config import (
+    SECONDS,
+    TCP_MAX_FRAME_SIZE,
+    TCP_RECONNECT_MAX,
+    TCP_RECONNECT_MIN,
+    TCP_SEND_QUEUE_SIZE
+)
+
+# Frame: payload length, then the json {"channel": ..., "message": ...}
+FRAME_HEADER = struct.Struct(">I")
+
+
+def encode_frame(channel, message):
+    payload = json.dumps({"channel": channel, "message": message}).encode("utf-8")
+
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def parse_peers(peers):
+    """
+    Parse peers written as "host:port,host:port".
+    """
+    return [
+        (host, int(port))
+        for host, port in (
+            peer.strip().rsplit(":", 1) for peer in peers.split(",") if peer.strip()
+        )
+    ]
+
+
+async def read_frame(reader):
+    """
+    Read one frame, return its channel and message.
+    """
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > TCP_MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds {TCP_MAX_FRAME_SIZE}")
+    frame = json.loads(await reader.readexactly(length))
+
+    return frame["channel"], frame["message"]
+
+
+class TcpTransport(Transport):
+    """
+    Transport over direct TCP connections between nodes.
+    Listens on host:port for the frames of other nodes, and keeps a
+    persistent connection to each peer (host, port) to publish to. An
+    asyncio loop runs the connections in a background thread:
+      - frames are length prefixed json
+      - each peer has a send queue of send_queue_size frames, when it is
+        full (the peer is down or slow) the oldest frame is dropped
+      - lost connections are reopened with exponential backoff
+      - a message for a single node goes back over the connection its
+        tagged messages (see PubSub) came in on, so replies reach nodes
+        that are not in peers. Frames are read in both directions.
+    Received messages are handed to on_message in order, from one
+    dispatch thread.
+    """
+    def __init__(self, host, port, peers, send_queue_size=TCP_SEND_QUEUE_SIZE):
+        self.host = host
+        self.port = port
+        self.peers = [tuple(peer) for peer in peers]
+        self.send_queue_size = send_queue_size
+        self.send_queues = {}
+        self.connections = set()
+        # node id -> writer of the connection its messages came in on
+        self.routes = {}
+        self.dropped = 0
+        self.inbound = queue.Queue()
+        self.loop = None
+
+    def start(self, on_message):
+        self.on_message = on_message
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.serve(), self.loop).result()
+        threading.Thread(target=self.dispatch, daemon=True).start()
+
+    async def serve(self):
+        self.server = await asyncio.start_server(
+            self.receive,
+            self.host,
+            self.port
+        )
+        # The port the system picked when port is 0
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.tasks = []
+        for peer in self.peers:
+            self.send_queues[peer] = asyncio.Queue(self.send_queue_size)
+            self.tasks.append(self.loop.create_task(self.send(peer)))
+
+    async def receive(self, reader, writer):
+        """
+        Read the frames of a connection from another node.
+        """
+        self.connections.add(writer)
+        try:
+            await self.read_frames(reader, writer)
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def read_frames(self, reader, writer):
+        """
+        Queue the frames of a connection for dispatch until it closes,
+        and route replies to the nodes tagged in them over it.
+        """
+        try:
+            while True:
+                channel, message = await read_frame(reader)
+                if isinstance(message, dict) and "origin" in message:
+                    self.routes[message["origin"]] = writer
+                self.inbound.put((channel, message))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            for node_id, route in list(self.routes.items()):
+                if route is writer:
+                    del self.routes[node_id]
+
+    async def send(self, peer):
+        """
+        Keep a connection to the peer open and write its queued frames.
+        A frame that could not be written is sent again on reconnect.
+        """
+        send_queue = self.send_queues[peer]
+        delay = TCP_RECONNECT_MIN
+        frame = None
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(*peer)
+                delay = TCP_RECONNECT_MIN
+                # The peer may reply over this connection
+                read_task = self.loop.create_task(self.read_frames(reader, writer))
+                try:
+                    while True:
+                        if frame is None:
+                            frame = await send_queue.get()
+                        writer.write(frame)
+                        await writer.drain()
+                        frame = None
+                finally:
+                    read_task.cancel()
+                    writer.close()
+            except OSError:
+                await asyncio.sleep(delay / SECONDS)
+                delay = min(delay * 2, TCP_RECONNECT_MAX)
+
+    def dispatch(self):
+        while True:
+            item = self.inbound.get()
+            if item is None:
+                return
+            try:
+                self.on_message(*item)
+            except Exception as e:
+                print(f"\n -- Error handling message: {e}")
+
+    def publish(self, channel, message, to=None):
+        """
+        Queue a message for every peer, or for the node to over the
+        connection it is known on. Returns without waiting for the
+        network.
+        """
+        self.loop.call_soon_threadsafe(self.enqueue, encode_frame(channel, message), to)
+
+    def enqueue(self, frame, to=None):
+        route = self.routes.get(to)
+        if route is not None and not route.is_closing():
+            route.write(frame)
+            return
+
+        for send_queue in self.send_queues.values():
+            if send_queue.full():
+                send_queue.get_nowait()
+                self.dropped += 1
+            send_queue.put_nowait(frame)
+
+    def close(self):
+        if self.loop is None:
+            return
+
+        async def shutdown():
+            for task in self.tasks:
+                task.cancel()
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.inbound.put(None)
@@ -0,0 +1,29 @@
+from abc import ABC, abstractmethod
+
+
+class Transport(ABC):
+    """
+    Delivers the messages published by one node to the other nodes.
+    A message is a json serializable object published to a channel.
+    Implementations: PubNubTransport (hosted service), TcpTransport
+    (direct connections to peers) and LoopbackTransport (in process,
+    for tests).
+    """
+    @abstractmethod
+    def start(self, on_message):
+        """
+        Start delivering the messages of other nodes to
+        on_message(channel, message).
+        """
+
+    @abstractmethod
+    def publish(self, channel, message, to=None):
+        """
+        Send a message to the other nodes.
+        to is the id of the node a reply is for, the origin its messages
+        are tagged with. A transport that cannot reach a single node sends
+        the message to all of them, the others skip it.
+        """
+
+    def close(self):
+        pass
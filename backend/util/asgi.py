@@ -0,0 +1,224 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from backend.util.bounded_cache import BoundedCache
+from backend.config import (
+    ASGI_CACHE_BODY_SIZE,
+    ASGI_CHUNK_SIZE,
+    ASGI_RESPONSE_CACHE_SIZE,
+    ASGI_WORKERS
+)
+
+# Request headers a cached route response depends on
+VARY_HEADERS = [b"accept", b"origin", b"if-none-match"]
+
+
+def wsgi_environ(scope, body):
+    """
+    Return the WSGI environ of an ASGI http request.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        # The body is read whole, also when it was sent chunked
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").lower()
+        value = value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name not in ("content-length", "transfer-encoding"):
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    return environ
+
+
+class AsgiApp():
+    """
+    ASGI application serving a WSGI (Flask) application from an asyncio
+    event loop, so slow requests do not hold up the others.
+    Requests run on a pool of executor threads, the loop only moves
+    bytes. GET responses of cached_routes, the paths that only read the
+    state engine snapshot, are cached by the snapshot version, so
+    polling clients of unchanged state are answered from the loop
+    without a thread.
+    """
+    def __init__(
+        self,
+        wsgi_app,
+        state_engine,
+        cached_routes=(),
+        workers=ASGI_WORKERS
+    ):
+        self.wsgi_app = wsgi_app
+        self.state_engine = state_engine
+        self.cached_routes = set(cached_routes)
+        self.executor = ThreadPoolExecutor(workers)
+        # (version, path, query, vary headers) -> (status, headers, body)
+        self.responses = BoundedCache(ASGI_RESPONSE_CACHE_SIZE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def cache_key(self, scope):
+        """
+        Return the response cache key of a request, or None if the
+        response can not be cached.
+        """
+        if scope["method"] != "GET" or scope["path"] not in self.cached_routes:
+            return None
+
+        headers = dict(scope["headers"])
+        return (
+            self.state_engine.snapshot().version,
+            scope["path"],
+            scope["query_string"],
+            tuple(headers.get(name) for name in VARY_HEADERS)
+        )
+
+    async def http(self, scope, receive, send):
+        key = self.cache_key(scope)
+        cached = self.responses.get(key) if key is not None else None
+        if cached is not None:
+            status, headers, body = cached
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        loop = asyncio.get_running_loop()
+        status, headers, chunks = await loop.run_in_executor(
+            self.executor, self.run_wsgi, wsgi_environ(scope, body)
+        )
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+
+        cached_body = b""
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, self.read_chunk, chunks)
+                if not chunk:
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if cached_body is not None:
+                    cached_body += chunk
+                    if len(cached_body) > ASGI_CACHE_BODY_SIZE:
+                        cached_body = None
+        finally:
+            if hasattr(chunks, "close"):
+                await loop.run_in_executor(self.executor, chunks.close)
+        await send({"type": "http.response.body", "body": b""})
+
+        if key is not None and cached_body is not None and status in (200, 304):
+            self.responses[key] = (status, headers, cached_body)
+
+    def run_wsgi(self, environ):
+        """
+        Run the WSGI application on an executor thread, return the status,
+        the headers and the iterator of the body chunks.
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+
+        chunks = self.wsgi_app(environ, start_response)
+        iterator = iter(chunks)
+        # Start the body so start_response runs for lazy responses
+        first = next(iterator, b"")
+
+        return response["status"], response["headers"], WsgiBody(first, iterator, chunks)
+
+    @staticmethod
+    def read_chunk(chunks):
+        """
+        Read body chunks up to ASGI_CHUNK_SIZE bytes, b"" at the end.
+        """
+        data = b""
+        while len(data) < ASGI_CHUNK_SIZE:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            data += chunk
+
+        return data
+
+
+class WsgiBody():
+    """
+    Iterator of a WSGI response body, its first chunk already read.
+    """
+    def __init__(self, first, iterator, response):
+        self.first = first
+        self.iterator = iterator
+        self.response = response
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.first is not None:
+            first, self.first = self.first, None
+            return first
+        return next(self.iterator)
+
+    def close(self):
+        if hasattr(self.response, "close"):
+            self.response.close()
+
+
+def run_asgi(wsgi_app, state_engine, port, cached_routes=()):
+    """
+    Serve the application with uvicorn, an optional dependency.
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise Exception("The asgi server needs uvicorn: pip install uvicorn")
+
+    uvicorn.run(
+        AsgiApp(wsgi_app, state_engine, cached_routes),
+        port=port,
+        log_level="warning"
+    )
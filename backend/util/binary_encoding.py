@@ -0,0 +1,411 @@
+import functools
+import re
+import struct
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from backend.config import MINING_REWARD_INPUT
+
+# Compact binary encoding of the json form of blocks and transactions.
+# Every value starts with a tag byte. Hex hashes are stored as 32 raw
+# bytes, PEM public keys as 33 byte compressed points, signatures as two
+# 32 byte integers and numbers as varints. Anything without a compact
+# form falls back to the generic tags, so decoding always gives back the
+# json form that was encoded.
+BINARY_MIMETYPE = "application/x-blockchain"
+FORMAT_VERSION = 1
+BLOCK_MAGIC = b"PBB"
+BLOCKS_MAGIC = b"PBC"
+TRANSACTION_MAGIC = b"PBT"
+
+BLOCK_FIELDS = [
+    "timestamp",
+    "last_hash",
+    "hash",
+    "data",
+    "difficulty",
+    "nonce",
+    "version",
+    "merkle_root"
+]
+TRANSACTION_FIELDS = ["id", "output", "input"]
+INPUT_FIELDS = ["timestamp", "amount", "address", "public_key", "signature"]
+
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STR = 5
+TAG_LIST = 6
+TAG_DICT = 7
+TAG_HASH = 8
+TAG_PUBLIC_KEY = 9
+TAG_TRANSACTION = 10
+TAG_BLOCK = 11
+
+INPUT_REWARD = 0
+INPUT_SIGNED = 1
+
+HEX_HASH_PATTERN = re.compile("[0-9a-f]{64}")
+SIGNATURE_INT_BYTES = 32
+
+
+def encode_varint(number, buffer):
+    """
+    Append an unsigned int as a LEB128 varint, 7 bits per byte.
+    """
+    while number > 0x7f:
+        buffer.append((number & 0x7f) | 0x80)
+        number >>= 7
+    buffer.append(number)
+
+
+def decode_varint(data, offset):
+    """
+    Return the unsigned int at offset and the offset after it.
+    """
+    number = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, offset
+        shift += 7
+
+
+@functools.lru_cache(maxsize=1024)
+def compress_public_key(public_key):
+    """
+    Return the 33 byte compressed point of a PEM public key, or None if the
+    PEM would not come back byte for byte from the point.
+    """
+    try:
+        key = serialization.load_pem_public_key(
+            public_key.encode("utf-8"),
+            default_backend()
+        )
+        point = key.public_bytes(
+            serialization.Encoding.X962,
+            serialization.PublicFormat.CompressedPoint
+        )
+    except (ValueError, TypeError):
+        return None
+
+    if decompress_public_key(point) != public_key:
+        return None
+
+    return point
+
+
+@functools.lru_cache(maxsize=1024)
+def decompress_public_key(point):
+    """
+    Return the PEM public key string of a compressed point.
+    """
+    key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256K1(), point)
+
+    return key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode("utf-8")
+
+
+def encode_value(value, buffer):
+    """
+    Append the tagged encoding of a json value.
+    """
+    if value is None:
+        buffer.append(TAG_NONE)
+    elif value is True:
+        buffer.append(TAG_TRUE)
+    elif value is False:
+        buffer.append(TAG_FALSE)
+    elif isinstance(value, int):
+        buffer.append(TAG_INT)
+        # zigzag so small negative numbers stay small
+        encode_varint(value * 2 if value >= 0 else -value * 2 - 1, buffer)
+    elif isinstance(value, float):
+        buffer.append(TAG_FLOAT)
+        buffer += struct.pack(">d", value)
+    elif isinstance(value, str):
+        encode_str(value, buffer)
+    elif isinstance(value, (list, tuple)):
+        buffer.append(TAG_LIST)
+        encode_varint(len(value), buffer)
+        for item in value:
+            if isinstance(item, dict) and encode_transaction_body(item, buffer):
+                continue
+            encode_value(item, buffer)
+    elif isinstance(value, dict):
+        buffer.append(TAG_DICT)
+        encode_varint(len(value), buffer)
+        for key, item in value.items():
+            encode_value(key, buffer)
+            encode_value(item, buffer)
+    else:
+        raise Exception(f"Cannot encode value of type {type(value).__name__}")
+
+
+def encode_str(value, buffer):
+    """
+    Append a string, hex hashes and public keys in their compact form.
+    """
+    if len(value) == 64 and HEX_HASH_PATTERN.fullmatch(value):
+        buffer.append(TAG_HASH)
+        buffer += bytes.fromhex(value)
+        return
+
+    if value.startswith("-----BEGIN PUBLIC KEY-----"):
+        point = compress_public_key(value)
+        if point:
+            buffer.append(TAG_PUBLIC_KEY)
+            buffer += point
+            return
+
+    encoded = value.encode("utf-8")
+    buffer.append(TAG_STR)
+    encode_varint(len(encoded), buffer)
+    buffer += encoded
+
+
+def is_signature(signature):
+    return (
+        isinstance(signature, (list, tuple)) and
+        len(signature) == 2 and
+        all(
+            type(number) == int and 0 <= number < 2 ** (8 * SIGNATURE_INT_BYTES)
+            for number in signature
+        )
+    )
+
+
+def encode_transaction_body(transaction, buffer):
+    """
+    Append a transaction in the compact layout if it has the shape of a
+    transaction, return False (and append nothing) otherwise.
+    """
+    if list(transaction) != TRANSACTION_FIELDS or \
+        not isinstance(transaction["output"], dict):
+        return False
+
+    input = transaction["input"]
+    if input == MINING_REWARD_INPUT:
+        input_type = INPUT_REWARD
+    elif isinstance(input, dict) and list(input) == INPUT_FIELDS and \
+        is_signature(input["signature"]):
+        input_type = INPUT_SIGNED
+    else:
+        return False
+
+    buffer.append(TAG_TRANSACTION)
+    encode_value(transaction["id"], buffer)
+    encode_varint(len(transaction["output"]), buffer)
+    for address, amount in transaction["output"].items():
+        encode_value(address, buffer)
+        encode_value(amount, buffer)
+
+    buffer.append(input_type)
+    if input_type == INPUT_SIGNED:
+        for field in INPUT_FIELDS[:-1]:
+            encode_value(input[field], buffer)
+        for number in input["signature"]:
+            buffer += number.to_bytes(SIGNATURE_INT_BYTES, "big")
+
+    return True
+
+
+def encode_block_body(block, buffer):
+    """
+    Append a block, in field order without keys when it has the usual
+    block fields.
+    """
+    if list(block) != BLOCK_FIELDS:
+        encode_value(block, buffer)
+        return
+
+    buffer.append(TAG_BLOCK)
+    for field in BLOCK_FIELDS:
+        encode_value(block[field], buffer)
+
+
+def decode_value(data, offset):
+    """
+    Return the value at offset and the offset after it.
+    """
+    tag = data[offset]
+    offset += 1
+
+    if tag == TAG_NONE:
+        return None, offset
+    if tag == TAG_FALSE:
+        return False, offset
+    if tag == TAG_TRUE:
+        return True, offset
+    if tag == TAG_INT:
+        number, offset = decode_varint(data, offset)
+        return (number >> 1) if not number & 1 else -((number + 1) >> 1), offset
+    if tag == TAG_FLOAT:
+        return struct.unpack_from(">d", data, offset)[0], offset + 8
+    if tag == TAG_STR:
+        length, offset = decode_varint(data, offset)
+        return bytes(data[offset:offset + length]).decode("utf-8"), offset + length
+    if tag == TAG_HASH:
+        return bytes(data[offset:offset + 32]).hex(), offset + 32
+    if tag == TAG_PUBLIC_KEY:
+        return decompress_public_key(bytes(data[offset:offset + 33])), offset + 33
+    if tag == TAG_LIST:
+        length, offset = decode_varint(data, offset)
+        items = []
+        for i in range(length):
+            item, offset = decode_value(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == TAG_DICT:
+        length, offset = decode_varint(data, offset)
+        items = {}
+        for i in range(length):
+            key, offset = decode_value(data, offset)
+            items[key], offset = decode_value(data, offset)
+        return items, offset
+    if tag == TAG_TRANSACTION:
+        return decode_transaction_body(data, offset)
+    if tag == TAG_BLOCK:
+        block = {}
+        for field in BLOCK_FIELDS:
+            block[field], offset = decode_value(data, offset)
+        return block, offset
+
+    raise Exception(f"Unknown binary tag {tag}")
+
+
+def decode_transaction_body(data, offset):
+    transaction_id, offset = decode_value(data, offset)
+    length, offset = decode_varint(data, offset)
+    output = {}
+    for i in range(length):
+        address, offset = decode_value(data, offset)
+        output[address], offset = decode_value(data, offset)
+
+    input_type = data[offset]
+    offset += 1
+    if input_type == INPUT_REWARD:
+        input = dict(MINING_REWARD_INPUT)
+    else:
+        input = {}
+        for field in INPUT_FIELDS[:-1]:
+            input[field], offset = decode_value(data, offset)
+        signature = []
+        for i in range(2):
+            signature.append(int.from_bytes(
+                data[offset:offset + SIGNATURE_INT_BYTES],
+                "big"
+            ))
+            offset += SIGNATURE_INT_BYTES
+        input["signature"] = signature
+
+    return {"id": transaction_id, "output": output, "input": input}, offset
+
+
+def check_header(data, magic):
+    if bytes(data[0:len(magic)]) != magic:
+        raise Exception("Not a binary encoded blockchain object")
+    if data[len(magic)] != FORMAT_VERSION:
+        raise Exception(f"Unsupported binary format version: {data[len(magic)]}")
+
+    return len(magic) + 1
+
+
+def encode_block(block_json):
+    """
+    Encode the json form of a block.
+    """
+    buffer = bytearray(BLOCK_MAGIC)
+    buffer.append(FORMAT_VERSION)
+    encode_block_body(block_json, buffer)
+
+    return bytes(buffer)
+
+
+def decode_block(data):
+    """
+    Decode a block back to its json form.
+    """
+    block_json, offset = decode_value(data, check_header(data, BLOCK_MAGIC))
+
+    return block_json
+
+
+def encode_blocks(blocks_json):
+    """
+    Encode a list of blocks in json form, each block is length prefixed.
+    """
+    return b"".join([
+        encode_blocks_header(len(blocks_json)),
+        *map(encode_blocks_item, blocks_json)
+    ])
+
+
+def encode_blocks_header(count):
+    """
+    Encode the start of a list of count blocks, to be followed by
+    count encode_blocks_item. Lets a list of blocks be streamed.
+    """
+    buffer = bytearray(BLOCKS_MAGIC)
+    buffer.append(FORMAT_VERSION)
+    encode_varint(count, buffer)
+
+    return bytes(buffer)
+
+
+def encode_blocks_item(block_json):
+    """
+    Encode one length prefixed block of a list of blocks.
+    """
+    block_buffer = bytearray()
+    encode_block_body(block_json, block_buffer)
+    buffer = bytearray()
+    encode_varint(len(block_buffer), buffer)
+
+    return bytes(buffer + block_buffer)
+
+
+def decode_blocks(data):
+    """
+    Decode a list of blocks back to their json form.
+    """
+    offset = check_header(data, BLOCKS_MAGIC)
+    length, offset = decode_varint(data, offset)
+    blocks_json = []
+    for i in range(length):
+        block_length, offset = decode_varint(data, offset)
+        block_json, offset = decode_value(data, offset)
+        blocks_json.append(block_json)
+
+    return blocks_json
+
+
+def encode_transaction(transaction_json):
+    """
+    Encode the json form of a transaction.
+    """
+    buffer = bytearray(TRANSACTION_MAGIC)
+    buffer.append(FORMAT_VERSION)
+    if not encode_transaction_body(transaction_json, buffer):
+        encode_value(transaction_json, buffer)
+
+    return bytes(buffer)
+
+
+def decode_transaction(data):
+    """
+    Decode a transaction back to its json form.
+    """
+    transaction_json, offset = decode_value(
+        data,
+        check_header(data, TRANSACTION_MAGIC)
+    )
+
+    return transaction_json
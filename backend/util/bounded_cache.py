@@ -0,0 +1,16 @@
+from collections import OrderedDict
+
+
+class BoundedCache(OrderedDict):
+    """
+    Mapping that keeps only its maxlen most recently set items.
+    """
+    def __init__(self, maxlen):
+        super().__init__()
+        self.maxlen = maxlen
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxlen:
+            self.popitem(last=False)
@@ -0,0 +1,105 @@
+import hashlib
+import json
+
+# Leaves and inner nodes are hashed with different prefixes so an inner
+# node can never be passed off as a leaf (second preimage attack).
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+
+def leaf_hash(item):
+    """
+    Return the sha-256 hash of a json serializable leaf item.
+    """
+    serialized_item = json.dumps(item, sort_keys=True, separators=(",", ":"))
+
+    return hashlib.sha256(LEAF_PREFIX + serialized_item.encode("utf-8")).hexdigest()
+
+
+def node_hash(left, right):
+    """
+    Return the sha-256 hash of two child hashes.
+    """
+    return hashlib.sha256(
+        NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)
+    ).hexdigest()
+
+
+def merkle_levels(leaf_hashes):
+    """
+    Build the tree bottom up, return a list of levels from leaves to root.
+    A node without a sibling is promoted unchanged to the next level.
+    """
+    levels = [list(leaf_hashes)]
+
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        next_level = [
+            node_hash(level[i], level[i + 1])
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        levels.append(next_level)
+
+    return levels
+
+
+def merkle_root(items):
+    """
+    Return the merkle root of a list of items.
+    """
+    if not items:
+        return EMPTY_ROOT
+
+    return merkle_levels([leaf_hash(item) for item in items])[-1][0]
+
+
+def merkle_proof(items, index):
+    """
+    Return the inclusion proof for the item at index.
+    The proof is a list of sibling hashes from the leaf level up, each with
+    the side the sibling is on. It has O(log n) entries.
+    """
+    if not 0 <= index < len(items):
+        raise Exception(f"No item at index {index}")
+
+    proof = []
+    for level in merkle_levels([leaf_hash(item) for item in items])[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({
+                "hash": level[sibling],
+                "position": "left" if sibling < index else "right"
+            })
+        index //= 2
+
+    return proof
+
+
+def verify_merkle_proof(item, proof, root):
+    """
+    Verify that the item is included in the tree with the given root.
+    """
+    hash = leaf_hash(item)
+
+    for step in proof:
+        if step["position"] == "left":
+            hash = node_hash(step["hash"], hash)
+        else:
+            hash = node_hash(hash, step["hash"])
+
+    return hash == root
+
+
+def main():
+    items = ["a", "b", "c", "d", "e"]
+    root = merkle_root(items)
+    proof = merkle_proof(items, 4)
+    print(f"root: {root}")
+    print(f"proof for 'e': {proof}")
+    print(f"verified: {verify_merkle_proof('e', proof, root)}")
+
+if __name__ == "__main__":
+    main()
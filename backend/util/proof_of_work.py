@@ -0,0 +1,50 @@
+import functools
+import math
+import re
+
+HASH_BITS = 256
+HEX_HASH_LENGTH = HASH_BITS // 4
+HEX_HASH_PATTERN = re.compile(f"[0-9a-f]{{{HEX_HASH_LENGTH}}}")
+# Precision of fractional difficulty steps
+FRACTION_BITS = 32
+
+
+@functools.lru_cache(maxsize=1024)
+def difficulty_to_target(difficulty):
+    """
+    Return the 256-bit target for a difficulty.
+    A hash meets the difficulty when its value is below the target. For a
+    whole difficulty d this means d leading zero bits, a fractional
+    difficulty scales the target by 2 ** -fraction in between.
+    """
+    whole = math.floor(difficulty)
+    fraction = difficulty - whole
+    scale = round(2 ** (FRACTION_BITS - fraction))
+
+    return (scale << (HASH_BITS - whole)) >> FRACTION_BITS
+
+
+def digest_meets_target(digest, target):
+    """
+    Compare the raw digest bytes of a hash against a target.
+    """
+    return int.from_bytes(digest, "big") < target
+
+
+def hash_meets_difficulty(hex_hash, difficulty):
+    """
+    Check a hex encoded hash against the difficulty.
+    Anything but a full length hex hash never meets it.
+    """
+    if not isinstance(hex_hash, str) or not HEX_HASH_PATTERN.fullmatch(hex_hash):
+        return False
+
+    return int(hex_hash, 16) < difficulty_to_target(difficulty)
+
+
+def main():
+    for difficulty in [1, 2, 2.5, 3, 8]:
+        print(f"difficulty {difficulty}: {difficulty_to_target(difficulty):064x}")
+
+if __name__ == "__main__":
+    main()
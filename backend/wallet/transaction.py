@@ -2,6 +2,7 @@ import uuid
 import time
 
 from backend.wallet.wallet import Wallet
+from backend.util.binary_encoding import decode_transaction, encode_transaction
 from backend.config import MINING_REWARD, MINING_REWARD_INPUT
 
 class Transaction():
@@ -84,6 +85,19 @@ class Transaction():
         """
         return self.__dict__
 
+    def to_bytes(self):
+        """
+        serialize the transaction into the compact binary format
+        """
+        return encode_transaction(self.to_json())
+
+    @staticmethod
+    def from_bytes(transaction_bytes):
+        """
+        Deserialize the binary format back into a Transaction instance.
+        """
+        return Transaction.from_json(decode_transaction(transaction_bytes))
+
     @staticmethod
     def from_json(transaction_json):
         """
@@ -1,21 +1,174 @@
+import heapq
+import json
+import time
+from collections import OrderedDict
+from backend.wallet.transaction import Transaction
+from backend.config import (
+    MINING_REWARD_INPUT,
+    TRANSACTION_POOL_EVICTION,
+    TRANSACTION_POOL_MAX_AGE,
+    TRANSACTION_POOL_MAX_BYTES,
+    TRANSACTION_POOL_MAX_COUNT
+)
+
+EVICT_OLDEST = "oldest"
+EVICT_LOWEST_AMOUNT = "lowest_amount"
+
+
 class TransactionPool():
-    def __init__(self):
-        self.transaction_map = {}
+    """
+    Transactions waiting to be mined, by id.
+    Indexed by sender address, and bounded: transactions older than
+    max_age expire, and when the pool holds more than max_count
+    transactions or max_bytes of json the eviction policy removes the
+    oldest transaction or the one sending the lowest amount.
+    Listeners are told about transactions set and removed, see
+    add_listener.
+    """
+    def __init__(
+        self,
+        max_count=TRANSACTION_POOL_MAX_COUNT,
+        max_bytes=TRANSACTION_POOL_MAX_BYTES,
+        max_age=TRANSACTION_POOL_MAX_AGE,
+        eviction=TRANSACTION_POOL_EVICTION
+    ):
+        if eviction not in (EVICT_OLDEST, EVICT_LOWEST_AMOUNT):
+            raise Exception(f"Unknown transaction pool eviction policy: {eviction}")
+
+        # Ordered by the time a transaction was last set
+        self.transaction_map = OrderedDict()
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.eviction = eviction
+        # sender address -> id of the newest pooled transaction it sent
+        self.sender_index = {}
+        # transaction id -> (time added, size in bytes, eviction key)
+        self.entries = {}
+        self.size = 0
+        # (eviction key, transaction id), stale items are skipped on pop
+        self.eviction_heap = []
+        self.eviction_counts = {"count": 0, "bytes": 0, "age": 0}
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """
+        Call listener(transaction, None) when a transaction is set in the
+        pool and listener(None, transaction_id) when one is removed.
+        """
+        self.listeners.append(listener)
+
+    def notify_listeners(self, transaction, removed_id):
+        for listener in self.listeners:
+            listener(transaction, removed_id)
 
     def set_transaction(self, transaction):
         """
         Set a transaction in the transaction pool.
+        Return False if the pool evicted it again to stay within its caps.
         """
+        now = time.time_ns()
+        # An updated transaction is set again as new, at the end of the
+        # map, so the map stays ordered by the time added
+        added = now
+        if transaction.id in self.entries:
+            self.remove_transaction(transaction.id)
+
+        size = len(json.dumps(transaction.to_json()))
+        if self.eviction == EVICT_OLDEST:
+            key = (added, transaction.id)
+        else:
+            key = (TransactionPool.amount_sent(transaction), added, transaction.id)
+
         self.transaction_map[transaction.id] = transaction
+        # The newest transaction of a sender stays indexed, an older one
+        # pooled again in a reorg does not replace it
+        address = transaction.input["address"]
+        indexed = self.transaction_map.get(self.sender_index.get(address))
+        if indexed is None or \
+            indexed.input["timestamp"] <= transaction.input["timestamp"]:
+            self.sender_index[address] = transaction.id
+        self.entries[transaction.id] = (added, size, key)
+        self.size += size
+        heapq.heappush(self.eviction_heap, key)
+
+        self.expire_transactions(now)
+        self.evict_transactions()
+
+        if transaction.id not in self.transaction_map:
+            return False
+
+        self.notify_listeners(transaction, None)
+        return True
+
+    def remove_transaction(self, transaction_id):
+        """
+        Remove a transaction from the pool and its indices, if pooled.
+        """
+        transaction = self.transaction_map.pop(transaction_id, None)
+        if transaction is None:
+            return None
+
+        added, size, key = self.entries.pop(transaction_id)
+        self.size -= size
+        address = transaction.input["address"]
+        if self.sender_index.get(address) == transaction_id:
+            del self.sender_index[address]
+        self.notify_listeners(None, transaction_id)
+
+        return transaction
+
+    def expire_transactions(self, now=None):
+        """
+        Remove the transactions that have been pooled longer than max_age.
+        """
+        now = time.time_ns() if now is None else now
+        while self.transaction_map:
+            transaction_id = next(iter(self.transaction_map))
+            if now - self.entries[transaction_id][0] <= self.max_age:
+                break
+            self.remove_transaction(transaction_id)
+            self.eviction_counts["age"] += 1
+
+    def evict_transactions(self):
+        """
+        Evict transactions by the eviction policy until the pool is within
+        max_count and max_bytes.
+        """
+        while len(self.transaction_map) > self.max_count or self.size > self.max_bytes:
+            reason = "count" if len(self.transaction_map) > self.max_count else "bytes"
+            key = heapq.heappop(self.eviction_heap)
+            transaction_id = key[-1]
+            entry = self.entries.get(transaction_id)
+            if entry is None or entry[2] != key:
+                continue
+            self.remove_transaction(transaction_id)
+            self.eviction_counts[reason] += 1
+
+        # Drop stale heap items once they outnumber the pooled transactions
+        if len(self.eviction_heap) > 2 * len(self.entries) + 16:
+            self.eviction_heap = [entry[2] for entry in self.entries.values()]
+            heapq.heapify(self.eviction_heap)
 
     def existing_transaction(self, address):
         """
         Find transaction generated by the addrees in transaction pool.
         """
-        for transaction in self.transaction_map.values():
-            if transaction.input["address"] == address:
-                return transaction
-            
+        transaction_id = self.sender_index.get(address)
+        if transaction_id is None:
+            return None
+
+        return self.transaction_map[transaction_id]
+
+    def stats(self):
+        """
+        Return the size of the pool and its eviction counters.
+        """
+        return {
+            "transactions": len(self.transaction_map),
+            "bytes": self.size,
+            "evictions": dict(self.eviction_counts)
+        }
 
     def transaction_data(self):
         """
@@ -31,22 +184,52 @@ class TransactionPool():
         
         return transaction_data
 
+    def apply_blocks(self, added, removed=()):
+        """
+        Update the pool for a change of the chain, in O(size of the blocks):
+          - transactions of added blocks are removed from the pool
+          - transactions of removed blocks (a reorg) are pooled again,
+            unless an added block records them. Mining rewards are not.
+        Fits Blockchain.add_listener.
+        """
+        added_ids = set()
+        for block in added:
+            if isinstance(block.data, list):
+                for transaction in block.data:
+                    added_ids.add(transaction["id"])
+                    self.remove_transaction(transaction["id"])
+
+        for block in removed:
+            if isinstance(block.data, list):
+                for transaction_json in block.data:
+                    if transaction_json["input"] != MINING_REWARD_INPUT and \
+                        transaction_json["id"] not in added_ids:
+                        self.set_transaction(Transaction.from_json(transaction_json))
+
     def clear_blockchain_transactions(self, blockchain):
         """
         Delete transactions already recorded on blockchain
+        Walks the whole chain, apply_blocks only looks at the blocks that
+        changed.
         """
         # Look in blockchain
         for block in blockchain.chain:
             for transaction in block.data:
                 # delete if in transactionpool
-                try:
-                    del self.transaction_map[transaction["id"]]
-                except KeyError:
-                    pass
+                self.remove_transaction(transaction["id"])
+
+    @staticmethod
+    def amount_sent(transaction):
+        """
+        Return the amount a transaction sends to other addresses.
+        """
+        return sum(
+            amount for address, amount in transaction.output.items()
+            if address != transaction.input["address"]
+        )
 
 # Experimental code
 def main():
-    from backend.wallet.transaction import Transaction
     from backend.wallet.wallet import Wallet
 
     tp = TransactionPool()
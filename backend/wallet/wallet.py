@@ -1,8 +1,9 @@
+import functools
 import json
 import uuid
 # UUID (Universally unique identifier). A version 4 UUID is randomly generated
 
-from backend.config import STRATING_BALANCE
+from backend.config import STRATING_BALANCE, PUBLIC_KEY_CACHE_SIZE
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.asymmetric.utils import (
@@ -72,14 +73,24 @@ class Wallet:
 
     
     @staticmethod
-    def verify(public_key, data, signature):
+    @functools.lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+    def load_public_key(public_key):
         """
-        Verify a signature based on the original public key and data.
+        Deserialize a PEM public key string.
+        A bounded LRU cache keeps the parsed keys of recently active
+        wallets, hits and misses are in Wallet.load_public_key.cache_info()
         """
-        deserialized_public_key = serialization.load_pem_public_key(
+        return serialization.load_pem_public_key(
             public_key.encode("utf-8"),
-            default_backend
+            default_backend()
         )
+
+    @staticmethod
+    def verify(public_key, data, signature):
+        """
+        Verify a signature based on the original public key and data.
+        """
+        deserialized_public_key = Wallet.load_public_key(public_key)
         # print(f"\n Signature--: {signature}")
         # function "sign" generate a decoded signature as a tuple (two long strings)
         (r, s) = signature
@@ -102,26 +113,14 @@ class Wallet:
         Claculate the balance for a wallet address on blockchain.
         The Balance is found by adding output values that belongs to
         the address since the most recent transaction by that address.
+        Looked up in the balance index the blockchain keeps up to date
+        as blocks are added (see Blockchain.apply_block_balances).
         """
-        balance = STRATING_BALANCE
-
         # If blockchain instance not passed to wallet class
         if not blockchain:
-            return balance
-
-        for block in blockchain.chain:
-            for transaction in block.data:
-                if transaction["input"]["address"] == address:
-                    # When address do a transaction (when address sends coins),
-                    # the balance resets and is shown in output
-                    balance = transaction["output"][address]
-                    
-                elif address in transaction["output"]:
-                    # If not as transaction input address but seen in output,
-                    # then add to balance (when address receive coins)
-                    balance += transaction["output"][address]
-
-        return balance
+            return STRATING_BALANCE
+
+        return blockchain.balances.get(address, STRATING_BALANCE)
 
 
 